@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Neuron model micro-benchmark
+
+Times the state update (eval) of each neuron model for populations whose
+parameters are either shared by all neurons, in which case the parameters and
+the constants derived from them are compiled into the kernel, or jittered
+per neuron, in which case they are read from per-neuron arrays.
+
+Each model is timed with its derived constants computed once at
+initialization and, for comparison, with the same constants recomputed at
+every integration step, as the models did before they declared them; the
+last column is the ratio of the two times.
+
+Notes
+-----
+Run with
+
+python neuron_benchmark.py -n 100000 -s 1000
+"""
+
+import argparse
+from collections import Counter
+
+import numpy as np
+
+import pycuda.autoinit
+import pycuda.driver as cuda
+import pycuda.gpuarray as garray
+
+from neurokernel.LPU.neurons import baseneuron
+from neurokernel.LPU.neurons.specneuron import SpecNeuron
+from neurokernel.LPU.utils.modelspec import ModelSpec
+from neurokernel.LPU.neurons.LeakyIAF import LeakyIAF
+from neurokernel.LPU.neurons.LeakyIAF_bias import LeakyIAF_bias
+from neurokernel.LPU.neurons.MorrisLecar import MorrisLecar
+from neurokernel.LPU.neurons.HH_PH import HH_PH
+
+dt = 1e-4
+
+# model class, spiking, parameters, initial states:
+models = [
+    (LeakyIAF, True,
+     {'Vr': -0.0675489770451, 'Vt': -0.0251355161007,
+      'R': 1.02445570216, 'C': 0.0669810502993},
+     {'V': -0.05}),
+    (LeakyIAF_bias, True,
+     {'Vr': -0.0675489770451, 'Vt': -0.0251355161007,
+      'R': 1.02445570216, 'C': 0.0669810502993, 'b': 0.1},
+     {'V': -0.05}),
+    (MorrisLecar, False,
+     {'V1': 0.03, 'V2': 0.015, 'V3': 0.0, 'V4': 0.03,
+      'phi': 0.025, 'offset': 0.0},
+     {'initV': -0.05214, 'initn': 0.02}),
+    (HH_PH, False,
+     {},
+     {'initV': -0.0819, 'init_sa': 0.2184, 'init_si': 0.9653,
+      'init_dra': 0.0117, 'init_dri': 0.9998})]
+
+def make_n_dict(N, params, states, jitter):
+    n_dict = {'id': range(N),
+              'num_dendrites_cond': Counter(),
+              'num_dendrites_I': Counter(),
+              'I_pre': [], 'cond_pre': [], 'reverse': []}
+    for k, v in params.iteritems():
+        n_dict[k] = v*(1+jitter*np.random.rand(N))
+    for k, v in states.iteritems():
+        n_dict[k] = v*np.ones(N)
+    return n_dict
+
+def recompute_class(cls):
+    """
+    Variant of model `cls` that recomputes its derived constants at every
+    integration step instead of reading them.
+    """
+
+    spec = cls.spec
+    recompute = ModelSpec(spec.name + '_recompute', spec.states, spec.params,
+                          spec.constants, [],
+                          spec.derived + spec.intermediates, spec.ode,
+                          spec.update, spec.spike, spec.reset, spec.output,
+                          spec.substep, spec.dt_scale)
+    return type(cls.__name__ + '_recompute', (SpecNeuron,),
+                {'spec': recompute})
+
+def benchmark(cls, spiking, n_dict, N, steps):
+    state = garray.zeros(N, np.int32 if spiking else np.double)
+    neuron = cls(n_dict, int(state.gpudata), dt)
+    if not neuron.update_I_override:
+        baseneuron.BaseNeuron.__init__(neuron, n_dict, int(state.gpudata),
+                                       dt, debug=False)
+    neuron.eval()
+    start = cuda.Event()
+    stop = cuda.Event()
+    start.record()
+    for i in xrange(steps):
+        neuron.eval()
+    stop.record()
+    stop.synchronize()
+    return start.time_till(stop)/steps
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--neurons', default=100000, type=int,
+                        help='Number of neurons per model [default: 100000]')
+    parser.add_argument('-s', '--steps', default=1000, type=int,
+                        help='Number of steps [default: 1000]')
+    args = parser.parse_args()
+
+    print '%-16s %-10s %14s %14s %8s' % ('model', 'params', 'derived (ms)',
+                                          'recompute (ms)', 'speedup')
+    for cls, spiking, params, states in models:
+        for label, jitter in [('shared', 0.0), ('per-neuron', 1e-3)]:
+            if jitter and not params:
+                continue
+            n_dict = make_n_dict(args.neurons, params, states, jitter)
+            t_derived = benchmark(cls, spiking, n_dict, args.neurons,
+                                  args.steps)
+            t_recompute = benchmark(recompute_class(cls), spiking, n_dict,
+                                    args.neurons, args.steps)
+            print '%-16s %-10s %14.5f %14.5f %8.2f' % \
+                (cls.__name__, label, t_derived, t_recompute,
+                 t_recompute/t_derived)
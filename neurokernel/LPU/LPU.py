@@ -7,6 +7,7 @@ Local Processing Unit (LPU) with plugin support for various neuron/synapse model
 import pdb
 import collections
 import numbers
+import os
 
 import pycuda.gpuarray as garray
 from pycuda.tools import dtype_to_ctype
@@ -15,15 +16,6 @@ from pycuda.compiler import SourceModule
 import pycuda.elementwise as elementwise
 
 import numpy as np
-import networkx as nx
-
-# Work around bug in networkx < 1.9 that causes networkx to choke on GEXF
-# files with boolean attributes that contain the strings 'True' or 'False'
-# (bug already observed in https://github.com/networkx/networkx/pull/971)
-nx.readwrite.gexf.GEXF.convert_bool['false'] = False
-nx.readwrite.gexf.GEXF.convert_bool['False'] = False
-nx.readwrite.gexf.GEXF.convert_bool['true'] = True
-nx.readwrite.gexf.GEXF.convert_bool['True'] = True
 
 from neurokernel.mixins import LoggerMixin
 from neurokernel.core_gpu import Module, CTRL_TAG, GPOT_TAG, SPIKE_TAG
@@ -33,12 +25,13 @@ from types import *
 from collections import Counter
 
 from utils.simpleio import *
+from utils.memory import STRUCTURE_ATTRS, device_nbytes, object_nbytes
+from utils.profiling import Profile, phase
 import utils.parray as parray
-from neurons import *
-from synapses import *
-
-PORT_IN_GPOT = 'port_in_gpot'
-PORT_IN_SPK = 'port_in_spk'
+from lpu_graph import PORT_IN_GPOT, PORT_IN_SPK, neuron_cmp, synapse_cmp
+import lpu_graph
+from neurons import baseneuron, get_model as get_neuron_model
+from synapses import get_model as get_synapse_model
 
 class LPU(Module):
     """
@@ -72,11 +65,63 @@ class LPU(Module):
         for debugging purposes. False by default.
     cuda_verbose : boolean
         If True, compile kernels with option '--ptxas-options=-v'.
+    checkpoint_file : str
+        If set, the state of the LPU is saved to this file with `checkpoint()`
+        every `checkpoint_interval` steps and at the end of the run.
+    checkpoint_interval : int
+        Number of steps between checkpoints; if None, the state is only
+        saved at the end of the run.
+    restore_file : str
+        If set, the state of the LPU is restored from this checkpoint with
+        `restore()` before the first step.
+    batch : int
+        Number of trials of the LPU to simulate together. The trials share
+        the connectivity, which is built once, and every kernel launch;
+        only the states and the model attributes are kept per trial, with
+        the values of the trials of each neuron or synapse adjacent in the
+        state arrays (see `neurokernel.LPU.lpu_graph.batch_dict`). Neuron
+        `i` (synapse `j`) of trial `b` has id `b*N+i` (`b*S+j`), where `N`
+        is the largest neuron id plus one and `S` the number of synapses,
+        whose ids must be 0, 1, ..., S-1; outputs are ordered by these ids,
+        so the output of each step can be reshaped to `(batch, -1)`. Input
+        ports drive the neurons of all trials and only the neurons of the
+        first trial are exposed as output ports. The input file may
+        provide input to the neurons of every trial, ordered by id, or to
+        those of a single trial, in which case it is used for all trials.
+    batch_params : dict of dict of array_like
+        Per-trial values of model attributes; `batch_params[model][attr]`
+        either has shape `(batch,)`, in which case all instances of the
+        model in trial `b` get value `batch_params[model][attr][b]`, or
+        shape `(batch, n)`, where `n` is the number of instances of the
+        model, in the order of `n_dict` or `s_dict`.
+    reductions : list of neurokernel.LPU.reductions.Reduction
+        Summaries of the neuron states updated on the GPU at every step,
+        e.g. spike counts (see `summaries()`), or recorders such as
+        `neurokernel.LPU.recording.TriggeredRecorder`.
+    summary_file : str
+        If set, the summaries are saved to this file with
+        `write_summaries()` every `summary_interval` steps and at the end of
+        the run.
+    summary_interval : int
+        Number of steps between writes of the summary file; if None, the
+        summaries are only saved at the end of the run.
+    profile : neurokernel.LPU.utils.profiling.Profile
+        Profile in which the phases of the construction and setup of the LPU
+        are recorded, e.g. one that also holds the phases of parsing its
+        specification; by default, a new profile is created.
+    seed : int
+        Seed of the noise currents of neurons that have the attribute
+        `noise` (see `neurokernel.LPU.neurons.specneuron.SpecNeuron`). The
+        noise of each neuron only depends on the seed, the neuron id and the
+        step, so that runs with the same seed are reproducible.
 
     Attributes
     ----------
     buffer : CircularArray
         Buffer containing past neuron states.
+    profile : neurokernel.LPU.utils.profiling.Profile
+        Wall time and peak host memory of the phases of `__init__()` and
+        `pre_run()`.
     synapse_state : pycuda.gpuarray.GPUArray
         Synapse states.
     gpot_buffer_file : h5py.File
@@ -87,247 +132,37 @@ class LPU(Module):
         saved at every step.
     """
 
-    @staticmethod
-    def graph_to_dicts(graph):
-        """
-        Convert graph of LPU neuron/synapse data to Python data structures.
-
-        Parameters
-        ----------
-        graph : networkx.MultiDiGraph
-            NetworkX graph containing LPU data.
-
-        Returns
-        -------
-        n_dict : dict of dict of list
-            Each key of `n_dict` is the name of a neuron model; the values
-            are dicts that map each attribute name to a list that contains the
-            attribute values for each neuron class.
-        s_dict : dict of dict of list
-            Each key of `s_dict` is the name of a synapse model; the values are
-            dicts that map each attribute name to a list that contains the
-            attribute values for each each neuron.
-
-        Example
-        -------
-        >>> n_dict = {'LeakyIAF': {'Vr': [0.5, 0.6], 'Vt': [0.3, 0.2]},
-                      'MorrisLecar': {'V1': [0.15, 0.16], 'Vt': [0.13, 0.27]}}
-
-        Notes
-        -----
-        All neurons must have the following attributes; any additional
-        attributes for a specific neuron model must be provided
-        for all neurons of that model type:
-
-        1. spiking - True if the neuron emits spikes, False if it emits graded
-           potentials.
-        2. model - model identifier string, e.g., 'LeakyIAF', 'MorrisLecar'
-        3. public - True if the neuron emits output exposed to other LPUS. If 
-           True, the neuron must also have an attribute called selector.
-        4. extern - True if the neuron can receive external input from a file.
-
-        All synapses must have the following attributes:
-
-        1. class - int indicating connection class of synapse; it may assume the
-           following values:
-
-           0. spike to spike synapse
-           1. spike to graded potential synapse
-           2. graded potential to spike synapse
-           3. graded potential to graded potential synapse
-        2. model - model identifier string, e.g., 'AlphaSynapse'
-        3. conductance - True if the synapse emits conductance values, False if
-           it emits current values.
-        4. reverse - If the `conductance` attribute is True, this attribute
-           should be set to the reverse potential.
-
-        TODO
-        ----
-        Input data should be validated.
-        """
-
-        n_dict = {}
-
-        # Cast node IDs to str in case they are ints so that the conditional
-        # below doesn't fail:
-        neurons = [x for x in graph.node.items() if 'synapse' not in str(x[0])]
-
-        # Sort neurons based on id (where the id is first converted to an
-        # integer). This is done so that consecutive neurons of the same type
-        # in the constructed LPU is the same in neurokernel
-        neurons.sort(cmp=neuron_cmp)
-        for id, neu in neurons:
-            model = neu['model']
-            # if an input_port, make sure selector is specified
-            if model == PORT_IN_GPOT or model == PORT_IN_SPK:
-                assert('selector' in neu.keys())
-                if model == PORT_IN_GPOT:
-                    neu['spiking'] = False
-                    neu['public'] = False
-                else:
-                    neu['spiking'] = True
-                    neu['public'] = False
-            # if an output_port, make sure selector is specified
-            if 'public' in neu.keys():
-                if neu['public']:
-                    assert('selector' in neu.keys())
-            else:
-                neu['public'] = False
-            if 'selector' not in neu.keys():
-                neu['selector'] = ''
-            # if the neuron model does not appear before, add it into n_dict
-            if model not in n_dict:
-                n_dict[model] = {k:[] for k in neu.keys() + ['id']}
-
-            # neurons of the same model should have the same attributes
-            assert(set(n_dict[model].keys()) == set(neu.keys() + ['id']))
-            # add neuron data into the subdictionary of n_dict
-            for key in neu.iterkeys():
-                n_dict[model][key].append( neu[key] )
-            n_dict[model]['id'].append( int(id) )
-        # remove duplicate model information
-        for val in n_dict.itervalues(): val.pop('model')
-        if not n_dict: n_dict = None
-
-        # parse synapse data
-        synapses = graph.edges(data=True)
-        s_dict = {}
-        synapses.sort(cmp=synapse_cmp)
-        for id, syn in enumerate(synapses):
-            # syn[0/1]: pre-/post-neu id; syn[2]: dict of synaptic data
-            model = syn[2]['model']
-            
-            if 'conductance' not in syn[2]: syn[2]['conductance'] = True
-            if 'reverse' not in syn[2] and 'reversal_pot' in syn[2]:
-                syn[2]['reverse'] = syn[2]['reversal_pot']
-                del syn[2]['reversal_pot']
-
-            
-            # Assign the synapse edge an ID if none exists (e.g., because the
-            # graph was never stored/read to/from GEXF):
-            if syn[2].has_key('id'):
-                syn[2]['id'] = int(syn[2]['id'])
-            else:
-                syn[2]['id'] = id
-
-            # If the synapse model has not appeared yet, add it to s_dict:
-            if model not in s_dict:
-                s_dict[model] = {k:[] for k in syn[2].keys() + ['pre', 'post']}
-
-            # Synapses of the same model must have the same attributes:
-            assert(set(s_dict[model].keys()) == set(syn[2].keys() + ['pre', 'post']))
-            # Add synaptic data to dictionaries within s_dict:
-            for key in syn[2].iterkeys():
-                s_dict[model][key].append(syn[2][key])
-            s_dict[model]['pre'].append(syn[0])
-            s_dict[model]['post'].append(syn[1])
-        for val in s_dict.itervalues():
-            val.pop('model')
-        if not s_dict:
-            s_dict = {}
-        return n_dict, s_dict
+    graph_to_dicts = staticmethod(lpu_graph.graph_to_dicts)
+    lpu_parser = staticmethod(lpu_graph.lpu_parser)
+    extract_in_gpot = staticmethod(lpu_graph.extract_in_gpot)
+    extract_in_spk = staticmethod(lpu_graph.extract_in_spk)
+    extract_out_gpot = staticmethod(lpu_graph.extract_out_gpot)
+    extract_out_spk = staticmethod(lpu_graph.extract_out_spk)
+    extract_in = staticmethod(lpu_graph.extract_in)
+    extract_out = staticmethod(lpu_graph.extract_out)
+    extract_all = staticmethod(lpu_graph.extract_all)
 
     @staticmethod
-    def lpu_parser(filename):
+    def estimate_memory(n_dict, s_dict, dt, dtype=np.float64,
+                        one_time_import=10, batch=1):
         """
-        GEXF LPU specification parser.
+        Estimate the device memory used by an LPU before it is created.
 
-        Extract LPU specification data from a GEXF file and store it in
-        Python data structures. All nodes in the GEXF file are assumed to
-        correspond to neuron model instances while all edges are assumed to
-        correspond to synapse model instances.
-
-        Parameters
-        ----------
-        filename : str
-            GEXF filename.
+        See `neurokernel.LPU.lpu_graph.estimate_memory`; the memory used by
+        the model instances is estimated by the `estimate_memory()` method
+        of the registered model classes.
 
         Returns
         -------
-        n_dict : dict of dict of list
-            Each key of `n_dict` is the name of a neuron model; the values
-            are dicts that map each attribute name to a list that contains the
-            attribute values for each neuron class.
-        s_dict : dict of dict of list
-            Each key of `s_dict` is the name of a synapse model; the values are
-            dicts that map each attribute name to a list that contains the
-            attribute values for each each neuron.        
-        """
-
-        graph = nx.read_gexf(filename)
-        return LPU.graph_to_dicts(graph)
-
-    @classmethod
-    def extract_in_gpot(cls, n_dict):
-        """
-        Return selectors of non-spiking input ports.
-        """
-
-        if PORT_IN_GPOT in n_dict:
-            return ','.join(filter(None, n_dict[PORT_IN_GPOT]['selector']))
-        else:
-            return ''
-
-    @classmethod
-    def extract_in_spk(cls, n_dict):
-        """
-        Return selectors of spiking input ports.
-        """
-
-        if PORT_IN_SPK in n_dict:
-            return ','.join(filter(None, n_dict[PORT_IN_SPK]['selector']))
-        else:
-            return ''
-
-    @classmethod
-    def extract_out_gpot(cls, n_dict):
-        """
-        Return selectors of non-spiking output neurons.
+        nbytes : dict
+            Number of bytes used by each component of the LPU, with the
+            same keys as `memory_usage()` except `'reductions'`.
         """
 
-        return ','.join(filter(None,
-                               [sel for _, n in n_dict.items() for sel, pub, spk in \
-                                zip(n['selector'], n['public'], n['spiking']) \
-                                if pub and not spk ]))
-
-    @classmethod
-    def extract_out_spk(cls, n_dict):
-        """
-        Return selectors of spiking output neurons.
-        """
-
-        return ','.join(filter(None,
-                               [sel for _, n in n_dict.items() for sel, pub, spk in \
-                                zip(n['selector'], n['public'], n['spiking']) \
-                                if pub and spk ]))
-
-    @classmethod
-    def extract_in(cls, n_dict):
-        """
-        Return selectors of all input ports.
-        """
+        return lpu_graph.estimate_memory(n_dict, s_dict, dt, dtype,
+                                         one_time_import, get_neuron_model,
+                                         get_synapse_model, batch)
 
-        return ','.join(filter(None,
-                               [cls.extract_in_spk(n_dict), cls.extract_in_gpot(n_dict)]))
-
-    @classmethod
-    def extract_out(cls, n_dict):
-        """
-        Return selectors of all output neurons.
-        """
-
-        return ','.join(filter(None,
-                               [cls.extract_out_spk(n_dict), cls.extract_out_gpot(n_dict)]))
-
-    @classmethod
-    def extract_all(cls, n_dict):
-        """
-        Return selectors for all input ports and output neurons.
-        """
-
-        return ','.join(filter(None,
-                               [cls.extract_in(n_dict), cls.extract_out(n_dict)]))
-        
     def order(self,ind):
         try:
             return self.order_dict[ind]
@@ -345,12 +180,39 @@ class LPU(Module):
             return self.gpot_order_dict[ind]
         except:
             return np.asarray([self.gpot_order_dict[i] for i in ind],np.int32)
+
+    def _batch_order(self):
+        """
+        Map the ids of the neurons of all trials of a batched LPU to their
+        positions in the state arrays.
+
+        Neuron `i` of trial `b` has id `b*N+i`, where `N` is `nid_max`; the
+        trials of each neuron are adjacent, so a neuron at position `p` of a
+        single trial is at position `p*batch+b` in trial `b`. The output
+        ports are those of the first trial.
+        """
+
+        B, N = self.batch, self.nid_max
+        trials = np.arange(B, dtype=np.int32)
+        for name in ['order_dict', 'gpot_order_dict', 'spike_order_dict']:
+            setattr(self, name, dict((b*N+i, p*B+b)
+                                     for i, p in getattr(self, name).iteritems()
+                                     for b in xrange(B)))
+        self.gpot_order_l = (self.gpot_order_l*B +
+                             trials[:, np.newaxis]).reshape(-1)
+        self.spike_order_l = (self.spike_order_l*B +
+                              trials[:, np.newaxis]).reshape(-1)
+        self.out_ports_ids_gpot = self.out_ports_ids_gpot*B
+        self.out_ports_ids_spk = self.out_ports_ids_spk*B
             
     def __init__(self, dt, n_dict, s_dict, input_file=None, output_file=None,
                  device=0, ctrl_tag=CTRL_TAG, gpot_tag=GPOT_TAG,
                  spike_tag=SPIKE_TAG, rank_to_id=None, routing_table=None,
                  id=None, debug=False, columns=['io', 'type', 'interface'],
-                 cuda_verbose=False, time_sync=False):
+                 cuda_verbose=False, time_sync=False, checkpoint_file=None,
+                 checkpoint_interval=None, restore_file=None, batch=1,
+                 batch_params=None, reductions=None, summary_file=None,
+                 summary_interval=None, profile=None, seed=0):
 
         LoggerMixin.__init__(self, 'mod {}'.format(id))
 
@@ -371,14 +233,28 @@ class LPU(Module):
         self.output = True if output_file else False
         self.input_file = input_file
         self.input_eof = False if input_file else True
-
-        # Load neurons and synapse classes:
-        self._load_neurons()
-        self._load_synapses()
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.restore_file = restore_file
+        self.reductions = list(reductions or [])
+        self.summary_file = summary_file
+        self.summary_interval = summary_interval
 
         # Set default one time import for reading from input files:
         self._one_time_import = 10
 
+        self.profile = Profile() if profile is None else profile
+        self.seed = seed
+
+        self.batch = batch
+        if batch > 1:
+            # The LPU reorders the synapses of each model; keep the ids in
+            # their original order to map per-instance trial values:
+            batch_ids = dict((t, list(d['id'])) for t, d in
+                             n_dict.items() + s_dict.items())
+
+        self.profile.mark('ordering')
+
         # Save neuron data in the form
         # [('Model0', {'attrib0': [..], 'attrib1': [..]}), ('Model1', ...)]
         self.n_list = n_dict.items()
@@ -401,6 +277,8 @@ class LPU(Module):
         n_is_pub = np.array(sum( [ n['public'] for _, n in self.n_list ], []))
         n_has_in = np.array(sum( [ n['extern'] for _, n in self.n_list ], []))
 
+        self.profile.mark('port selectors')
+
         # Get selectors and positions of input ports:
         try:
             sel_in_gpot = self.extract_in_gpot(n_dict)
@@ -442,6 +320,8 @@ class LPU(Module):
         self.sel_in_gpot = sel_in_gpot
         self.sel_out_gpot = sel_out_gpot
 
+        self.profile.mark('ordering')
+
         # TODO: Update the following comment
         # The following code creates a mapping for each neuron from its "id" to
         # its position on the gpu array. The gpu array is arranged as follows,
@@ -509,9 +389,14 @@ class LPU(Module):
         #in_ports_ids_spk = self.order(in_ports_ids_spk)
         self.out_ports_ids_gpot = self.gpot_order(self.out_ports_ids_gpot)
         self.out_ports_ids_spk = self.spike_order(self.out_ports_ids_spk)
-        gpot_delay_steps = 0
+        self.profile.mark('connectivity')
         spike_delay_steps = 0
 
+        # Largest delay (in steps) of the synapses driven by each graded
+        # potential neuron; neurons that drive no such synapse are marked
+        # with -1 and do not need to be buffered:
+        self.gpot_max_delay = -np.ones(self.total_num_gpot_neurons, np.int32)
+
         cond_pre = []
         cond_post = []
         I_pre = []
@@ -541,6 +426,20 @@ class LPU(Module):
             for k, v in s.items():
                 s[k] = np.asarray(v)[order]
 
+            # Longest delay (in steps) of the spike-triggered synapses; the
+            # spike history buffer must hold that many past steps:
+            if cls <= 1 and 'delay' in s and len(s['delay']) > 0:
+                spike_delay_steps = max(spike_delay_steps, int(
+                    np.round(np.max(s['delay'])*1e-3/self.dt)))
+
+            if cls >= 2:
+                if 'delay' in s:
+                    delay = np.round(s['delay']*1e-3/self.dt).astype(np.int32)
+                else:
+                    delay = np.zeros(len(s['pre']), np.int32)
+                np.maximum.at(self.gpot_max_delay,
+                              s['pre'].astype(np.int32), delay)
+
             # The same set of ODEs may be used to describe conductance-based and
             # non-conductance-based versions of a synapse model 
             # If the EPSC comes directly from one of the state variables,
@@ -554,24 +453,12 @@ class LPU(Module):
                  cond_pre.extend(range(count, count+len(idx)))
                  count += len(idx)
 
-                 # Set the delay to either the specified value or 0:
-                 if 'delay' in s:
-                     max_del = np.max( s['delay'][idx] )
-                     gpot_delay_steps = max_del if max_del > gpot_delay_steps \
-                                            else gpot_delay_steps
-
             idx = np.where(~s['conductance'])[0]
             if len(idx) > 0:
                  I_post.extend(s['post'][idx])
                  I_pre.extend(range(count, count+len(s['post'][idx])))
                  count += len(s['post'])
 
-                 # Set the delay to either the specified value or 0:
-                 if 'delay' in s:
-                     max_del = np.max( s['delay'][idx] )
-                     spike_delay_steps = max_del if max_del > spike_delay_steps \
-                                         else spike_delay_steps
-
         self.total_synapses = int(np.sum(num_synapses))
         I_post.extend(self.input_neuron_list)
         I_pre.extend(range(self.total_synapses, self.total_synapses + \
@@ -631,8 +518,9 @@ class LPU(Module):
                 n['I_post'] = I_post[idx] - self.idx_start_gpot[i]
                 n['I_pre'] = I_pre[idx]
 
-            n['num_dendrites_cond'] = Counter(n['cond_post'])
-            n['num_dendrites_I'] = Counter(n['I_post'])
+            with phase('counters'):
+                n['num_dendrites_cond'] = Counter(n['cond_post'])
+                n['num_dendrites_I'] = Counter(n['I_post'])
 
         if len(self.s_list) > 0:
             s_id = np.concatenate([s['id'] for _, s in self.s_list]).astype(np.int32)
@@ -665,12 +553,28 @@ class LPU(Module):
             s['I_post'] = I_post[idx+I_post_syn_offset] - self.nid_max
             s['I_pre'] = I_pre[idx+I_post_syn_offset]
 
-            s['num_dendrites_cond'] = Counter(s['cond_post'])
-            s['num_dendrites_I'] = Counter(s['I_post'])
-
-        self.gpot_delay_steps = int(round(gpot_delay_steps*1e-3/self.dt)) + 1
-        self.spike_delay_steps = int(round(spike_delay_steps*1e-3/self.dt)) + 1
-
+            with phase('counters'):
+                s['num_dendrites_cond'] = Counter(s['cond_post'])
+                s['num_dendrites_I'] = Counter(s['I_post'])
+
+        self.spike_delay_steps = spike_delay_steps + 1
+
+        if batch > 1:
+            self.profile.mark('batch')
+            self._batch_order()
+            params = batch_params or {}
+            self.n_list = [(t, n) if t in (PORT_IN_GPOT, PORT_IN_SPK) else
+                           (t, lpu_graph.batch_dict(n, batch, self.nid_max,
+                                                    params.get(t),
+                                                    batch_ids[t], t))
+                           for t, n in self.n_list]
+            self.s_list = [(t, lpu_graph.batch_dict(s, batch,
+                                                    self.total_synapses,
+                                                    params.get(t),
+                                                    batch_ids[t], t))
+                           for t, s in self.s_list]
+
+        self.profile.mark('port selectors')
         data_gpot = np.zeros(self.num_public_gpot + num_in_ports_gpot,
                              np.double)
         data_spike = np.zeros(self.num_public_spike + num_in_ports_spk,
@@ -691,15 +595,38 @@ class LPU(Module):
                                         dtype=np.int32)
         self.sel_out_spk_ids = np.array(self.pm['spike'].ports_to_inds(self.sel_out_spk),
                                         dtype=np.int32)
+        self.profile.end()
 
     def pre_run(self):
+        self.profile.mark('module setup')
         super(LPU, self).pre_run()
+        self.profile.mark('device allocation')
         self._initialize_gpu_ds()
         self._init_objects()
+        self.profile.mark('reductions')
+        for reduction in self.reductions:
+            reduction.setup(self)
+        # The memory usage is only reported; failing to compute it must not
+        # stop the simulation:
+        try:
+            self.log_info('device memory used: %i bytes' % \
+                          self.memory_usage()['total'])
+        except Exception as e:
+            self.log_info('could not determine device memory usage: %r' % e)
         self.first_step = True
+        self.steps_done = 0
+        if self.restore_file:
+            self.profile.mark('restore')
+            self.restore(self.restore_file)
+        self.profile.end()
+        self.log_info('startup profile:\n' + self.profile.report())
 
     def post_run(self):
         super(LPU, self).post_run()
+        if self.checkpoint_file:
+            self.checkpoint(self.checkpoint_file)
+        if self.summary_file:
+            self.write_summaries(self.summary_file)
         if self.output:
             if self.total_num_gpot_neurons > 0:
                 self.output_gpot_file.close()
@@ -721,6 +648,9 @@ class LPU(Module):
         for synapse in self.synapses:
             synapse.post_run()
 
+        for reduction in self.reductions:
+            reduction.post_run()
+
     def run_step(self):
         super(LPU, self).run_step()
 
@@ -748,8 +678,7 @@ class LPU(Module):
         if self.debug:
             if self.total_num_gpot_neurons > 0:
                 dataset_append(self.gpot_buffer_file['/array'],
-                               self.buffer.gpot_buffer.get()
-                               .reshape(1, self.gpot_delay_steps, -1))
+                               self.buffer.gpot_buffer.get().reshape(1, -1))
             #if self.total_synapses + len(self.input_neuron_list) > 0:
             if self.total_synapses + self.num_input > 0:
                 dataset_append(self.synapse_state_file['/array'],
@@ -757,10 +686,306 @@ class LPU(Module):
 
         self._extract_output()
 
+        for reduction in self.reductions:
+            reduction.update(self)
+
         # Save output data to disk:
         if self.output:
             self._write_output()
 
+        self.steps_done += 1
+        if self.checkpoint_file and self.checkpoint_interval and \
+           self.steps_done % self.checkpoint_interval == 0:
+            self.checkpoint(self.checkpoint_file)
+        if self.summary_file and self.summary_interval and \
+           self.steps_done % self.summary_interval == 0:
+            self.write_summaries(self.summary_file)
+
+    def memory_usage(self):
+        """
+        Return the device memory used by the arrays of the LPU.
+
+        The LPU must have been set up (i.e., `pre_run()` must have been
+        called). The sizes are those of the allocated arrays, so they can be
+        compared with the result of `estimate_memory()`.
+
+        Returns
+        -------
+        nbytes : dict
+            Number of bytes used by each component of the LPU, with the same
+            keys as `estimate_memory()` and the arrays of the reductions
+            (`'reductions'`).
+        """
+
+        nbytes = dict.fromkeys(['V', 'spike_state', 'synapse_state',
+                                'gpot_buffer', 'spike_buffer', 'connectivity',
+                                'I_ext', 'ports', 'reductions'], 0)
+        nbytes['V'] = device_nbytes(self.V)
+        nbytes['spike_state'] = device_nbytes(self.spike_state)
+        nbytes['synapse_state'] = device_nbytes(self.synapse_state)
+        if self.total_num_gpot_neurons > 0:
+            nbytes['gpot_buffer'] = self.buffer.gpot_nbytes
+        if self.total_num_spike_neurons > 0:
+            nbytes['spike_buffer'] = self.buffer.spike_nbytes
+        if self.input_file:
+            nbytes['I_ext'] = device_nbytes(self.I_ext)
+        nbytes['ports'] = device_nbytes(self.pm['gpot'].data) + \
+                          device_nbytes(self.pm['spike'].data) + \
+                          object_nbytes(self, ['out_ports_ids_gpot_g',
+                                               'sel_out_gpot_ids_g',
+                                               'out_ports_ids_spk_g',
+                                               'sel_out_spk_ids_g',
+                                               'inds_gpot', 'inds_spike'])
+
+        # Models that could not be instantiated are None:
+        models = {}
+        for obj in self.neurons + self.synapses:
+            if obj is None:
+                continue
+            usage = obj.memory_usage()
+            name = obj.__class__.__name__
+            models[name] = models.get(name, 0) + usage['model']
+            nbytes['connectivity'] += usage['connectivity']
+
+        # Reductions may hold references to the LPU's state arrays:
+        shared = [self.V, self.spike_state]
+        for reduction in self.reductions:
+            nbytes['reductions'] += sum(
+                device_nbytes(v) for v in vars(reduction).itervalues()
+                if not any(v is a for a in shared))
+
+        nbytes['total'] = sum(nbytes.itervalues()) + sum(models.itervalues())
+        nbytes['models'] = models
+        return nbytes
+
+    def set_params(self, model, attr, values, ids=None):
+        """
+        Change a parameter of the neurons or synapses of a model in place.
+
+        The parameter arrays of the live model instance are overwritten
+        between steps, so that parameters can be tuned interactively or
+        adapted in a closed loop without rebuilding the LPU. Constants
+        derived from the parameter are recomputed and kernels into which it
+        was compiled are rebuilt by the model (see `SpecNeuron.set_params`).
+        The LPU must have been set up (i.e., `pre_run()` must have been
+        called).
+
+        Parameters
+        ----------
+        model : str
+            Name of the neuron or synapse model, e.g. `'AlphaSynapse'`.
+        attr : str
+            Name of the parameter, e.g. `'gmax'`.
+        values : array_like or float
+            New values, either one per id in `ids` or a scalar.
+        ids : list of int
+            Ids of the neurons or synapses to change; defaults to all those
+            of the model, in which case `values` follows the order of the
+            model's entry in `n_list` or `s_list` (synapses are sorted by
+            postsynaptic neuron).
+        """
+
+        obj, index = self._model_object(model, attr)
+        inds = None
+        if ids is not None:
+            try:
+                inds = np.asarray([index[int(i)] for i in np.atleast_1d(ids)],
+                                  dtype=np.int32)
+            except KeyError as e:
+                raise KeyError('%s has no element with id %s' % \
+                               (model, e.args[0]))
+        obj.set_params({attr: values}, inds)
+
+    def get_params(self, model, attr):
+        """
+        Return a parameter of the neurons or synapses of a model.
+
+        Parameters
+        ----------
+        model : str
+            Name of the neuron or synapse model.
+        attr : str
+            Name of the parameter.
+
+        Returns
+        -------
+        values : numpy.ndarray
+            Values of the parameter, in the order taken by `set_params()`
+            when `ids` is not given.
+        """
+
+        obj, _ = self._model_object(model, attr)
+        return obj.get_params([attr])[attr]
+
+    def _model_object(self, model, attr):
+        try:
+            obj, index = self._model_index[model]
+        except KeyError:
+            raise KeyError('no instances of model %s in LPU' % model)
+        if attr in STRUCTURE_ATTRS:
+            raise ValueError('%s is not a parameter of %s' % (attr, model))
+        return obj, index
+
+    def summaries(self):
+        """
+        Return the summaries computed by the reductions of the LPU.
+
+        Returns
+        -------
+        summaries : dict of dict
+            Maps the name of each reduction to its summary, i.e. a dict of
+            arrays ordered by neuron id and scalars.
+        """
+
+        return dict((r.name, r.result()) for r in self.reductions)
+
+    def write_summaries(self, filename):
+        """
+        Save the summaries computed by the reductions to an HDF5 file.
+
+        Each summary is stored as a group named after its reduction; the
+        number of steps summarized is stored as the attribute `steps_done`.
+        As with `checkpoint()`, the file is written to a temporary name and
+        then moved into place.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the summary file.
+        """
+
+        tmp = filename + '.tmp'
+        f = h5py.File(tmp, 'w')
+        try:
+            write_tree(f, self.summaries())
+            f.attrs['steps_done'] = self.steps_done
+        finally:
+            f.close()
+        os.rename(tmp, filename)
+
+    def checkpoint(self, filename):
+        """
+        Save the state of the LPU to an HDF5 file.
+
+        The neuron, synapse and buffer states, the internal states of all
+        model instances and the position in the input file are saved, so that
+        a simulation can be resumed with `restore()` from the step that
+        follows. The file is written to a temporary name and then moved into
+        place, so an interrupted checkpoint does not destroy the previous one.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the checkpoint file.
+        """
+
+        tmp = filename + '.tmp'
+        f = h5py.File(tmp, 'w')
+        try:
+            write_tree(f, self._get_state())
+        finally:
+            f.close()
+        os.rename(tmp, filename)
+
+    def restore(self, filename):
+        """
+        Restore the state of the LPU from a file written by `checkpoint()`.
+
+        The LPU must have been set up (i.e., `pre_run()` must have been
+        called) with the same neurons, synapses, input file and time step as
+        the LPU that wrote the checkpoint; a `ValueError` is raised if the
+        models or the time step differ. Output files are not restored;
+        output written after restoring starts at the restored step.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the checkpoint file.
+        """
+
+        f = h5py.File(filename, 'r')
+        try:
+            state = read_tree(f)
+        finally:
+            f.close()
+        self._set_state(state)
+
+    def _get_state(self):
+        """
+        Return the state of the LPU as nested dicts of arrays and scalars.
+        """
+
+        state = {'dt': self.dt, 'first_step': self.first_step,
+                 'steps_done': self.steps_done,
+                 'synapse_state': self.synapse_state.get(),
+                 'buffer': self.buffer.get_state(),
+                 'neurons': {}, 'synapses': {}, 'reductions': {}}
+        if self.V is not None:
+            state['V'] = self.V.get()
+        if self.spike_state is not None:
+            state['spike_state'] = self.spike_state.get()
+        for name, objs in [('neurons', self.neurons),
+                           ('synapses', self.synapses)]:
+            for i, obj in enumerate(objs):
+                obj_state = obj.get_state()
+                obj_state['model'] = obj.__class__.__name__
+                state[name][str(i)] = obj_state
+        for reduction in self.reductions:
+            state['reductions'][reduction.name] = reduction.get_state()
+        if self.input_file:
+            state['input'] = {'file_pointer': self.file_pointer,
+                              'frame_count': self.frame_count,
+                              'frames_in_buffer': self.frames_in_buffer,
+                              'input_eof': self.input_eof,
+                              'I_ext': self.I_ext.get()}
+        return state
+
+    def _set_state(self, state):
+        """
+        Restore the state returned by `_get_state()`.
+        """
+
+        # The states, delay buffer positions and constants derived from the
+        # time step are only valid for the time step they were saved with:
+        if state['dt'] != self.dt:
+            raise ValueError('checkpoint time step %r does not match %r' % \
+                             (state['dt'], self.dt))
+        for name, objs in [('neurons', self.neurons),
+                           ('synapses', self.synapses)]:
+            if len(state[name]) != len(objs):
+                raise ValueError('checkpoint contains %i %s models, LPU has %i' % \
+                                 (len(state[name]), name, len(objs)))
+            for i, obj in enumerate(objs):
+                if state[name][str(i)]['model'] != obj.__class__.__name__:
+                    raise ValueError('checkpoint model %s does not match %s' % \
+                                     (state[name][str(i)]['model'],
+                                      obj.__class__.__name__))
+
+        self.first_step = bool(state['first_step'])
+        self.steps_done = state['steps_done']
+        self.synapse_state.set(state['synapse_state'])
+        if self.V is not None:
+            self.V.set(state['V'])
+        if self.spike_state is not None:
+            self.spike_state.set(state['spike_state'])
+        self.buffer.set_state(state['buffer'])
+        for name, objs in [('neurons', self.neurons),
+                           ('synapses', self.synapses)]:
+            for i, obj in enumerate(objs):
+                obj.set_state(state[name][str(i)])
+
+        # Checkpoints written without reductions leave them as they are:
+        for reduction in self.reductions:
+            if reduction.name in state.get('reductions', {}):
+                reduction.set_state(state['reductions'][reduction.name])
+        if self.input_file:
+            inp = state['input']
+            self.file_pointer = inp['file_pointer']
+            self.frame_count = inp['frame_count']
+            self.frames_in_buffer = inp['frames_in_buffer']
+            self.input_eof = bool(inp['input_eof'])
+            self.I_ext.set(inp['I_ext'])
+
     def _init_objects(self):
         self.neurons = [ self._instantiate_neuron(i, t, n)
                          for i, (t, n) in enumerate(self.n_list)
@@ -768,21 +993,46 @@ class LPU(Module):
         self.synapses = [ self._instantiate_synapse(i, t, n)
                          for i, (t, n) in enumerate(self.s_list)
                          if t!='pass']
+
+        # Position of each neuron and synapse in its model instance, for
+        # set_params():
+        self._model_index = {}
+        models = [(t, n) for t, n in self.n_list
+                  if t!=PORT_IN_GPOT and t!=PORT_IN_SPK] + \
+                 [(t, s) for t, s in self.s_list if t!='pass']
+        for (t, d), obj in zip(models, self.neurons + self.synapses):
+            if obj is not None:
+                self._model_index[t] = \
+                    (obj, dict((int(i), k) for k, i in enumerate(d['id'])))
+
+        self.profile.mark('delay buffers')
         self.buffer = CircularArray(self.total_num_gpot_neurons,
-                                    self.gpot_delay_steps, self.V,
+                                    self.gpot_max_delay, self.V,
                                     self.total_num_spike_neurons,
-                                    self.spike_delay_steps)
+                                    self.spike_delay_steps, self.spike_state,
+                                    self.batch)
+        if self.total_num_gpot_neurons > 0:
+            self.log_info('graded potential delay buffer: %i bytes '
+                          '(%i bytes saved over a max-delay buffer)' % \
+                          (self.buffer.gpot_nbytes,
+                           self.buffer.gpot_dense_nbytes-self.buffer.gpot_nbytes))
+        if self.total_num_spike_neurons > 0:
+            self.log_info('bit-packed spike delay buffer: %i bytes' % \
+                          self.buffer.spike_nbytes)
         if self.input_file:
+            self.profile.mark('input')
             self.input_h5file = h5py.File(self.input_file, 'r')
 
             self.file_pointer = 0
             self.I_ext = \
-                parray.to_gpu(self.input_h5file['/array'][self.file_pointer:
-                                                          self.file_pointer+self._one_time_import])
+                parray.to_gpu(self._read_input_frames(self.file_pointer,
+                                                      self.file_pointer+self._one_time_import))
             self.file_pointer += self._one_time_import
             self.frame_count = 0
             self.frames_in_buffer = self._one_time_import
 
+        if self.output or self.debug:
+            self.profile.mark('output files')
         if self.output:
             output_file = self.output_file.rsplit('.', 1)
             filename = output_file[0]
@@ -795,33 +1045,33 @@ class LPU(Module):
                 self.output_gpot_file = h5py.File(filename+'_gpot.'+ext, 'w')
                 self.output_gpot_file.create_dataset(
                     '/array',
-                    (0, self.total_num_gpot_neurons),
+                    (0, self.V.size),
                     dtype=np.float64,
-                    maxshape=(None, self.total_num_gpot_neurons))
+                    maxshape=(None, self.V.size))
             if self.total_num_spike_neurons > 0:
                 self.output_spike_file = h5py.File(filename+'_spike.'+ext, 'w')
                 self.output_spike_file.create_dataset(
                     '/array',
-                    (0, self.total_num_spike_neurons),
+                    (0, self.spike_state.size),
                     dtype=np.float64,
-                    maxshape=(None, self.total_num_spike_neurons))
+                    maxshape=(None, self.spike_state.size))
 
         if self.debug:
             if self.total_num_gpot_neurons > 0:
                 self.gpot_buffer_file = h5py.File(self.id + '_buffer.h5', 'w')
                 self.gpot_buffer_file.create_dataset(
                     '/array',
-                    (0, self.gpot_delay_steps, self.total_num_gpot_neurons),
+                    (0, self.buffer.gpot_buffer.size),
                     dtype=np.float64,
-                    maxshape=(None, self.gpot_delay_steps, self.total_num_gpot_neurons))
+                    maxshape=(None, self.buffer.gpot_buffer.size))
 
             if self.total_synapses + len(self.input_neuron_list) > 0:
                 self.synapse_state_file = h5py.File(self.id + '_synapses.h5', 'w')
                 self.synapse_state_file.create_dataset(
                     '/array',
-                    (0, self.total_synapses + len(self.input_neuron_list)),
+                    (0, self.synapse_state.size),
                     dtype=np.float64,
-                    maxshape=(None, self.total_synapses + len(self.input_neuron_list)))
+                    maxshape=(None, self.synapse_state.size))
 
     def _initialize_gpu_ds(self):
         """
@@ -830,21 +1080,26 @@ class LPU(Module):
 
         # The length of this array must include space for neurons that receive
         # input because they are treated as synapses that emit a current
-        # added to the postsynaptic neurons:
+        # added to the postsynaptic neurons. Each state array holds the
+        # states of all trials, those of each neuron or synapse being
+        # adjacent:
         self.synapse_state = garray.zeros(
-            max(int(self.total_synapses) + len(self.input_neuron_list), 1),
+            max((int(self.total_synapses) + len(self.input_neuron_list))* \
+                self.batch, 1),
             np.float64)
 
         if self.total_num_gpot_neurons>0:
             self.V = garray.zeros(
-                int(self.total_num_gpot_neurons),
+                int(self.total_num_gpot_neurons)*self.batch,
                 np.float64)
         else:
             self.V = None
 
         if self.total_num_spike_neurons > 0:
-            self.spike_state = garray.zeros(int(self.total_num_spike_neurons),
-                                            np.int32)
+            self.spike_state = garray.zeros(
+                int(self.total_num_spike_neurons)*self.batch, np.int32)
+        else:
+            self.spike_state = None
 
         self.block_extract = (256, 1, 1)
         #if len(self.out_ports_ids_gpot) > 0:
@@ -877,18 +1132,23 @@ class LPU(Module):
 
         if self.ports_in_gpot_mem_ind is not None:
             self.set_inds(self.pm['gpot'].data, self.V, self.inds_gpot,
-                          self.idx_start_gpot[self.ports_in_gpot_mem_ind])
+                          self.idx_start_gpot[self.ports_in_gpot_mem_ind],
+                          self.batch)
         if self.ports_in_spk_mem_ind is not None:
             #self.log_info('>>> '+str(get_by_inds(self.pm['spike'].data, self.inds_spike)))
             self.set_inds(self.pm['spike'].data, self.spike_state,
                           self.inds_spike,
-                          self.idx_start_spike[self.ports_in_spk_mem_ind])
+                          self.idx_start_spike[self.ports_in_spk_mem_ind],
+                          self.batch)
 
-    def set_inds(self, src, dest, inds, dest_shift=0):
+    def set_inds(self, src, dest, inds, dest_shift=0, batch=1):
+        # With several trials, the value of each port is copied to the
+        # states of its neuron in all trials, which are adjacent:
         assert isinstance(dest_shift, numbers.Integral)
         assert src.dtype == dest.dtype
         try:
-            func = self.set_inds.cache[(inds.dtype, src.dtype, dest_shift)]
+            func = self.set_inds.cache[(inds.dtype, src.dtype, dest_shift,
+                                        batch)]
         except KeyError:
             inds_ctype = dtype_to_ctype(inds.dtype)
             data_ctype = dtype_to_ctype(src.dtype)
@@ -896,9 +1156,11 @@ class LPU(Module):
                 .format(data_ctype=data_ctype,
                         inds_ctype=inds_ctype)
             func = elementwise.ElementwiseKernel(v,
-                                                 "dest[i+%i] = src[inds[i]]" % dest_shift)
-            self.set_inds.cache[(inds.dtype, src.dtype, dest_shift)] = func
-        func(dest, inds, src, range=slice(0, len(inds), 1) )
+                                                 "dest[i+%i] = src[inds[i/%i]]" % \
+                                                 (dest_shift*batch, batch))
+            self.set_inds.cache[(inds.dtype, src.dtype, dest_shift,
+                                 batch)] = func
+        func(dest, inds, src, range=slice(0, len(inds)*batch, 1) )
 
     set_inds.cache = {}
 
@@ -953,10 +1215,10 @@ class LPU(Module):
         if not self.input_eof or self.frame_count < self.frames_in_buffer:
             cuda.memcpy_dtod(
                 int(int(self.synapse_state.gpudata) +
-                self.total_synapses*self.synapse_state.dtype.itemsize),
+                self.total_synapses*self.batch*self.synapse_state.dtype.itemsize),
                 int(int(self.I_ext.gpudata) +
                 self.frame_count*self.I_ext.ld*self.I_ext.dtype.itemsize),
-                self.num_input*self.synapse_state.dtype.itemsize)
+                self.num_input*self.batch*self.synapse_state.dtype.itemsize)
             self.frame_count += 1
         else:
             self.log_info('Input end of file reached. '
@@ -967,10 +1229,10 @@ class LPU(Module):
         if self.frame_count >= self._one_time_import and not self.input_eof:
             input_ld = self.input_h5file['/array'].shape[0]
             if input_ld - self.file_pointer < self._one_time_import:
-                h_ext = self.input_h5file['/array'][self.file_pointer:input_ld]
+                h_ext = self._read_input_frames(self.file_pointer, input_ld)
             else:
-                h_ext = self.input_h5file['/array'][self.file_pointer:
-                    self.file_pointer+self._one_time_import]
+                h_ext = self._read_input_frames(self.file_pointer,
+                    self.file_pointer+self._one_time_import)
             if h_ext.shape[0] == self.I_ext.shape[0]:
                 self.I_ext.set(h_ext)
                 self.file_pointer += self._one_time_import
@@ -986,21 +1248,31 @@ class LPU(Module):
             if self.file_pointer == self.input_h5file['/array'].shape[0]:
                 self.input_eof = True
 
+    def _read_input_frames(self, start, stop):
+        """
+        Read frames `start` to `stop` of the input file and arrange the
+        input of a batched LPU like its state arrays, the inputs of the
+        trials of each neuron being adjacent; input given for a single trial
+        is repeated for every trial.
+        """
+
+        h_ext = self.input_h5file['/array'][start:stop]
+        if self.batch > 1:
+            if h_ext.shape[1] == self.num_input:
+                h_ext = np.repeat(h_ext, self.batch, axis=1)
+            else:
+                h_ext = h_ext.reshape(-1, self.batch, self.num_input). \
+                        transpose(0, 2, 1).reshape(-1, self.batch*self.num_input)
+        return h_ext
+
     def _update_buffer(self):
         """
         Update circular buffer of past neuron states.
         """
         if self.total_num_gpot_neurons>0:
-            cuda.memcpy_dtod(int(self.buffer.gpot_buffer.gpudata) +
-                self.buffer.gpot_current*self.buffer.gpot_buffer.ld*
-                self.buffer.gpot_buffer.dtype.itemsize,
-                self.V.gpudata, self.V.dtype.itemsize*self.total_num_gpot_neurons)
+            self.buffer.update_gpot()
         if self.total_num_spike_neurons>0:
-            cuda.memcpy_dtod(int(self.buffer.spike_buffer.gpudata) +
-                self.buffer.spike_current*self.buffer.spike_buffer.ld*
-                self.buffer.spike_buffer.dtype.itemsize,
-                self.spike_state.gpudata,
-                int(self.spike_state.dtype.itemsize*self.total_num_spike_neurons))
+            self.buffer.update_spike()
 
     def _extract_projection_gpot_func(self):
         """
@@ -1045,9 +1317,10 @@ class LPU(Module):
               }
         }
         """
-        mod = SourceModule(
-            template % {"type": dtype_to_ctype(state_var.dtype)},
-            options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule(
+                template % {"type": dtype_to_ctype(state_var.dtype)},
+                options=self.compile_options)
         func = mod.get_function("extract_projection")
         func.prepare('PPPPi')#[np.intp, np.intp, np.intp, np.intp, np.int32])
 
@@ -1067,33 +1340,42 @@ class LPU(Module):
             Dictionary of neuron parameters.
         """
 
+        self.profile.mark('parameter upload', t)
         try:
-            ind = self._neuron_names.index(t)
-        except:
-            try:
-                ind = int(t)
-            except:
-                self.log_info("Error instantiating neurons of model '%s'" % t)
-                return None
+            cls = get_neuron_model(t)
+        except KeyError:
+            self.log_info("Error instantiating neurons of model '%s'" % t)
+            return None
 
         if n['spiking'][0]:
-            neuron = self._neuron_classes[ind](
+            neuron = cls(
                 n, int(int(self.spike_state.gpudata) +
-                self.spike_state.dtype.itemsize*self.idx_start_spike[i]),
+                self.spike_state.dtype.itemsize*self.idx_start_spike[i]*self.batch),
                 self.dt, debug=self.debug, LPU_id=self.id,
                 cuda_verbose=bool(self.compile_options))
         else:
-            neuron = self._neuron_classes[ind](
+            neuron = cls(
                 n, int(self.V.gpudata) +
-                self.V.dtype.itemsize*self.idx_start_gpot[i],
+                self.V.dtype.itemsize*self.idx_start_gpot[i]*self.batch,
                 self.dt, debug=self.debug,
                 cuda_verbose=bool(self.compile_options))
 
+        # Models with noise currents draw them with the LPU's seed:
+        if hasattr(neuron, 'noise_seed'):
+            neuron.noise_seed = self.seed
+
         if not neuron.update_I_override:
+            # Conductance-based synapses need the membrane potentials;
+            # spiking neurons keep them in an array of their own:
+            V = getattr(neuron, 'V', None)
+            if n['spiking'][0] and V is not None:
+                V = int(V) if isinstance(V, numbers.Integral) else \
+                    int(V.gpudata)
+            else:
+                V = int(int(self.V.gpudata) +
+                        self.V.dtype.itemsize*self.idx_start_gpot[i]*self.batch)
             baseneuron.BaseNeuron.__init__(
-                neuron, n,
-                int(int(self.V.gpudata) +
-                self.V.dtype.itemsize*self.idx_start_gpot[i]),
+                neuron, n, V,
                 self.dt, debug=self.debug, LPU_id=self.id,
                 cuda_verbose=bool(self.compile_options))
 
@@ -1113,36 +1395,18 @@ class LPU(Module):
             Dictionary of synapse parameters.
         """
 
+        self.profile.mark('parameter upload', t)
         try:
-            ind = self._synapse_names.index(t)
-        except:
-            try:
-                ind = int(t)
-            except:
-                self.log_info("Error instantiating synapses of model '%s'" % t)
-                return None
+            cls = get_synapse_model(t)
+        except KeyError:
+            self.log_info("Error instantiating synapses of model '%s'" % t)
+            return None
 
-        return self._synapse_classes[ind](
+        return cls(
             s, int(int(self.synapse_state.gpudata) +
-            self.synapse_state.dtype.itemsize*self.idx_start_synapse[i]),
+            self.synapse_state.dtype.itemsize*self.idx_start_synapse[i]*self.batch),
             self.dt, debug=self.debug, cuda_verbose=bool(self.compile_options))
 
-    def _load_neurons(self):
-        """
-        Load all available neuron models.
-        """
-
-        self._neuron_classes = baseneuron.BaseNeuron.__subclasses__()
-        self._neuron_names = [cls.__name__ for cls in self._neuron_classes]
-
-    def _load_synapses(self):
-        """
-        Load all available synapse models.
-        """
-
-        self._synapse_classes = basesynapse.BaseSynapse.__subclasses__()
-        self._synapse_names = [cls.__name__ for cls in self._synapse_classes]
-
     @property
     def one_time_import(self):
         return self._one_time_import
@@ -1151,100 +1415,210 @@ class LPU(Module):
     def one_time_import(self, value):
         self._one_time_import = value
 
-def neuron_cmp(x, y):
-    try:
-        if int(x[0]) < int(y[0]):
-            return -1
-        elif int(x[0]) > int(y[0]):
-            return 1
-        else:
-            return 0
-    except:
-        if x[0] < y[0]:
-            return -1
-        elif x[0] > y[0]:
-            return 1
-        else:
-            return 0
- 
-def synapse_cmp(x, y):
-    """
-    post-synaptic cite might be another synapse, with convention 'synapse-id'.
-    """
-
-    # Cast x[1] and y[1] to str in case they are ints:
-    pre_x = 'synapse' in str(x[1])
-    pre_y = 'synapse' in str(y[1])
-    int_x = int(x[1]) if not pre_x else int(x[1][8:])
-    int_y = int(y[1]) if not pre_y else int(y[1][8:])
-    if pre_x and not pre_y:
-        return 1
-    elif not pre_x and pre_y:
-        return -1
-    else:
-        if int_x < int_y:
-            return -1
-        elif int_x > int_y:
-            return 1
-        else:
-            return 0
-
 class CircularArray(object):
     """
     Circular buffer to support synapses with delays.
 
+    Graded potential neuron states are only buffered for the neurons that
+    drive synapses with nonzero delays; each such neuron has its own ring
+    whose length is one more than the largest delay of the synapses it
+    drives. Synapses without delay read the neuron states directly.
+
+    The neurons of a batched LPU share their rings among trials: the states
+    of all trials at one step are adjacent, i.e. the state of trial `b` at
+    position `p` of the ring of neuron `n` is stored at
+    `(gpot_offset[n] + p)*batch + b`. Likewise, the spike of trial `b` of
+    spiking neuron `n` is packed into bit `n*batch + b`.
+
     Parameters
     ----------
     num_gpot_neurons : int
         Number of graded potential neurons to accomodate.
-    gpot_delay_steps : int
-        Number of steps into the past to buffer graded potential neuron states.
+    gpot_max_delay : numpy.ndarray of int
+        Largest delay (in steps) of the synapses driven by each graded
+        potential neuron; negative for neurons that drive no synapses.
+    rest : pycuda.gpuarray.GPUArray
+        Graded potential neuron states; their initial values are used to
+        fill the buffer.
     num_spike_neurons : int
         Number of spiking neurons to accomodate.
     spike_delay_steps : int
         Number of steps into the past to buffer spiking neuron values.
-    rest : pycuda.gpuarray.GPUArray
-        Initial graded potential neuron state values to buffer.
+    spike_state : pycuda.gpuarray.GPUArray
+        Spiking neuron states.
+    batch : int
+        Number of trials whose states are stored in `rest` and `spike_state`.
 
     Attributes
     ----------
     num_gpot_neurons, num_spike_neurons : int
         Numbers of neurons.
-    gpot_current, spike_current : int
-        Current graded potential or spiking neuron index in buffer.
-    gpot_buffer, spike_buffer : parray.PitchArray
-        Buffered neuron values.
+    batch : int
+        Number of trials.
+    gpot_current : int
+        Number of steps buffered so far; the state of graded potential
+        neuron `n` at this step is stored at position
+        `gpot_current % gpot_length[n]` of its ring.
+    spike_current : int
+        Current spiking neuron index in buffer.
+    gpot_state : pycuda.gpuarray.GPUArray
+        Graded potential neuron states (i.e., `rest`).
+    gpot_buffer : pycuda.gpuarray.GPUArray
+        Concatenated rings of the buffered graded potential neurons, the
+        states of all trials being adjacent.
+    gpot_offset, gpot_length : pycuda.gpuarray.GPUArray
+        Position of the ring of each graded potential neuron in
+        `gpot_buffer` and its length; the length is 0 for neurons that are
+        not buffered.
+    gpot_nbytes, gpot_dense_nbytes : int
+        Device memory used by the graded potential buffer and memory that a
+        buffer holding the largest delay for every neuron would use.
+    spike_state : pycuda.gpuarray.GPUArray
+        Spiking neuron states (i.e., `spike_state`).
+    spike_buffer : parray.PitchArray
+        Buffered spiking neuron values, packed 32 neurons per word; bit
+        `n % 32` of word `n / 32` of a row is set if neuron `n` spiked
+        (`n*batch + b` for trial `b` of a batched LPU).
+    spike_nbytes : int
+        Device memory used by the spike buffer.
 
     Methods
     -------
+    update_gpot()
+        Store the current graded potential neuron states in the buffer.
+    update_spike()
+        Pack the current spiking neuron states into the buffer.
+    get_spikes(delay)
+        Unpack the spiking neuron states `delay` steps in the past.
     step()
         Advance indices of current graded potential and spiking neuron values.
+    get_state(), set_state(state)
+        Save or restore the buffer contents and indices.
     """
 
-    def __init__(self, num_gpot_neurons,  gpot_delay_steps,
-                 rest, num_spike_neurons, spike_delay_steps):
+    def __init__(self, num_gpot_neurons, gpot_max_delay,
+                 rest, num_spike_neurons, spike_delay_steps, spike_state=None,
+                 batch=1):
 
+        self.batch = batch
         self.num_gpot_neurons = num_gpot_neurons
         if num_gpot_neurons > 0:
             self.dtype = np.double
-            self.gpot_delay_steps = gpot_delay_steps
-            self.gpot_buffer = parray.empty(
-                (gpot_delay_steps, num_gpot_neurons), np.double)
-
+            self.gpot_state = rest
+
+            # Neurons whose synapses all lack delays need not be buffered:
+            length = np.where(gpot_max_delay > 0, gpot_max_delay+1,
+                              0).astype(np.int32)
+            offset = np.concatenate(([0], np.cumsum(length)[:-1])).astype(np.int32)
+            buffered = np.where(length > 0)[0].astype(np.int32)
+            self.gpot_length = garray.to_gpu(length)
+            self.gpot_offset = garray.to_gpu(offset)
+            self.gpot_buffered = garray.to_gpu(buffered)
+            self.gpot_num_buffered = len(buffered)
+
+            # Fill each ring with the initial state of its neuron:
+            self.gpot_buffer = garray.to_gpu(
+                np.repeat(rest.get().reshape(-1, batch)[buffered],
+                          length[buffered], axis=0).ravel() \
+                if len(buffered) else np.zeros(1, self.dtype))
             self.gpot_current = 0
 
-            for i in range(gpot_delay_steps):
-                cuda.memcpy_dtod(
-                    int(self.gpot_buffer.gpudata) +
-                    self.gpot_buffer.ld * i * self.gpot_buffer.dtype.itemsize,
-                    rest.gpudata, rest.dtype.itemsize*num_gpot_neurons)
+            self.gpot_nbytes = self.gpot_buffer.nbytes + \
+                               self.gpot_length.nbytes + \
+                               self.gpot_offset.nbytes + \
+                               self.gpot_buffered.nbytes
+            self.gpot_dense_nbytes = (max(gpot_max_delay.max(), 0)+1)* \
+                                     num_gpot_neurons*batch* \
+                                     np.dtype(self.dtype).itemsize
+            if self.gpot_num_buffered > 0:
+                self._update_gpot = self._get_update_gpot_func()
 
         self.num_spike_neurons = num_spike_neurons
         if num_spike_neurons > 0:
+            self.spike_state = spike_state
             self.spike_delay_steps = spike_delay_steps
+            self.spike_words = (num_spike_neurons*batch-1) // 32 + 1
             self.spike_buffer = parray.zeros(
-                (spike_delay_steps, num_spike_neurons), np.int32)
+                (spike_delay_steps, self.spike_words), np.uint32)
             self.spike_current = 0
+            self.spike_nbytes = self.spike_buffer.ld*spike_delay_steps* \
+                                self.spike_buffer.dtype.itemsize
+            self._pack_spike = self._get_pack_spike_func()
+
+    def update_gpot(self, st=None):
+        """
+        Store the current graded potential neuron states in the buffer.
+        """
+
+        if self.gpot_num_buffered > 0:
+            self._update_gpot.prepared_async_call(
+                self._grid_update_gpot, self._block_update_gpot, st,
+                self.gpot_buffer.gpudata, self.gpot_offset.gpudata,
+                self.gpot_length.gpudata, self.gpot_buffered.gpudata,
+                self.gpot_num_buffered, self.batch, self.gpot_current,
+                self.gpot_state.gpudata)
+
+    def update_spike(self, st=None):
+        """
+        Pack the current spiking neuron states into the buffer.
+        """
+
+        self._pack_spike.prepared_async_call(
+            self._grid_pack_spike, self._block_pack_spike, st,
+            self.spike_state.gpudata,
+            int(self.spike_buffer.gpudata) + self.spike_current* \
+            self.spike_buffer.ld*self.spike_buffer.dtype.itemsize,
+            self.num_spike_neurons*self.batch)
+
+    def get_spikes(self, delay=0):
+        """
+        Unpack the spiking neuron states `delay` steps in the past.
+
+        Parameters
+        ----------
+        delay : int
+            Number of steps into the past; must be less than
+            `spike_delay_steps`.
+
+        Returns
+        -------
+        spikes : numpy.ndarray of int32
+            Spike state of every spiking neuron, those of all trials of a
+            neuron being adjacent.
+        """
+
+        assert 0 <= delay < self.spike_delay_steps
+        row = (self.spike_current - delay) % self.spike_delay_steps
+        words = self.spike_buffer.get()[row, :self.spike_words]
+        bits = (words[:, np.newaxis] >> np.arange(32, dtype=np.uint32)) & 1
+        return bits.reshape(-1)[:self.num_spike_neurons*self.batch]. \
+            astype(np.int32)
+
+    def get_state(self):
+        """
+        Return the buffer contents and indices.
+        """
+
+        state = {}
+        if self.num_gpot_neurons > 0:
+            state['gpot_buffer'] = self.gpot_buffer.get()
+            state['gpot_current'] = self.gpot_current
+        if self.num_spike_neurons > 0:
+            state['spike_buffer'] = self.spike_buffer.get()
+            state['spike_current'] = self.spike_current
+        return state
+
+    def set_state(self, state):
+        """
+        Restore the buffer contents and indices returned by `get_state()`.
+        """
+
+        if self.num_gpot_neurons > 0:
+            self.gpot_buffer.set(state['gpot_buffer'])
+            self.gpot_current = state['gpot_current']
+        if self.num_spike_neurons > 0:
+            self.spike_buffer.set(state['spike_buffer'])
+            self.spike_current = state['spike_current']
 
     def step(self):
         """
@@ -1253,10 +1627,72 @@ class CircularArray(object):
 
         if self.num_gpot_neurons > 0:
             self.gpot_current += 1
-            if self.gpot_current >= self.gpot_delay_steps:
-                self.gpot_current = 0
 
         if self.num_spike_neurons > 0:
             self.spike_current += 1
             if self.spike_current >= self.spike_delay_steps:
                 self.spike_current = 0
+
+    def _get_update_gpot_func(self):
+        template = """
+        __global__ void update_gpot(%(type)s *buffer, int *offset, int *length,
+                                    int *buffered, int num, int batch,
+                                    long long current, %(type)s *V)
+        {
+            int tid = threadIdx.x + blockIdx.x * blockDim.x;
+            int total_threads = blockDim.x * gridDim.x;
+            int n, b;
+
+            for(int i = tid; i < num*batch; i += total_threads)
+            {
+                n = buffered[i / batch];
+                b = i %% batch;
+                buffer[(offset[n] + current %% length[n])*batch + b] =
+                    V[n*batch + b];
+            }
+        }
+        """
+        with phase('kernel compilation'):
+            mod = SourceModule(template % {"type": dtype_to_ctype(self.dtype)})
+        func = mod.get_function("update_gpot")
+        func.prepare('PPPPiiqP')
+        self._block_update_gpot = (256, 1, 1)
+        self._grid_update_gpot = (min(6 * cuda.Context.get_device().MULTIPROCESSOR_COUNT,
+                                      (self.gpot_num_buffered*self.batch-1) / 256 + 1), 1)
+        return func
+
+    def _get_pack_spike_func(self):
+        # Each thread reads the spike state of one neuron and the warp
+        # combines them into a word with a ballot, so that the spike states
+        # are read with coalesced loads. The loop runs over whole words so
+        # that all the lanes of a warp take part in every ballot:
+        template = """
+        #if __CUDACC_VER_MAJOR__ >= 9
+        #define BALLOT(p) __ballot_sync(0xffffffffu, p)
+        #else
+        #define BALLOT(p) __ballot(p)
+        #endif
+
+        __global__ void pack_spike(int *spike, unsigned int *packed, int num)
+        {
+            int tid = threadIdx.x + blockIdx.x * blockDim.x;
+            int total_threads = blockDim.x * gridDim.x;
+            int num_bits = ((num - 1) / 32 + 1) * 32;
+            unsigned int word;
+
+            for(int n = tid; n < num_bits; n += total_threads)
+            {
+                word = BALLOT(n < num && spike[n]);
+                if((n & 31) == 0)
+                    packed[n >> 5] = word;
+            }
+        }
+        """
+        with phase('kernel compilation'):
+            mod = SourceModule(template)
+        func = mod.get_function("pack_spike")
+        func.prepare('PPi')
+        self._block_pack_spike = (256, 1, 1)
+        self._grid_pack_spike = (min(6 * cuda.Context.get_device().MULTIPROCESSOR_COUNT,
+                                     (self.spike_words*32-1) / 256 + 1), 1)
+        return func
@@ -0,0 +1,526 @@
+"""
+Parsing and inspection of LPU specifications.
+
+These functions only depend on NumPy and NetworkX and can be used without a
+CUDA installation; they are also exposed as static methods of
+`neurokernel.LPU.LPU.LPU`.
+"""
+
+from collections import Counter
+
+import numpy as np
+import networkx as nx
+
+from neurokernel.LPU.utils.memory import STRUCTURE_ATTRS, pitched_nbytes
+from neurokernel.LPU.utils.profiling import phase
+
+# Work around bug in networkx < 1.9 that causes networkx to choke on GEXF
+# files with boolean attributes that contain the strings 'True' or 'False'
+# (bug already observed in https://github.com/networkx/networkx/pull/971)
+nx.readwrite.gexf.GEXF.convert_bool['false'] = False
+nx.readwrite.gexf.GEXF.convert_bool['False'] = False
+nx.readwrite.gexf.GEXF.convert_bool['true'] = True
+nx.readwrite.gexf.GEXF.convert_bool['True'] = True
+
+PORT_IN_GPOT = 'port_in_gpot'
+PORT_IN_SPK = 'port_in_spk'
+
+def graph_to_dicts(graph):
+    """
+    Convert graph of LPU neuron/synapse data to Python data structures.
+
+    Parameters
+    ----------
+    graph : networkx.MultiDiGraph
+        NetworkX graph containing LPU data.
+
+    Returns
+    -------
+    n_dict : dict of dict of list
+        Each key of `n_dict` is the name of a neuron model; the values
+        are dicts that map each attribute name to a list that contains the
+        attribute values for each neuron class.
+    s_dict : dict of dict of list
+        Each key of `s_dict` is the name of a synapse model; the values are
+        dicts that map each attribute name to a list that contains the
+        attribute values for each each neuron.
+
+    Example
+    -------
+    >>> n_dict = {'LeakyIAF': {'Vr': [0.5, 0.6], 'Vt': [0.3, 0.2]},
+                  'MorrisLecar': {'V1': [0.15, 0.16], 'Vt': [0.13, 0.27]}}
+
+    Notes
+    -----
+    All neurons must have the following attributes; any additional
+    attributes for a specific neuron model must be provided
+    for all neurons of that model type:
+
+    1. spiking - True if the neuron emits spikes, False if it emits graded
+       potentials.
+    2. model - model identifier string, e.g., 'LeakyIAF', 'MorrisLecar'
+    3. public - True if the neuron emits output exposed to other LPUS. If 
+       True, the neuron must also have an attribute called selector.
+    4. extern - True if the neuron can receive external input from a file.
+
+    All synapses must have the following attributes:
+
+    1. class - int indicating connection class of synapse; it may assume the
+       following values:
+
+       0. spike to spike synapse
+       1. spike to graded potential synapse
+       2. graded potential to spike synapse
+       3. graded potential to graded potential synapse
+    2. model - model identifier string, e.g., 'AlphaSynapse'
+    3. conductance - True if the synapse emits conductance values, False if
+       it emits current values.
+    4. reverse - If the `conductance` attribute is True, this attribute
+       should be set to the reverse potential.
+
+    TODO
+    ----
+    Input data should be validated.
+    """
+
+    n_dict = {}
+
+    # Cast node IDs to str in case they are ints so that the conditional
+    # below doesn't fail:
+    neurons = [x for x in graph.node.items() if 'synapse' not in str(x[0])]
+
+    # Sort neurons based on id (where the id is first converted to an
+    # integer). This is done so that consecutive neurons of the same type
+    # in the constructed LPU is the same in neurokernel
+    neurons.sort(cmp=neuron_cmp)
+    for id, neu in neurons:
+        model = neu['model']
+        # if an input_port, make sure selector is specified
+        if model == PORT_IN_GPOT or model == PORT_IN_SPK:
+            assert('selector' in neu.keys())
+            if model == PORT_IN_GPOT:
+                neu['spiking'] = False
+                neu['public'] = False
+            else:
+                neu['spiking'] = True
+                neu['public'] = False
+        # if an output_port, make sure selector is specified
+        if 'public' in neu.keys():
+            if neu['public']:
+                assert('selector' in neu.keys())
+        else:
+            neu['public'] = False
+        if 'selector' not in neu.keys():
+            neu['selector'] = ''
+        # if the neuron model does not appear before, add it into n_dict
+        if model not in n_dict:
+            n_dict[model] = {k:[] for k in neu.keys() + ['id']}
+
+        # neurons of the same model should have the same attributes
+        assert(set(n_dict[model].keys()) == set(neu.keys() + ['id']))
+        # add neuron data into the subdictionary of n_dict
+        for key in neu.iterkeys():
+            n_dict[model][key].append( neu[key] )
+        n_dict[model]['id'].append( int(id) )
+    # remove duplicate model information
+    for val in n_dict.itervalues(): val.pop('model')
+    if not n_dict: n_dict = None
+
+    # parse synapse data
+    synapses = graph.edges(data=True)
+    s_dict = {}
+    synapses.sort(cmp=synapse_cmp)
+    for id, syn in enumerate(synapses):
+        # syn[0/1]: pre-/post-neu id; syn[2]: dict of synaptic data
+        model = syn[2]['model']
+
+        if 'conductance' not in syn[2]: syn[2]['conductance'] = True
+        if 'reverse' not in syn[2] and 'reversal_pot' in syn[2]:
+            syn[2]['reverse'] = syn[2]['reversal_pot']
+            del syn[2]['reversal_pot']
+
+
+        # Assign the synapse edge an ID if none exists (e.g., because the
+        # graph was never stored/read to/from GEXF):
+        if syn[2].has_key('id'):
+            syn[2]['id'] = int(syn[2]['id'])
+        else:
+            syn[2]['id'] = id
+
+        # If the synapse model has not appeared yet, add it to s_dict:
+        if model not in s_dict:
+            s_dict[model] = {k:[] for k in syn[2].keys() + ['pre', 'post']}
+
+        # Synapses of the same model must have the same attributes:
+        assert(set(s_dict[model].keys()) == set(syn[2].keys() + ['pre', 'post']))
+        # Add synaptic data to dictionaries within s_dict:
+        for key in syn[2].iterkeys():
+            s_dict[model][key].append(syn[2][key])
+        s_dict[model]['pre'].append(syn[0])
+        s_dict[model]['post'].append(syn[1])
+    for val in s_dict.itervalues():
+        val.pop('model')
+    if not s_dict:
+        s_dict = {}
+    return n_dict, s_dict
+
+def lpu_parser(filename):
+    """
+    GEXF LPU specification parser.
+
+    Extract LPU specification data from a GEXF file and store it in
+    Python data structures. All nodes in the GEXF file are assumed to
+    correspond to neuron model instances while all edges are assumed to
+    correspond to synapse model instances.
+
+    Parameters
+    ----------
+    filename : str
+        GEXF filename.
+
+    Returns
+    -------
+    n_dict : dict of dict of list
+        Each key of `n_dict` is the name of a neuron model; the values
+        are dicts that map each attribute name to a list that contains the
+        attribute values for each neuron class.
+    s_dict : dict of dict of list
+        Each key of `s_dict` is the name of a synapse model; the values are
+        dicts that map each attribute name to a list that contains the
+        attribute values for each each neuron.        
+    """
+
+    with phase('parsing'):
+        graph = nx.read_gexf(filename)
+    with phase('graph_to_dicts'):
+        return graph_to_dicts(graph)
+
+def extract_in_gpot(n_dict):
+    """
+    Return selectors of non-spiking input ports.
+    """
+
+    if PORT_IN_GPOT in n_dict:
+        return ','.join(filter(None, n_dict[PORT_IN_GPOT]['selector']))
+    else:
+        return ''
+
+def extract_in_spk(n_dict):
+    """
+    Return selectors of spiking input ports.
+    """
+
+    if PORT_IN_SPK in n_dict:
+        return ','.join(filter(None, n_dict[PORT_IN_SPK]['selector']))
+    else:
+        return ''
+
+def extract_out_gpot(n_dict):
+    """
+    Return selectors of non-spiking output neurons.
+    """
+
+    return ','.join(filter(None,
+                           [sel for _, n in n_dict.items() for sel, pub, spk in \
+                            zip(n['selector'], n['public'], n['spiking']) \
+                            if pub and not spk ]))
+
+def extract_out_spk(n_dict):
+    """
+    Return selectors of spiking output neurons.
+    """
+
+    return ','.join(filter(None,
+                           [sel for _, n in n_dict.items() for sel, pub, spk in \
+                            zip(n['selector'], n['public'], n['spiking']) \
+                            if pub and spk ]))
+
+def extract_in(n_dict):
+    """
+    Return selectors of all input ports.
+    """
+
+    return ','.join(filter(None,
+                           [extract_in_spk(n_dict), extract_in_gpot(n_dict)]))
+
+def extract_out(n_dict):
+    """
+    Return selectors of all output neurons.
+    """
+
+    return ','.join(filter(None,
+                           [extract_out_spk(n_dict), extract_out_gpot(n_dict)]))
+
+def extract_all(n_dict):
+    """
+    Return selectors for all input ports and output neurons.
+    """
+
+    return ','.join(filter(None,
+                           [extract_in(n_dict), extract_out(n_dict)]))
+
+def neuron_cmp(x, y):
+    try:
+        if int(x[0]) < int(y[0]):
+            return -1
+        elif int(x[0]) > int(y[0]):
+            return 1
+        else:
+            return 0
+    except:
+        if x[0] < y[0]:
+            return -1
+        elif x[0] > y[0]:
+            return 1
+        else:
+            return 0
+ 
+def synapse_cmp(x, y):
+    """
+    post-synaptic cite might be another synapse, with convention 'synapse-id'.
+    """
+
+    # Cast x[1] and y[1] to str in case they are ints:
+    pre_x = 'synapse' in str(x[1])
+    pre_y = 'synapse' in str(y[1])
+    int_x = int(x[1]) if not pre_x else int(x[1][8:])
+    int_y = int(y[1]) if not pre_y else int(y[1][8:])
+    if pre_x and not pre_y:
+        return 1
+    elif not pre_x and pre_y:
+        return -1
+    else:
+        if int_x < int_y:
+            return -1
+        elif int_x > int_y:
+            return 1
+        else:
+            return 0
+
+def batch_dict(d, num, offset, params=None, ids=None, model=None):
+    """
+    Expand the data of the instances of a model to a batch of trials.
+
+    The trials of a batched LPU share one connectivity: the attributes in
+    `neurokernel.LPU.utils.memory.STRUCTURE_ATTRS`, such as the presynaptic
+    neurons and the delays of synapses, describe a single trial and are
+    left as they are, while the ids and the model attributes get one entry
+    per instance and trial. The entries of the trials of an instance are
+    adjacent, i.e. entry `k*num+b` belongs to instance `k` in trial `b`, as
+    do the states of the instances in the state arrays of the LPU.
+
+    Parameters
+    ----------
+    d : dict of list
+        Data of the instances of a model, e.g. a value of one of the dicts
+        returned by `graph_to_dicts`.
+    num : int
+        Number of trials.
+    offset : int
+        Offset between the ids of successive trials; instance `i` of trial
+        `b` gets id `b*offset+i`.
+    params : dict of array_like
+        Per-trial values of model attributes; `params[attr]` either has shape
+        `(num,)`, in which case all instances in trial `b` get value
+        `params[attr][b]`, or shape `(num, n)`, where `n` is the number of
+        instances in `d`.
+    ids : list of int
+        Ids of the instances in the order of the columns of the `(num, n)`
+        values in `params`; defaults to `d['id']`.
+    model : str
+        Name of the model, used in error messages.
+
+    Returns
+    -------
+    d : dict
+        Data of the batch; `d['batch']` holds `num`.
+    """
+
+    params = params or {}
+    count = len(d['id'])
+    if ids is not None:
+        index = dict((int(i), k) for k, i in enumerate(ids))
+        cols = [index[int(i)] for i in d['id']]
+    new = dict(d)
+    for attr, v in d.iteritems():
+        if attr in STRUCTURE_ATTRS:
+            continue
+        if attr in params:
+            v = np.asarray(params[attr])
+            if v.shape == (num,):
+                v = np.tile(v, count)
+            elif v.shape == (num, count):
+                v = (v if ids is None else v[:, cols]).T.reshape(-1)
+            else:
+                raise ValueError('values of %s.%s have shape %s, expected '
+                                 '(%i,) or (%i, %i)' % \
+                                 (model, attr, v.shape, num, num, count))
+            new[attr] = v
+        else:
+            new[attr] = np.repeat(np.asarray(v), num)
+    for attr in params:
+        if attr not in d or attr in STRUCTURE_ATTRS:
+            raise ValueError('%s is not an attribute of the instances of %s '
+                             'that can vary between trials' % (attr, model))
+    new['id'] = (np.asarray(d['id'], np.int64)[:, np.newaxis] +
+                 offset*np.arange(num)).reshape(-1)
+    new['batch'] = num
+    return new
+
+def estimate_memory(n_dict, s_dict, dt, dtype=np.float64, one_time_import=10,
+                    neuron_model=None, synapse_model=None, batch=1):
+    """
+    Estimate the device memory used by an LPU before it is created.
+
+    The sizes of the arrays allocated by `LPU.pre_run` are computed from the
+    neuron and synapse data alone, without allocating device memory or
+    compiling any kernel.
+
+    Parameters
+    ----------
+    n_dict, s_dict : dict of dict of list
+        Neuron and synapse data as returned by `graph_to_dicts`.
+    dt : float
+        Time step (s).
+    dtype : numpy.dtype
+        Type of the floating point arrays.
+    one_time_import : int
+        Number of input frames buffered on the device (see
+        `LPU.one_time_import`).
+    neuron_model, synapse_model : callable
+        Return the class of the neuron or synapse model with a given name;
+        the memory used by the model instances is estimated by the
+        `estimate_memory()` method of their class. If not set, model
+        instances are not included.
+    batch : int
+        Number of trials simulated together (see the `batch` parameter of
+        `LPU`); the connectivity is shared by the trials and everything else
+        grows with their number.
+
+    Returns
+    -------
+    nbytes : dict
+        Number of bytes used by the membrane potentials (`'V'`), spike
+        states (`'spike_state'`) and synapse states (`'synapse_state'`),
+        the graded potential and spike delay buffers (`'gpot_buffer'`,
+        `'spike_buffer'`), the index arrays that route synaptic inputs to
+        their targets (`'connectivity'`), the buffered input frames
+        (`'I_ext'`) and the port data arrays and indices (`'ports'`), the
+        parameters and states of each model (`'models'`, a dict mapping
+        model names to numbers of bytes) and their sum (`'total'`).
+
+    Notes
+    -----
+    Input frames are assumed to be read from a file if any neuron receives
+    external input. The pitch of 2D buffers is chosen by the driver and is
+    assumed to be a multiple of 512 bytes. Models that override
+    `update_I` may allocate fewer index arrays than counted here.
+    """
+
+    itemsize = np.dtype(dtype).itemsize
+
+    # Positions of the neurons in the graded potential and spike state
+    # arrays, assigned in the same order as by LPU.__init__:
+    gpot_pos = {}
+    spike_pos = {}
+    num_input = 0
+    num_public_gpot = num_public_spike = 0
+    for model, n in n_dict.iteritems():
+        for nid, spk, pub, ext in zip(n['id'], n['spiking'], n['public'],
+                                      n['extern']):
+            pos = spike_pos if spk else gpot_pos
+            pos[int(nid)] = len(pos)
+            num_input += bool(ext)
+            if pub and spk:
+                num_public_spike += 1
+            elif pub:
+                num_public_gpot += 1
+    num_gpot = len(gpot_pos)
+    num_spike = len(spike_pos)
+    num_in_gpot = len(n_dict[PORT_IN_GPOT]['id']) \
+                  if PORT_IN_GPOT in n_dict else 0
+    num_in_spk = len(n_dict[PORT_IN_SPK]['id']) \
+                 if PORT_IN_SPK in n_dict else 0
+
+    nbytes = dict.fromkeys(['V', 'spike_state', 'synapse_state',
+                            'gpot_buffer', 'spike_buffer', 'connectivity',
+                            'I_ext', 'ports'], 0)
+    models = {}
+
+    total_synapses = 0
+    spike_delay_steps = 0
+    gpot_max_delay = -np.ones(num_gpot, np.int32)
+    cond_post = Counter()
+    I_post = Counter()
+    for model, s in s_dict.iteritems():
+        num = len(s['id'])
+        total_synapses += num
+        if num == 0:
+            continue
+        cls = s['class'][0]
+        pos = spike_pos if cls <= 1 else gpot_pos
+        pre = np.asarray([pos[int(nid)] for nid in s['pre']], np.int32)
+        if 'delay' in s:
+            delay = np.round(np.asarray(s['delay'])*1e-3/dt).astype(np.int32)
+        else:
+            delay = np.zeros(num, np.int32)
+        if cls <= 1:
+            if 'delay' in s:
+                spike_delay_steps = max(spike_delay_steps, int(delay.max()))
+        else:
+            np.maximum.at(gpot_max_delay, pre, delay)
+
+        for nid, cond in zip(s['post'], s['conductance']):
+            if 'synapse' not in str(nid):
+                (cond_post if cond else I_post)[int(nid)] += 1
+
+        if synapse_model is not None and model != 'pass':
+            d = dict(s)
+            d['pre'] = pre
+            if batch > 1:
+                d = batch_dict(d, batch, 0)
+            usage = synapse_model(model).estimate_memory(d, dt, dtype)
+            models[model] = usage['model']
+            nbytes['connectivity'] += usage['connectivity']
+
+    for model, n in n_dict.iteritems():
+        if model in (PORT_IN_GPOT, PORT_IN_SPK):
+            continue
+        num = len(n['id'])
+
+        # Arrays allocated by BaseNeuron to compute the input current:
+        num_cond = sum(cond_post[int(nid)] for nid in n['id'])
+        num_I = sum(I_post[int(nid)] for nid in n['id']) + \
+                sum(bool(ext) for ext in n['extern'])
+        nbytes['connectivity'] += 4*(2*(num+1) + 2*num + num_I + num_cond) + \
+                                  itemsize*num_cond
+
+        if neuron_model is not None:
+            d = batch_dict(n, batch, 0) if batch > 1 else n
+            usage = neuron_model(model).estimate_memory(d, dt, dtype)
+            models[model] = usage['model']
+            nbytes['connectivity'] += usage['connectivity']
+
+    nbytes['V'] = itemsize*num_gpot*batch
+    nbytes['spike_state'] = 4*num_spike*batch
+    nbytes['synapse_state'] = itemsize*max((total_synapses + num_input)*batch,
+                                           1)
+    if num_gpot > 0:
+        length = np.where(gpot_max_delay > 0, gpot_max_delay+1, 0)
+        nbytes['gpot_buffer'] = itemsize*max(int(length.sum())*batch, 1) + \
+                                4*(2*num_gpot + int(np.sum(length > 0)))
+    if num_spike > 0:
+        nbytes['spike_buffer'] = pitched_nbytes(spike_delay_steps+1,
+                                                (num_spike*batch-1)//32+1,
+                                                np.uint32)
+    if num_input > 0:
+        nbytes['I_ext'] = pitched_nbytes(one_time_import, num_input*batch,
+                                         dtype)
+    nbytes['ports'] = itemsize*(num_public_gpot + num_in_gpot) + \
+                      4*(num_public_spike + num_in_spk) + \
+                      4*(2*num_public_gpot + 2*num_public_spike +
+                         num_in_gpot + num_in_spk)
+
+    nbytes['total'] = sum(nbytes.itervalues()) + sum(models.itervalues())
+    nbytes['models'] = models
+    return nbytes
@@ -1,6 +1,24 @@
-import os
-import glob
+"""
+Neuron models.
 
-__all__ = [ os.path.basename(f)[:-3] for f in \
-            glob.glob(os.path.dirname(__file__)+"/*.py") if \
-            not '__init__' in os.path.basename(f)[:-3]]
+The model classes are imported on demand; use `get_model()` to look one up
+by name and `register()` to add models defined elsewhere.
+"""
+
+from neurokernel.LPU.utils.registry import ModelRegistry
+
+registry = ModelRegistry(
+    'neurokernel.LPU.neurons',
+    'neurokernel.LPU.neurons.baseneuron:BaseNeuron',
+    dict((name, 'neurokernel.LPU.neurons.%s:%s' % (name, name)) for name in
+         ['HH_PH', 'LeakyIAF', 'LeakyIAF_bias', 'MorrisLecar',
+          'MorrisLecarCopy', 'MorrisLecar_a']))
+
+register = registry.register
+
+def get_model(name):
+    """
+    Return the class of neuron model `name`.
+    """
+
+    return registry[name]
@@ -15,6 +15,9 @@ import pycuda.driver as cuda
 from pycuda.compiler import SourceModule
 
 from neurokernel.LPU.utils.simpleio import *
+from neurokernel.LPU.utils.memory import attr_nbytes, object_nbytes
+from neurokernel.LPU.utils.params import get_param, set_param
+from neurokernel.LPU.utils.profiling import phase
 
 class BaseNeuron(object):
     __metaclass__ = ABCMeta
@@ -59,6 +62,13 @@ class BaseNeuron(object):
         Note that you only need the above information if you plan to override the
         default update_I method.
 
+        The neurons of a batched LPU are simulated for n_dict['batch']
+        trials at once. Their states, parameters and input currents then
+        hold the values of all trials of each neuron next to each other,
+        i.e. the value of trial b of neuron k is at position
+        k*n_dict['batch'] + b, whereas the items listed above describe the
+        connectivity of a single trial, which all trials share.
+
         neuron_state_pointer is an integer representing the initial memory location
         on the GPU for storing the neuron states for this object.
         For graded potential neurons, the data type will be double whereas for
@@ -78,11 +88,14 @@ class BaseNeuron(object):
         
         self.__neuron_state_pointer = neuron_state_pointer
         self.__num_neurons = len(n_dict['id'])
+        self.__batch = n_dict.get('batch', 1)
         _num_dendrite_cond = np.asarray([n_dict['num_dendrites_cond'][i]
-                                         for i in range(self.__num_neurons)],
+                                         for i in range(self.__num_neurons //
+                                                        self.__batch)],
                                         dtype=np.int32).flatten()
         _num_dendrite = np.asarray([n_dict['num_dendrites_I'][i]
-                                    for i in range(self.__num_neurons)],
+                                    for i in range(self.__num_neurons //
+                                                   self.__batch)],
                                    dtype=np.int32).flatten()
 
         self.__cum_num_dendrite = garray.to_gpu(np.concatenate((
@@ -150,6 +163,21 @@ class BaseNeuron(object):
     @property
     def update_I_override(self): return False
 
+    def derived_constants(self, n_dict, dt):
+        '''
+        This method should return the constants derived from the neuron
+        parameters and the time step that the model would otherwise recompute
+        at every step, e.g. propagators, reciprocals or combined gains.
+
+        The result is a dictionary mapping the name of each constant to a
+        scalar or to an array containing one value per neuron. It is
+        computed once at initialization. Models defined by a ModelSpec
+        declare these constants in the spec, and SpecNeuron compiles those
+        shared by all neurons into the kernel; see
+        neurokernel.LPU.neurons.specneuron.SpecNeuron.
+        '''
+        return {}
+
     def update_I(self, synapse_state, st=None, logger=None):
         '''
         This method should compute the input current to each neuron
@@ -183,6 +211,74 @@ class BaseNeuron(object):
         if self.debug:
             dataset_append(self.__I_file['/array'], self.I.get().reshape((1, -1)))
 
+    def set_params(self, values, inds=None):
+        '''
+        Change parameters in place; values maps parameter names to one value
+        per neuron (or per neuron in inds) or a scalar. inds holds the
+        indices of the neurons to change, in the order of the n_dict the
+        model was created with; all neurons are changed if it is None.
+
+        Parameters kept in a packed block (self.block) or in GPUArray
+        attributes named after them are supported; models that derive
+        other data from their parameters should override this method.
+        '''
+        for name, v in values.iteritems():
+            set_param(self, name, v, inds)
+
+    def get_params(self, names):
+        '''
+        Return the values of some parameters, as a dict mapping each name
+        in names to a copy of its values in the order used by set_params().
+        '''
+        return dict((name, get_param(self, name)) for name in names)
+
+    def get_state(self):
+        '''
+        Return the internal state of the model as a dict of numpy arrays,
+        for checkpointing. Models that keep their parameters and states in
+        a packed block (self.block) return that block; models with other
+        internal state should override this method and set_state().
+        '''
+        if hasattr(self, 'block'):
+            return {'block': self.block.get()}
+        return {}
+
+    def set_state(self, state):
+        '''
+        Restore the internal state returned by get_state().
+        '''
+        if 'block' in state:
+            self.block.set(state['block'])
+
+    @classmethod
+    def estimate_memory(cls, n_dict, dt, dtype=np.float64):
+        '''
+        Estimate the device memory (in bytes) that an instance of this model
+        would use for the neurons described by n_dict, before it is created.
+
+        Returns a dict with the keys 'model', for the parameters, states and
+        input current, and 'connectivity', for index arrays allocated by the
+        model itself. The arrays that BaseNeuron allocates to compute the
+        input current are accounted for by the LPU.
+
+        The default assumes one array per numeric attribute in n_dict; models
+        that allocate their arrays differently should override it.
+        '''
+        num = len(n_dict['id'])
+        return {'model': attr_nbytes(n_dict, dtype) + 8*num,
+                'connectivity': 0}
+
+    def memory_usage(self):
+        '''
+        Return the device memory (in bytes) used by the arrays of this
+        object, split as by estimate_memory(); the index arrays allocated by
+        BaseNeuron to compute the input current count as connectivity.
+        '''
+        names = [n for n in vars(self) if n.startswith('_BaseNeuron__')]
+        connectivity = object_nbytes(self, names)
+        return {'model': object_nbytes(self) - connectivity,
+                'connectivity': connectivity}
+
     def post_run(self):
         '''
         This method will be called at the end of the simulation.
@@ -200,6 +296,7 @@ class BaseNeuron(object):
     def __get_update_I_cond_func(self):
         template = """
         #define NUM_NEURONS %(num_neurons)d
+        #define BATCH %(batch)d
 
         __global__ void get_input(double* synapse, int* cum_num_dendrite, 
                                   int* num_dendrite, int* pre, double* I_pre, 
@@ -222,7 +319,7 @@ class BaseNeuron(object):
                 neuron = bid * 32 + tidx;
                 if(neuron < NUM_NEURONS)
                 {
-                    num_den[tidx] = num_dendrite[neuron];
+                    num_den[tidx] = num_dendrite[neuron / BATCH];
                     V_in[tidx] = V[neuron];
                 }
             } else if(tidy == 1)
@@ -230,7 +327,7 @@ class BaseNeuron(object):
                 neuron = bid * 32 + tidx;
                 if(neuron < NUM_NEURONS)
                 {
-                    den_start[tidx] = cum_num_dendrite[neuron];
+                    den_start[tidx] = cum_num_dendrite[neuron / BATCH];
                 }
             }
 
@@ -248,7 +345,7 @@ class BaseNeuron(object):
 
                for(int i = tidx; i < n_den; i += 32)
                {
-                   input[tidy][tidx] += synapse[pre[start + i]] * (VV - V_rev[start + i]);
+                   input[tidy][tidx] += synapse[pre[start + i]*BATCH + neuron %% BATCH] * (VV - V_rev[start + i]);
                }
             }
 
@@ -289,8 +386,10 @@ class BaseNeuron(object):
         }
         // can be improved
         """
-        mod = SourceModule(template % {"num_neurons": self.__num_neurons}, 
-                           options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule(template % {"num_neurons": self.__num_neurons,
+                                           "batch": self.__batch},
+                               options=self.compile_options)
         func = mod.get_function("get_input")
         func.prepare('PPPPPPP')
         #[np.intp, np.intp, np.intp, np.intp, np.intp, np.intp, np.intp])
@@ -301,6 +400,7 @@ class BaseNeuron(object):
     def __get_update_I_non_cond_func(self):
         template = """
         #define NUM_NEURONS %(num_neurons)d
+        #define BATCH %(batch)d
 
         __global__ void get_input(double* synapse, int* cum_num_dendrite, 
                                   int* num_dendrite, int* pre, double* I_pre)
@@ -321,14 +421,14 @@ class BaseNeuron(object):
                 neuron = bid * 32 + tidx;
                 if(neuron < NUM_NEURONS)
                 {
-                    num_den[tidx] = num_dendrite[neuron];
+                    num_den[tidx] = num_dendrite[neuron / BATCH];
                 }
             } else if(tidy == 1)
             {
                 neuron = bid * 32 + tidx;
                 if(neuron < NUM_NEURONS)
                 {
-                    den_start[tidx] = cum_num_dendrite[neuron];
+                    den_start[tidx] = cum_num_dendrite[neuron / BATCH];
                 }
             }
 
@@ -344,7 +444,7 @@ class BaseNeuron(object):
 
                for(int i = tidx; i < n_den; i += 32)
                {
-                   input[tidy][tidx] += synapse[pre[start] + i];
+                   input[tidy][tidx] += synapse[pre[start + i]*BATCH + neuron %% BATCH];
                }
             }
             __syncthreads();
@@ -385,8 +485,10 @@ class BaseNeuron(object):
         }
         //can be improved
         """
-        mod = SourceModule(template % {"num_neurons": self.__num_neurons}, 
-                           options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule(template % {"num_neurons": self.__num_neurons,
+                                           "batch": self.__batch},
+                               options=self.compile_options)
         func = mod.get_function("get_input")
         func.prepare('PPPPP')#[np.intp, np.intp, np.intp, np.intp, np.intp])
         self.__block_get_input_I = (32, 32, 1)
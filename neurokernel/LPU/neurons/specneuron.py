@@ -0,0 +1,251 @@
+from baseneuron import BaseNeuron
+
+import numpy as np
+import pycuda.driver as cuda
+import pycuda.gpuarray as garray
+from pycuda.compiler import SourceModule
+
+from neurokernel.LPU.utils.simpleio import *
+from neurokernel.LPU.utils.params import split_params, c_literal
+from neurokernel.LPU.utils.packed import GPUPackedArrays
+from neurokernel.LPU.utils.profiling import phase
+
+class SpecNeuron(BaseNeuron):
+    """
+    Neuron model generated from a declarative model description.
+
+    Subclasses only need to set `spec` to a
+    `neurokernel.LPU.utils.modelspec.ModelSpec` instance; the update kernel
+    is generated from it, parameters shared by all neurons are compiled into
+    the kernel and the input current is computed by `BaseNeuron.update_I`.
+
+    The state given by `spec.output` is kept in the LPU's graded potential
+    state array for graded potential models; all other states and the
+    per-neuron parameters are the rows of a single packed block, `block`.
+
+    Setting `fold_params` to False keeps the parameters shared by all neurons
+    in the block as well, so that `set_params` can change any of them without
+    recompiling the kernel.
+
+    If `n_dict` has the attribute `noise`, a white noise current with that
+    intensity is added to the input current of each neuron at every
+    integration step (see `ModelSpec.with_noise`). The noise is drawn from a
+    counter-based generator keyed by `noise_seed`, the neuron id and the
+    index of the integration step, so no generator state is kept per neuron;
+    the LPU sets `noise_seed` to its `seed`.
+    """
+
+    spec = None
+    fold_params = True
+    noise_seed = 0
+
+    def __init__(self, n_dict, state, dt, debug=False, LPU_id=None,
+                 cuda_verbose=False):
+        if cuda_verbose:
+            self.compile_options = ['--ptxas-options=-v']
+        else:
+            self.compile_options = []
+
+        if 'noise' in n_dict:
+            self.spec = self.spec.with_noise()
+        spec = self.spec
+        self.num_neurons = len(n_dict['id'])
+        self.dt = np.double(dt)
+        self.steps = spec.num_substeps(dt)
+        self.ddt = spec.step_size(dt)
+        self.debug = debug
+        self.LPU_id = LPU_id
+        self.dtype = np.float64
+
+        # parameters and derived constants shared by all neurons are
+        # compiled into the kernel; the others and the states are packed
+        # into one block:
+        self.params = dict((n, np.asarray(n_dict[n], dtype=self.dtype))
+                           for n in spec.params)
+        consts = dict(self.params)
+        consts.update(self.derived_constants(n_dict, dt))
+        self.uniform, varying = split_params(consts, spec.kernel_params(),
+                                             self.dtype)
+        if not self.fold_params:
+            varying.update(self.uniform)
+            self.uniform = {}
+        self.literals = dict((n, c_literal(v, self.dtype))
+                             for n, v in self.uniform.iteritems())
+        values = dict((name, n_dict[key]) for name, key in spec.states)
+        values.update(varying)
+        names = spec.block_names(self.uniform)
+        self.block = GPUPackedArrays(names, self.num_neurons, self.dtype,
+                                     dict((n, values[n]) for n in names))
+
+        if spec.spiking:
+            self.spk = state
+            self.V = self.block.ptr(spec.output)
+        else:
+            self.V = state
+            cuda.memcpy_htod(int(state), np.asarray(values[spec.output],
+                                                    dtype=self.dtype))
+
+        if spec.noise:
+            self.noise_ids = garray.to_gpu(np.asarray(n_dict['id'],
+                                                      dtype=np.uint32))
+            self.noise_step = 0
+
+        self.update = self.get_gpu_kernel()
+
+        if self.debug:
+            if self.LPU_id is None:
+                self.LPU_id = "anon"
+            self.state_files = {}
+            for name in spec.state_names:
+                if name in self.block:
+                    f = h5py.File('%s_%s_%s.h5' % (self.LPU_id, name,
+                                                   self.__class__.__name__), 'w')
+                    f.create_dataset('/array', (0, self.num_neurons),
+                                     dtype=self.dtype,
+                                     maxshape=(None, self.num_neurons))
+                    self.state_files[name] = f
+
+    @property
+    def neuron_class(self): return True
+
+    def derived_constants(self, n_dict, dt):
+        return self.spec.derived_constants(n_dict, dt)
+
+    @classmethod
+    def estimate_memory(cls, n_dict, dt, dtype=np.float64):
+        # The block holds the rows that __init__ does not fold into the
+        # kernel; the input current is allocated by BaseNeuron:
+        spec = cls.spec.with_noise() if 'noise' in n_dict else cls.spec
+        num = len(n_dict['id'])
+        consts = dict((n, np.asarray(n_dict[n], dtype=dtype))
+                      for n in spec.params)
+        consts.update(spec.derived_constants(n_dict, dt))
+        uniform = {}
+        if cls.fold_params:
+            uniform = split_params(consts, spec.kernel_params(), dtype)[0]
+        rows = len(spec.block_names(uniform))
+        return {'model': GPUPackedArrays.block_nbytes(rows, num, dtype) +
+                         8*num + (4*num if spec.noise else 0),
+                'connectivity': 0}
+
+    def set_params(self, values, inds=None):
+        """
+        Change parameters of the neurons in place.
+
+        The derived constants are recomputed. If a parameter or derived
+        constant that was compiled into the kernel changes, the kernel is
+        recompiled; if it no longer takes the same value for all neurons, it
+        is moved into the block first.
+
+        Parameters
+        ----------
+        values : dict
+            Maps parameter names to their new values, either one per neuron
+            (or per neuron in `inds`) or a scalar.
+        inds : numpy.ndarray of int
+            Indices of the neurons to change; defaults to all neurons.
+        """
+
+        for name, v in values.iteritems():
+            if name not in self.params:
+                raise KeyError('%s is not a parameter of %s' % \
+                               (name, self.__class__.__name__))
+            p = self.params[name]*np.ones(self.num_neurons, self.dtype)
+            if inds is None:
+                p[:] = v
+            else:
+                p[inds] = v
+            self.params[name] = p
+        consts = dict(self.params)
+        consts.update(self.derived_constants(self.params, self.dt))
+
+        uniform = split_params(consts, self.uniform.keys(), self.dtype)[0]
+        if uniform != self.uniform:
+            self._rebuild(uniform)
+        for name in self.spec.kernel_params():
+            if name in self.block:
+                self.block[name] = consts[name]
+
+    def get_params(self, names):
+        for name in names:
+            if name not in self.params:
+                raise KeyError('%s is not a parameter of %s' % \
+                               (name, self.__class__.__name__))
+        return dict((name, self.params[name]*np.ones(self.num_neurons,
+                                                     self.dtype))
+                    for name in names)
+
+    def _rebuild(self, uniform):
+        # Move the constants that are no longer shared by all neurons into
+        # the block and recompile the kernel with the new literals:
+        names = self.spec.block_names(uniform)
+        if names != self.block.names:
+            old = self.block
+            values = dict((n, old[n]) for n in old.names if n in names)
+            self.block = GPUPackedArrays(names, self.num_neurons, self.dtype,
+                                         values)
+            if self.spec.spiking:
+                V = self.block.ptr(self.spec.output)
+
+                # BaseNeuron reads the membrane potentials of conductance
+                # based synapses from the old block:
+                if getattr(self, '_BaseNeuron__neuron_state_pointer',
+                           None) == self.V:
+                    self._BaseNeuron__neuron_state_pointer = V
+                self.V = V
+        self.uniform = uniform
+        self.literals = dict((n, c_literal(v, self.dtype))
+                             for n, v in uniform.iteritems())
+        self.update = self.get_gpu_kernel()
+
+    def eval(self, st=None):
+        args = [self.num_neurons, self.ddt, self.steps,
+                self.spk if self.spec.spiking else self.V, self.I.gpudata,
+                self.block.ptr(), self.block.ld]
+        if self.spec.noise:
+            args += [self.noise_seed, self.noise_step, self.noise_ids.gpudata]
+            self.noise_step += self.steps
+        self.update.prepared_async_call(self.gpu_grid, self.gpu_block, st,
+                                        *args)
+        if self.debug:
+            for name, f in self.state_files.iteritems():
+                dataset_append(f['/array'], self.block[name].reshape((1, -1)))
+
+    def get_state(self):
+        # The host copy of the parameters and the constants compiled into
+        # the kernel are saved as well, so that set_params() after a restore
+        # starts from the restored parameters:
+        state = super(SpecNeuron, self).get_state()
+        state['params'] = dict((n, v.copy())
+                               for n, v in self.params.iteritems())
+        state['uniform'] = dict(self.uniform)
+        if self.spec.noise:
+            state['noise_step'] = self.noise_step
+        return state
+
+    def set_state(self, state):
+        if 'params' in state:
+            self.params = dict((n, np.asarray(v, dtype=self.dtype))
+                               for n, v in state['params'].iteritems())
+            uniform = dict((n, self.dtype(v))
+                           for n, v in state['uniform'].iteritems())
+            if uniform != self.uniform:
+                self._rebuild(uniform)
+        super(SpecNeuron, self).set_state(state)
+        if self.spec.noise:
+            self.noise_step = int(state['noise_step'])
+
+    def get_gpu_kernel(self):
+        self.gpu_block = (128, 1, 1)
+        self.gpu_grid = ((self.num_neurons - 1) / self.gpu_block[0] + 1, 1)
+        with phase('kernel compilation'):
+            mod = SourceModule(self.spec.cuda_src(self.literals, self.dtype),
+                               options=self.compile_options)
+        func = mod.get_function(self.spec.name)
+        func.prepare(self.spec.arg_types(self.dtype))
+        return func
+
+    def post_run(self):
+        if self.debug:
+            for f in self.state_files.itervalues():
+                f.close()
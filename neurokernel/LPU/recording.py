@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+Event-triggered recording of neuron states.
+
+Instead of writing the states of all neurons at every step, as the LPU does
+when `output_file` is set, a `TriggeredRecorder` writes the states of a few
+neurons only in windows around trigger events. Recorders are passed to the
+LPU together with its other reductions.
+
+Examples
+--------
+>>> rec = TriggeredRecorder('windows.h5', ids=[3, 4, 5], pre=100, post=400,
+...                         spike=7)
+>>> lpu = LPU(dt, n_dict, s_dict, input_file='input.h5', reductions=[rec])
+"""
+
+import h5py
+import numpy as np
+
+import pycuda.gpuarray as garray
+import pycuda.elementwise as elementwise
+from pycuda.tools import dtype_to_ctype
+
+from reductions import Reduction
+from utils.simpleio import dataset_append
+
+class TriggeredRecorder(Reduction):
+    """
+    Record the states of some neurons in windows around trigger events.
+
+    The states of the recorded neurons during the last `pre` steps are kept
+    in a ring buffer on the GPU. When a trigger event occurs, these steps
+    and the `post` steps that follow it are written to an HDF5 file as one
+    window; no other steps are copied from the GPU. Triggers that occur
+    while a window is being recorded are ignored. A window that is still
+    open at the end of the run is written with the missing steps set to NaN.
+
+    Parameters
+    ----------
+    filename : str
+        HDF5 file to write. The dataset `/array` holds the windows, with
+        shape `(windows, pre+post, len(ids))`; row `pre-1` of each window
+        holds the step at which it was triggered, which is also stored in the
+        dataset `/trigger_step`.
+    ids : list of int
+        Ids of the neurons to record: either graded potential neurons, whose
+        membrane potentials are recorded, or spiking neurons, whose spike
+        states are recorded.
+    pre : int
+        Number of steps recorded up to and including the trigger step.
+    post : int
+        Number of steps recorded after the trigger step.
+    spike : int
+        If set, a spike of the neuron with this id is a trigger event.
+    threshold : tuple of (int, float)
+        If set, the membrane potential of the graded potential neuron with
+        the given id rising to or above the given value is a trigger event.
+    onsets : list of float
+        Times (s), e.g. of stimulus onsets, that are trigger events.
+    name : str
+        Name of the summary, which lists the trigger steps of the recorded
+        windows.
+    """
+
+    name = 'triggered_recording'
+
+    def __init__(self, filename, ids, pre, post, spike=None, threshold=None,
+                 onsets=None, name=None):
+        super(TriggeredRecorder, self).__init__(name)
+        if pre < 1:
+            raise ValueError('pre must include the trigger step')
+        if spike is None and threshold is None and not onsets:
+            raise ValueError('no trigger event specified')
+        self.filename = filename
+        self.ids = list(ids)
+        self.pre = pre
+        self.post = post
+        self.spike = spike
+        self.threshold = threshold
+        self.onsets = onsets or []
+
+    def setup(self, lpu):
+        if all(i in lpu.gpot_order_dict for i in self.ids):
+            self.src = lpu.V
+            inds = lpu.gpot_order(self.ids)
+        elif all(i in lpu.spike_order_dict for i in self.ids):
+            self.src = lpu.spike_state
+            inds = lpu.spike_order(self.ids)
+        else:
+            raise ValueError('recorded neurons must either all be graded '
+                             'potential neurons or all be spiking neurons')
+        n = len(self.ids)
+        self.inds = garray.to_gpu(np.asarray(inds, dtype=np.int32))
+        self.ring = garray.empty((self.pre, n), np.float64)
+        self.ring.fill(np.nan)
+        self.window = garray.empty((self.post, n), np.float64) \
+                      if self.post else None
+        self.gather = elementwise.ElementwiseKernel(
+            "double *dest, int offset, int *inds, %s *src" % \
+            dtype_to_ctype(self.src.dtype),
+            "dest[offset+i] = src[inds[i]]",
+            "gather_recorded")
+
+        if self.spike is not None:
+            self.spike_pos = int(lpu.spike_order(self.spike))
+        if self.threshold is not None:
+            self.threshold_pos = int(lpu.gpot_order(self.threshold[0]))
+        self.onset_steps = set(int(round(t/lpu.dt)) for t in self.onsets)
+        self.prev_V = None
+        self.open = None
+        self.trigger_steps = []
+
+        self.file = h5py.File(self.filename, 'w')
+        self.file.create_dataset('/array', (0, self.pre+self.post, n),
+                                 dtype=np.float64,
+                                 maxshape=(None, self.pre+self.post, n))
+        self.file.create_dataset('/trigger_step', (0,), dtype=np.int64,
+                                 maxshape=(None,))
+
+    def update(self, lpu):
+        step = lpu.steps_done
+        n = len(self.ids)
+        self.gather(self.ring, np.int32((step % self.pre)*n), self.inds,
+                    self.src, range=slice(0, n, 1))
+        triggered = self._triggered(lpu, step)
+        if self.open is not None:
+            k = step-self.open-1
+            self.gather(self.window, np.int32(k*n), self.inds, self.src,
+                        range=slice(0, n, 1))
+            if k == self.post-1:
+                self._write()
+        elif triggered:
+            self.open = step
+
+            # Oldest step first:
+            self.pre_data = np.roll(self.ring.get(),
+                                    -((step+1) % self.pre), axis=0)
+            if self.post:
+                self.window.fill(np.nan)
+            else:
+                self._write()
+
+    def _triggered(self, lpu, step):
+        triggered = step in self.onset_steps
+        if self.spike is not None:
+            pos = self.spike_pos
+            triggered |= bool(lpu.spike_state[pos:pos+1].get()[0])
+        if self.threshold is not None:
+            pos = self.threshold_pos
+            V = lpu.V[pos:pos+1].get()[0]
+            triggered |= self.prev_V is not None and \
+                         self.prev_V < self.threshold[1] <= V
+            self.prev_V = V
+        return triggered
+
+    def _write(self):
+        if self.post:
+            data = np.vstack((self.pre_data, self.window.get()))
+        else:
+            data = self.pre_data
+        dataset_append(self.file['/array'], data[np.newaxis])
+        dataset_append(self.file['/trigger_step'],
+                       np.asarray([self.open], dtype=np.int64))
+        self.trigger_steps.append(self.open)
+        self.open = None
+
+    def result(self):
+        return {'trigger_step': np.asarray(self.trigger_steps,
+                                           dtype=np.int64)}
+
+    def post_run(self):
+        if self.open is not None:
+            self._write()
+        self.file.close()
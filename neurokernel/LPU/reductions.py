@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+"""
+Summaries of the LPU state computed on the GPU during a simulation.
+
+A reduction is updated in place at every step from the LPU's membrane
+potential and spike state arrays; only its summary is copied to the host,
+when it is requested or written to the LPU's summary file. This avoids
+writing the full traces with `output_file` when only summaries are needed.
+
+Examples
+--------
+>>> lpu = LPU(dt, n_dict, s_dict, input_file='input.h5',
+...           reductions=[SpikeCount(), VStats(), PopulationRate(0.01)],
+...           summary_file='summary.h5', summary_interval=10000)
+"""
+
+import numpy as np
+
+import pycuda.gpuarray as garray
+import pycuda.elementwise as elementwise
+
+class Reduction(object):
+    """
+    Summary of the LPU state updated at every step.
+
+    Subclasses allocate their GPU arrays in `setup()`, update them in
+    `update()` and copy the summary to the host in `result()`. The names of
+    the GPU arrays and other attributes that make up the state of the
+    reduction are listed in `state_names` so that it can be saved in LPU
+    checkpoints.
+
+    Parameters
+    ----------
+    name : str
+        Name of the summary in the summary file; defaults to the class
+        attribute `name`.
+    """
+
+    name = None
+    state_names = []
+
+    def __init__(self, name=None):
+        if name is not None:
+            self.name = name
+
+    def setup(self, lpu):
+        """
+        Allocate the arrays of the reduction for `lpu`.
+        """
+
+        raise NotImplementedError
+
+    def update(self, lpu):
+        """
+        Update the reduction with the state of `lpu` after a step.
+        """
+
+        raise NotImplementedError
+
+    def result(self):
+        """
+        Return the summary as a dict of arrays ordered by neuron id and
+        scalars.
+        """
+
+        raise NotImplementedError
+
+    def post_run(self):
+        """
+        Release the resources of the reduction at the end of the run.
+        """
+
+        pass
+
+    def get_state(self):
+        state = {}
+        for name in self.state_names:
+            value = getattr(self, name)
+            state[name] = value.get() if isinstance(value, garray.GPUArray) \
+                          else value
+        return state
+
+    def set_state(self, state):
+        for name in self.state_names:
+            value = getattr(self, name)
+            if isinstance(value, garray.GPUArray):
+                value.set(np.asarray(state[name], dtype=value.dtype))
+            else:
+                setattr(self, name, state[name])
+
+class SpikeCount(Reduction):
+    """
+    Number of spikes of each spiking neuron.
+    """
+
+    name = 'spike_count'
+    state_names = ['count']
+
+    def setup(self, lpu):
+        if lpu.spike_state is None:
+            raise ValueError('LPU has no spiking neurons')
+        self.order = lpu.spike_order_l
+        self.count = garray.zeros_like(lpu.spike_state)
+
+    def update(self, lpu):
+        self.count += lpu.spike_state
+
+    def result(self):
+        return {'count': self.count.get()[self.order]}
+
+class VStats(Reduction):
+    """
+    Running mean and variance of the membrane potential of each graded
+    potential neuron, computed with Welford's algorithm.
+    """
+
+    name = 'V_stats'
+    state_names = ['n', 'mean', 'm2']
+
+    def setup(self, lpu):
+        if lpu.V is None:
+            raise ValueError('LPU has no graded potential neurons')
+        self.order = lpu.gpot_order_l
+        self.n = 0
+        self.mean = garray.zeros_like(lpu.V)
+        self.m2 = garray.zeros_like(lpu.V)
+        self.func = elementwise.ElementwiseKernel(
+            "double *V, double *mean, double *m2, double n",
+            "double delta = V[i]-mean[i]; "
+            "mean[i] += delta/n; "
+            "m2[i] += delta*(V[i]-mean[i])",
+            "welford_update")
+
+    def update(self, lpu):
+        self.n += 1
+        self.func(lpu.V, self.mean, self.m2, np.float64(self.n))
+
+    def result(self):
+        return {'mean': self.mean.get()[self.order],
+                'var': self.m2.get()[self.order]/max(self.n, 1)}
+
+class VRange(Reduction):
+    """
+    Minimum and maximum of the membrane potential of each graded potential
+    neuron.
+    """
+
+    name = 'V_range'
+    state_names = ['min', 'max']
+
+    def setup(self, lpu):
+        if lpu.V is None:
+            raise ValueError('LPU has no graded potential neurons')
+        self.order = lpu.gpot_order_l
+        self.min = garray.empty_like(lpu.V)
+        self.min.fill(np.inf)
+        self.max = garray.empty_like(lpu.V)
+        self.max.fill(-np.inf)
+        self.func = elementwise.ElementwiseKernel(
+            "double *V, double *vmin, double *vmax",
+            "vmin[i] = fmin(vmin[i], V[i]); vmax[i] = fmax(vmax[i], V[i])",
+            "range_update")
+
+    def update(self, lpu):
+        self.func(lpu.V, self.min, self.max)
+
+    def result(self):
+        return {'min': self.min.get()[self.order],
+                'max': self.max.get()[self.order]}
+
+class PopulationRate(Reduction):
+    """
+    Mean firing rate of a population of spiking neurons in successive bins.
+
+    The spikes of each neuron are accumulated on the GPU during a bin and
+    summed over the population at its end, so that only one number per bin
+    is copied to the host. Incomplete bins are not reported.
+
+    Parameters
+    ----------
+    bin_width : float
+        Width of the bins (s).
+    ids : list of int
+        Ids of the neurons in the population; defaults to all spiking
+        neurons.
+    name : str
+        Name of the summary.
+    """
+
+    name = 'population_rate'
+    state_names = ['bin_count', 'steps', 'counts']
+
+    def __init__(self, bin_width, ids=None, name=None):
+        super(PopulationRate, self).__init__(name)
+        self.bin_width = bin_width
+        self.ids = ids
+
+    def setup(self, lpu):
+        if lpu.spike_state is None:
+            raise ValueError('LPU has no spiking neurons')
+        self.bin_steps = max(1, int(round(self.bin_width/lpu.dt)))
+        self.bin_width = self.bin_steps*lpu.dt
+        mask = np.zeros(lpu.spike_state.size, lpu.spike_state.dtype)
+        if self.ids is None:
+            mask[:] = 1
+        else:
+            mask[lpu.spike_order(self.ids)] = 1
+        self.num_neurons = int(mask.sum())
+        self.mask = garray.to_gpu(mask)
+        self.bin_count = garray.zeros_like(lpu.spike_state)
+        self.steps = 0
+        self.counts = []
+
+    def update(self, lpu):
+        self.bin_count += lpu.spike_state
+        self.steps += 1
+        if self.steps == self.bin_steps:
+            self.counts.append(int(garray.dot(self.bin_count,
+                                              self.mask).get()))
+            self.bin_count.fill(0)
+            self.steps = 0
+
+    def result(self):
+        return {'rate': np.asarray(self.counts, dtype=np.float64)/ \
+                        (self.num_neurons*self.bin_width),
+                'bin_width': self.bin_width}
+
+    def get_state(self):
+        state = super(PopulationRate, self).get_state()
+        state['counts'] = np.asarray(self.counts, dtype=np.int64)
+        return state
+
+    def set_state(self, state):
+        super(PopulationRate, self).set_state(state)
+        self.counts = [int(c) for c in state['counts']]
@@ -0,0 +1,191 @@
+"""
+Parameter sweeps over a single LPU.
+
+Every worker process of a local process pool builds the LPU once, i.e. it
+processes the connectivity, compiles the kernels and saves the initial state.
+Each configuration of the sweep is then run by restoring that state and
+overwriting the parameter arrays of the model instances in place. The
+initial values of the parameters changed by earlier configurations are
+written back first, so the result of a configuration does not depend on
+the configurations that the worker ran before it.
+
+Examples
+--------
+>>> n_dict, s_dict = LPU.lpu_parser('generic_lpu.gexf.gz')
+>>> sweep = Sweep(1e-4, n_dict, s_dict, 10000,
+...               input_file='generic_input.h5')
+>>> results = sweep.run([{'AlphaSynapse': {'gmax': g}}
+...                      for g in [0.001, 0.002, 0.004]])
+>>> results[0]['spike_count']
+"""
+
+import copy
+import multiprocessing
+
+import numpy as np
+
+class Sweep(object):
+    """
+    Run an LPU for many parameter configurations.
+
+    Parameters
+    ----------
+    dt : float
+        Time step (s).
+    n_dict, s_dict : dict of dict of list
+        Neuron and synapse data, e.g. as returned by `LPU.lpu_parser`.
+    steps : int
+        Number of steps to run for each configuration.
+    reduce : callable
+        If set, `reduce(lpu)` is called at the end of each run and its return
+        value is added to the result of the configuration as `'reduced'`;
+        it must be picklable, e.g. a module-level function.
+    processes : int
+        Number of worker processes; defaults to the number of devices.
+    devices : list of int
+        GPU devices to use; the workers are assigned to them in turn.
+    kwargs : dict
+        Other arguments of `LPU`, e.g. `input_file` or `reductions`. Outputs
+        and summaries are not written to files.
+
+    Notes
+    -----
+    Neuron model parameters shared by all neurons are normally compiled into
+    the kernels; the workers disable this (see `SpecNeuron.fold_params`) so
+    that any parameter can be changed without recompiling.
+    """
+
+    def __init__(self, dt, n_dict, s_dict, steps, reduce=None, processes=None,
+                 devices=[0], **kwargs):
+        self.dt = dt
+        self.n_dict = n_dict
+        self.s_dict = s_dict
+        self.steps = steps
+        self.reduce = reduce
+        self.devices = list(devices)
+        self.processes = processes or len(self.devices)
+        kwargs.pop('output_file', None)
+        kwargs.pop('summary_file', None)
+        self.kwargs = kwargs
+
+    def run(self, configs):
+        """
+        Run the LPU for each configuration.
+
+        Parameters
+        ----------
+        configs : list of dict
+            Each configuration maps model names to dicts that map parameter
+            names to their values, either one per model instance (in the order
+            of `n_dict`/`s_dict`) or a scalar. The values of a batched LPU
+            (see the `batch` argument of `LPU`) are used for all its trials.
+
+        Returns
+        -------
+        results : list of dict
+            Result of each configuration: the number of spikes of each spiking
+            neuron (`'spike_count'`) and the mean membrane potential of each
+            graded potential neuron (`'V_mean'`), both ordered by neuron id,
+            the summaries of the LPU's reductions (`'summaries'`), if any,
+            and the return value of `reduce` (`'reduced'`), if set.
+        """
+
+        counter = multiprocessing.Value('i', 0)
+        pool = multiprocessing.Pool(
+            self.processes, _init_worker,
+            (self.dt, self.n_dict, self.s_dict, self.kwargs, self.devices,
+             counter))
+        try:
+            results = pool.map(_run_config,
+                               [(config, self.steps, self.reduce)
+                                for config in configs], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+# State of each worker process:
+_lpu = None
+_initial_state = None
+_ids = None
+_defaults = None
+
+def _init_worker(dt, n_dict, s_dict, kwargs, devices, counter):
+    global _lpu, _initial_state, _ids, _defaults
+
+    # Imported here so that the parent process does not need to initialize
+    # CUDA before forking:
+    from neurokernel.LPU.LPU import LPU
+    from neurokernel.LPU.neurons.specneuron import SpecNeuron
+    SpecNeuron.fold_params = False
+
+    with counter.get_lock():
+        device = devices[counter.value % len(devices)]
+        counter.value += 1
+
+    # The LPU reorders the synapses of each model; keep the ids in their
+    # original order to map per-element parameter values:
+    n_dict = copy.deepcopy(n_dict)
+    s_dict = copy.deepcopy(s_dict)
+    _ids = dict((model, list(d['id'])) for model, d in
+                n_dict.items() + s_dict.items())
+
+    _lpu = LPU(dt, n_dict, s_dict, device=device, **kwargs)
+    if _lpu.batch > 1:
+        for model in _ids:
+            _ids[model] = _batch_ids(_ids[model], _lpu.batch,
+                                     _lpu.nid_max if model in n_dict else
+                                     _lpu.total_synapses)
+    _lpu.pre_run()
+    _initial_state = _lpu._get_state()
+
+    # Initial values of the parameters changed by the configurations, saved
+    # when they are first changed:
+    _defaults = {}
+
+def _batch_ids(ids, batch, offset):
+    # Ids of the elements of all trials of a batched LPU, trial by trial
+    # (see `LPU`):
+    return list((np.asarray(ids)[np.newaxis] +
+                 offset*np.arange(batch)[:, np.newaxis]).reshape(-1))
+
+def _set_params(model, values):
+    for name, v in values.iteritems():
+        if (model, name) not in _defaults:
+            _defaults[(model, name)] = _lpu.get_params(model, name)
+        if np.isscalar(v):
+            _lpu.set_params(model, name, v)
+        else:
+            _lpu.set_params(model, name, np.tile(v, _lpu.batch), _ids[model])
+
+def _run_config(args):
+    config, steps, reduce = args
+
+    _lpu._set_state(_initial_state)
+    for (model, name), v in _defaults.iteritems():
+        _lpu.set_params(model, name, v)
+    for model, values in config.iteritems():
+        _set_params(model, values)
+
+    spike_count = V_sum = None
+    if _lpu.spike_state is not None:
+        spike_count = _lpu.spike_state*0
+    if _lpu.V is not None:
+        V_sum = _lpu.V*0
+    for i in xrange(steps):
+        _lpu.run_step()
+        if spike_count is not None:
+            spike_count += _lpu.spike_state
+        if V_sum is not None:
+            V_sum += _lpu.V
+
+    result = {}
+    if spike_count is not None:
+        result['spike_count'] = spike_count.get()[_lpu.spike_order_l]
+    if V_sum is not None:
+        result['V_mean'] = V_sum.get()[_lpu.gpot_order_l]/steps
+    if _lpu.reductions:
+        result['summaries'] = _lpu.summaries()
+    if reduce is not None:
+        result['reduced'] = reduce(_lpu)
+    return result
@@ -10,52 +10,53 @@ from pycuda.tools import dtype_to_ctype
 import pycuda.driver as cuda
 from pycuda.compiler import SourceModule
 
+from neurokernel.LPU.utils.fanout import build_fanout, get_fanout_func, \
+    fanout_grid, fanout_nbytes
+from neurokernel.LPU.utils.packed import GPUPackedArrays
+from neurokernel.LPU.utils.profiling import phase
+
 cuda_src_synapse_kernel = """
 #include <math.h>
 
+#define AR   %(ar)d
+#define AD   %(ad)d
+#define GMAX %(gmax)d
+#define A0   %(a0)d
+#define A1   %(a1)d
+#define A2   %(a2)d
+
 __global__ void alpha_synapse(
     int num,
     %(type)s dt,
-    int *spike,
-    int *Pre,
-    %(type)s *Ar,
-    %(type)s *Ad,
-    %(type)s *Gmax,
-    %(type)s *a0,
-    %(type)s *a1,
-    %(type)s *a2,
-    %(type)s *I,
+    %(type)s *block,
+    int ld,
     %(type)s *cond )
 {
     int tid = threadIdx.x + blockIdx.x*blockDim.x;
     int tot_threads = gridDim.x * blockDim.x;
-    int pre;
-    %(type)s ar,ad,gmax,presyn;
+    %(type)s ar,ad,gmax;
     %(type)s old_a[3];
     %(type)s new_a[3];
 
     for( int i=tid; i<num; i+=tot_threads ){
         // copy data from global memory to register
-        ar = Ar[i];
-        ad = Ad[i];
-        pre = Pre[i];
-        gmax = Gmax[i];
-        presyn = I[i];
-        old_a[0] = a0[i];
-        old_a[1] = a1[i];
-        old_a[2] = a2[i];
-
-        // update the alpha function
+        ar = block[AR*ld + i];
+        ad = block[AD*ld + i];
+        gmax = block[GMAX*ld + i];
+        old_a[0] = block[A0*ld + i];
+        old_a[1] = block[A1*ld + i];
+        old_a[2] = block[A2*ld + i];
+
+        // update the alpha function; the spike-triggered increment of a1 is
+        // applied afterwards to the synapses whose presynaptic neuron spiked
         new_a[0] = fmax( 0., old_a[0] + dt*old_a[1] );
         new_a[1] = old_a[1] + dt*old_a[2];
-        if( spike[pre] )
-            new_a[1] += ar*ad*exp(-presyn); //NOTE: choose between exp and expf
         new_a[2] = -( ar+ad )*old_a[1] - ar*ad*old_a[0];
 
         // copy data from register to the global memory
-        a0[i] = new_a[0];
-        a1[i] = new_a[1];
-        a2[i] = new_a[2];
+        block[A0*ld + i] = new_a[0];
+        block[A1*ld + i] = new_a[1];
+        block[A2*ld + i] = new_a[2];
         cond[i] = new_a[0]*gmax;
     }
     return;
@@ -64,6 +65,7 @@ __global__ void alpha_synapse(
 cuda_src_synapse_update_I = """
 #define N 32
 #define NUM %(num)d
+#define BATCH %(batch)d
 
 __global__ void get_input(
     double* synapse,
@@ -87,14 +89,14 @@ __global__ void get_input(
         sid = bid * N + tidx;
         if(sid < NUM)
         {
-            num_den[tidx] = num_dendrite[sid];
+            num_den[tidx] = num_dendrite[sid / BATCH];
         }
     } else if(tidy == 1)
     {
         sid = bid * N + tidx;
         if(sid < NUM)
         {
-            den_start[tidx] = cum_num_dendrite[sid];
+            den_start[tidx] = cum_num_dendrite[sid / BATCH];
         }
     }
 
@@ -107,9 +109,11 @@ __global__ void get_input(
        int n_den = num_den[tidy];
        int start = den_start[tidy];
 
+       // the trials of a synapse share its inputs, whose states of all
+       // trials are adjacent
        for(int i = tidx; i < n_den; i += N)
        {
-           input[tidy][tidx] += synapse[pre[start + i]];
+           input[tidy][tidx] += synapse[pre[start + i]*BATCH + sid %% BATCH];
        }
     }
 
@@ -154,6 +158,11 @@ __global__ void get_input(
 
 class AlphaSynapsePre(BaseSynapse):
 
+    connectivity_attrs = ['fanout_delay', 'fanout_ptr', 'fanout_syn',
+                          '_cum_num_dendrite', '_cum_num_dendrite_cond',
+                          '_num_dendrite', '_num_dendrite_cond', '_pre',
+                          '_cond_pre', '_V_rev']
+
     def __init__(self, s_dict, synapse_state, dt, debug=False, cuda_verbose=False):
         if cuda_verbose:
             self.compile_options = ['--ptxas-options=-v']
@@ -163,21 +172,28 @@ class AlphaSynapsePre(BaseSynapse):
         self.debug = debug
         self.dt = dt
         self.num = len( s_dict['id'] )
+        self.batch = s_dict.get('batch', 1)
 
-        self.pre  = garray.to_gpu( np.asarray( s_dict['pre'], dtype=np.int32 ))
-        self.ar   = garray.to_gpu( np.asarray( s_dict['ar'], dtype=np.float64 ))
-        self.ad   = garray.to_gpu( np.asarray( s_dict['ad'], dtype=np.float64 ))
-        self.gmax = garray.to_gpu( np.asarray( s_dict['gmax'], dtype=np.float64 ))
-        self.a0   = garray.zeros( (self.num,), dtype=np.float64 )
-        self.a1   = garray.zeros( (self.num,), dtype=np.float64 )
-        self.a2   = garray.zeros( (self.num,), dtype=np.float64 )
+        if 'delay' in s_dict:
+            delay = np.round(np.asarray(s_dict['delay'])*1e-3/dt).astype(np.int32)
+        else:
+            delay = None
+        ptr, syn, delays = build_fanout(s_dict['pre'], delay=delay)
+        self.num_pre = ptr.shape[1] - 1
+        self.fanout_delay = garray.to_gpu(delays)
+        self.fanout_ptr = garray.to_gpu(ptr)
+        self.fanout_syn = garray.to_gpu(syn)
+        # parameters and states are the rows of one packed block:
+        self.block = GPUPackedArrays(
+            ['ar', 'ad', 'gmax', 'a0', 'a1', 'a2'], self.num, np.float64,
+            {'ar': s_dict['ar'], 'ad': s_dict['ad'], 'gmax': s_dict['gmax']})
         self.cond = synapse_state
 
         _num_dendrite_cond = np.asarray(
-            [s_dict['num_dendrites_cond'][i] for i in s_dict['id']],\
+            [s_dict['num_dendrites_cond'][i] for i in s_dict['id'][::self.batch]],\
             dtype=np.int32).flatten()
         _num_dendrite = np.asarray(
-            [s_dict['num_dendrites_I'][i] for i in s_dict['id']],\
+            [s_dict['num_dendrites_I'][i] for i in s_dict['id'][::self.batch]],\
             dtype=np.int32).flatten()
 
         self._cum_num_dendrite = garray.to_gpu(_0_cumsum(_num_dendrite))
@@ -191,10 +207,21 @@ class AlphaSynapsePre(BaseSynapse):
         #self._update_I_cond = self._get_update_I_cond_func()
         self._update_I_non_cond = self._get_update_I_non_cond_func()
         self.update = self._get_gpu_kernel()
+        self.spike_update = self._get_fanout_kernel()
 
     @property
     def synapse_class(self): return int(0)
 
+    @classmethod
+    def estimate_memory(cls, s_dict, dt, dtype=np.float64):
+        # The inputs from other synapses are only known once the LPU has
+        # processed the connectivity and are not included:
+        num = len(s_dict['id'])
+        return {'model': GPUPackedArrays.block_nbytes(6, num) + 8*num,
+                'connectivity': fanout_nbytes(s_dict['pre'], dt,
+                                              s_dict.get('delay')) + \
+                                16*num + 8}
+
     def update_state(self, buffer, st = None):
         self.update.prepared_async_call(
             self.gpu_grid,\
@@ -202,16 +229,26 @@ class AlphaSynapsePre(BaseSynapse):
             st,\
             self.num,\
             self.dt,\
-            buffer.spike_buffer.gpudata,\
-            self.pre.gpudata,\
-            self.ar.gpudata,\
-            self.ad.gpudata,\
-            self.gmax.gpudata,\
-            self.a0.gpudata,\
-            self.a1.gpudata,\
-            self.a2.gpudata,\
-            self.I.gpudata,\
+            self.block.ptr(),\
+            self.block.ld,\
             self.cond)
+        self.spike_update.prepared_async_call(
+            self.fanout_grid,\
+            self.fanout_block,\
+            st,\
+            self.num_pre,\
+            self.batch,\
+            buffer.spike_buffer.gpudata,\
+            buffer.spike_buffer.ld,\
+            buffer.spike_delay_steps,\
+            buffer.spike_current,\
+            self.fanout_delay.gpudata,\
+            self.fanout_ptr.gpudata,\
+            self.fanout_syn.gpudata,\
+            self.block.ptr('ar'),\
+            self.block.ptr('ad'),\
+            self.block.ptr('a1'),\
+            self.I.gpudata)
 
     def update_I(self, synapse_state, st=None):
         self.I.fill(0.)
@@ -231,29 +268,44 @@ class AlphaSynapsePre(BaseSynapse):
         self.gpu_grid = (min( 6*cuda.Context.get_device().MULTIPROCESSOR_COUNT,\
                               (self.num-1)/self.gpu_block[0] + 1), 1)
         # cuda_src = open('./alpha_synapse.cu','r')
-        mod = SourceModule( \
-                cuda_src_synapse_kernel % {"type": dtype_to_ctype(np.float64)},\
-                            options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule( \
+                    cuda_src_synapse_kernel % {"type": dtype_to_ctype(np.float64),
+                                               "ar": self.block.row('ar'),
+                                               "ad": self.block.row('ad'),
+                                               "gmax": self.block.row('gmax'),
+                                               "a0": self.block.row('a0'),
+                                               "a1": self.block.row('a1'),
+                                               "a2": self.block.row('a2')},\
+                                options=self.compile_options)
         func = mod.get_function("alpha_synapse")
-        func.prepare('idPPPPPPPPPP')
+        func.prepare('idPiP')
 #                     [np.int32,   # syn_num
 #                      np.float64, # dt
-#                      np.intp,    # spike list
-#                      np.intp,    # pre-synaptic neuron list
-#                      np.intp,    # ar array
-#                      np.intp,    # ad array
-#                      np.intp,    # gmax array
-#                      np.intp,    # a0 array
-#                      np.intp,    # a1 array
-#                      np.intp,    # a2 array
-#                      np.intp,    # pre-synaptic input
+#                      np.intp,    # block; packed ar, ad, gmax, a0, a1, a2
+#                      np.int32,   # ld; row pitch of block
 #                      np.intp])   # cond array
         return func
 
+    def _get_fanout_kernel(self):
+        self.fanout_block = (128,1,1)
+        self.fanout_grid = fanout_grid(self.num_pre*self.batch,
+                                       self.fanout_delay.size,
+                                       self.fanout_block[0])
+        return get_fanout_func(
+            "alpha_synapse_spike",
+            "%(type)s *Ar, %(type)s *Ad, %(type)s *a1, %(type)s *I",
+            "a1[i] += Ar[i]*Ad[i]*exp(-I[i]); //NOTE: choose between exp and expf",
+            'PPPP',
+            block_size=self.fanout_block[0],
+            compile_options=self.compile_options)
+
     def _get_update_I_non_cond_func(self):
-        mod = SourceModule(\
-                cuda_src_synapse_update_I % {"num": self.num},
-                options = ["--ptxas-options=-v"])
+        with phase('kernel compilation'):
+            mod = SourceModule(\
+                    cuda_src_synapse_update_I % {"num": self.num,
+                                                 "batch": self.batch},
+                    options = ["--ptxas-options=-v"])
         func = mod.get_function("get_input")
         func.prepare('PPPPP')
 #                     [np.intp,  # synapse state
@@ -7,13 +7,17 @@ from pycuda.tools import dtype_to_ctype
 import pycuda.driver as cuda
 from pycuda.compiler import SourceModule
 
+from neurokernel.LPU.utils.profiling import phase
+
 cuda_src = """
 __global__ void dummy_synapse(
     %(type)s *buffer,
-    int buffer_ld,
-    int buffer_curr,
-    int buffer_delay_steps,
+    int *buffer_offset,
+    int *buffer_length,
+    long long buffer_curr,
+    %(type)s *V,
     int syn_num,
+    int batch,
     int *pre_neu_idx,
     int *delay,
     %(type)s *syn_state )
@@ -22,15 +26,25 @@ __global__ void dummy_synapse(
     int tot_threads = gridDim.x * blockDim.x;
     int pre;
     int dl;
+    int len;
     int col;
+    int b;
 
+    // the states of all trials of a synapse are adjacent and the
+    // connectivity is shared by the trials:
     for( int i=tid; i<syn_num; i+=tot_threads ){
-        dl = delay[i];
-        col = buffer_curr - dl;
-        if( col < 0 )
-            col += buffer_delay_steps;
-        pre = pre_neu_idx[i];
-        syn_state[i] = buffer[ col*buffer_ld+pre ];
+        dl = delay[i/batch];
+        pre = pre_neu_idx[i/batch];
+        b = i %% batch;
+        if( dl == 0 ){
+            syn_state[i] = V[pre*batch+b];
+        } else {
+            len = buffer_length[pre];
+            col = (buffer_curr - dl) %% len;
+            if( col < 0 )
+                col += len;
+            syn_state[i] = buffer[ (buffer_offset[pre]+col)*batch+b ];
+        }
     }
     return;
 }
@@ -46,11 +60,12 @@ class DummySynapse(BaseSynapse):
         self.debug = debug
         #self.dt = dt
         self.num = len( s_dict['id'] )
+        self.batch = s_dict.get('batch', 1)
 
         if s_dict.has_key( 'delay' ):
             self.delay = garray.to_gpu(np.round(np.asarray( s_dict['delay'])*1e-3/dt ).astype(np.int32) )
         else:
-            self.delay = garray.zeros( self.num, dtype=np.int32 )
+            self.delay = garray.zeros( self.num/self.batch, dtype=np.int32 )
 
         self.pre   = garray.to_gpu( np.asarray( s_dict['pre'], dtype=np.int32 ))
         self.state = synapse_state
@@ -66,10 +81,12 @@ class DummySynapse(BaseSynapse):
             self.gpu_block,\
             st,\
             buffer.gpot_buffer.gpudata,\
-            buffer.gpot_buffer.ld,
-            buffer.gpot_current,
-            buffer.gpot_delay_steps,
+            buffer.gpot_offset.gpudata,\
+            buffer.gpot_length.gpudata,\
+            buffer.gpot_current,\
+            buffer.gpot_state.gpudata,\
             self.num,\
+            self.batch,\
             self.pre.gpudata,\
             self.delay.gpudata,\
             self.state)
@@ -78,16 +95,19 @@ class DummySynapse(BaseSynapse):
         self.gpu_block = (128,1,1)
         self.gpu_grid = (min( 6*cuda.Context.get_device().MULTIPROCESSOR_COUNT,\
                               (self.num-1)/self.gpu_block[0] + 1), 1)
-        mod = SourceModule( \
-                cuda_src % {"type": dtype_to_ctype(np.float64)},\
-                            options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule( \
+                    cuda_src % {"type": dtype_to_ctype(np.float64)},\
+                                options=self.compile_options)
         func = mod.get_function("dummy_synapse")
-        func.prepare('PiiiiPPP')
+        func.prepare('PPPqPiiPPP')
 #                     [  np.intp,    # neuron state buffer
-#                        np.int32,   # buffer width
-#                        np.int32,   # buffer position
-#                        np.int32,   # buffer delay steps
+#                        np.intp,    # buffer offset of each neuron
+#                        np.intp,    # buffer length of each neuron
+#                        np.int64,   # buffer position
+#                        np.intp,    # neuron states
 #                        np.int32,   # syn_num
+#                        np.int32,   # batch
 #                        np.intp,    # pre-synaptic neuron list
 #                        np.intp,    # delay step
 #                        np.intp ] ) # cond array
@@ -10,39 +10,42 @@ from pycuda.tools import dtype_to_ctype
 import pycuda.driver as cuda
 from pycuda.compiler import SourceModule
 
+from neurokernel.LPU.utils.fanout import build_fanout, get_fanout_func, \
+    fanout_grid, fanout_nbytes
+from neurokernel.LPU.utils.packed import GPUPackedArrays
+from neurokernel.LPU.utils.profiling import phase
+
 cuda_src_synapse_kernel = """
+#define TAU  %(tau)d
+#define GMAX %(gmax)d
+#define EFF  %(eff)d
+#define INC  %(inc)d
+
 __global__ void exponential_synapse(
     int num,
     %(type)s dt,
-    int *spike,
-    int *Pre,
-    %(type)s *Tau,
-    %(type)s *A,
-    %(type)s *Gmax,
-    %(type)s *Eff,
+    %(type)s *block,
+    int ld,
     %(type)s *cond )
 {
     int tid = threadIdx.x + blockIdx.x*blockDim.x;
     int tot_threads = gridDim.x * blockDim.x;
-    int pre;
-    %(type)s a,tau,gmax,eff,d_eff;
+    %(type)s tau,gmax,eff,d_eff;
 
     for( int i=tid; i<num; i+=tot_threads ){
         // copy data from global memory to register
-        pre = Pre[i];
-        a = A[i];
-        tau = Tau[i];
-        eff = Eff[i];
-        gmax = Gmax[i];
-
-        // update the exponetial function
-        d_eff = -eff/tau;
-        if( spike[pre] )
-           d_eff += (1-eff)*a;
+        tau = block[TAU*ld + i];
+        eff = block[EFF*ld + i];
+        gmax = block[GMAX*ld + i];
+
+        // update the exponetial function; the INC row holds the
+        // spike-triggered term of the synapses whose presynaptic neuron spiked
+        d_eff = -eff/tau + block[INC*ld + i];
         eff += dt*d_eff;
 
         // copy data from register to the global memory
-        Eff[i] = eff;
+        block[EFF*ld + i] = eff;
+        block[INC*ld + i] = 0;
         cond[i] = eff*gmax;
     }
     return;
@@ -51,6 +54,7 @@ __global__ void exponential_synapse(
 cuda_src_synapse_update_I = """
 #define N 32
 #define NUM %(num)d
+#define BATCH %(batch)d
 
 __global__ void get_input(
     double* synapse,
@@ -74,14 +78,14 @@ __global__ void get_input(
         sid = bid * N + tidx;
         if(sid < NUM)
         {
-            num_den[tidx] = num_dendrite[sid];
+            num_den[tidx] = num_dendrite[sid / BATCH];
         }
     } else if(tidy == 1)
     {
         sid = bid * N + tidx;
         if(sid < NUM)
         {
-            den_start[tidx] = cum_num_dendrite[sid];
+            den_start[tidx] = cum_num_dendrite[sid / BATCH];
         }
     }
 
@@ -94,9 +98,11 @@ __global__ void get_input(
        int n_den = num_den[tidy];
        int start = den_start[tidy];
 
+       // the trials of a synapse share its inputs, whose states of all
+       // trials are adjacent
        for(int i = tidx; i < n_den; i += N)
        {
-           input[tidy][tidx] += synapse[pre[start + i]];
+           input[tidy][tidx] += synapse[pre[start + i]*BATCH + sid %% BATCH];
        }
     }
 
@@ -138,10 +144,16 @@ __global__ void get_input(
 }
 //can be improved
 """
-class ExpSynapse(BaseSynapse):
+class ExpSynapsePre(BaseSynapse):
     """
     Exponential Decay Synapse
     """
+
+    connectivity_attrs = ['fanout_delay', 'fanout_ptr', 'fanout_syn',
+                          '_cum_num_dendrite', '_cum_num_dendrite_cond',
+                          '_num_dendrite', '_num_dendrite_cond', '_pre',
+                          '_cond_pre', '_V_rev']
+
     def __init__(self, s_dict, synapse_state, dt, debug=False, cuda_verbose=False):
         if cuda_verbose:
             self.compile_options = ['--ptxas-options=-v']
@@ -151,19 +163,28 @@ class ExpSynapse(BaseSynapse):
         self.debug = debug
         self.dt = dt
         self.num = len( s_dict['id'] )
+        self.batch = s_dict.get('batch', 1)
 
-        self.pre  = garray.to_gpu( np.asarray( s_dict['pre'], dtype=np.int32 ))
-        self.a    = garray.to_gpu( np.asarray( s_dict['a'], dtype=np.float64 ))
-        self.tau  = garray.to_gpu( np.asarray( s_dict['tau'], dtype=np.float64 ))
-        self.gmax = garray.to_gpu( np.asarray( s_dict['gmax'], dtype=np.float64 ))
-        self.eff  = garray.zeros( (self.num,), dtype=np.float64 )
+        if 'delay' in s_dict:
+            delay = np.round(np.asarray(s_dict['delay'])*1e-3/dt).astype(np.int32)
+        else:
+            delay = None
+        ptr, syn, delays = build_fanout(s_dict['pre'], delay=delay)
+        self.num_pre = ptr.shape[1] - 1
+        self.fanout_delay = garray.to_gpu(delays)
+        self.fanout_ptr = garray.to_gpu(ptr)
+        self.fanout_syn = garray.to_gpu(syn)
+        # parameters and states are the rows of one packed block:
+        self.block = GPUPackedArrays(
+            ['a', 'tau', 'gmax', 'eff', 'inc'], self.num, np.float64,
+            {'a': s_dict['a'], 'tau': s_dict['tau'], 'gmax': s_dict['gmax']})
         self.cond = synapse_state
 
         _num_dendrite_cond = np.asarray(
-            [s_dict['num_dendrites_cond'][i] for i in s_dict['id']],\
+            [s_dict['num_dendrites_cond'][i] for i in s_dict['id'][::self.batch]],\
             dtype=np.int32).flatten()
         _num_dendrite = np.asarray(
-            [s_dict['num_dendrites_I'][i] for i in s_dict['id']],\
+            [s_dict['num_dendrites_I'][i] for i in s_dict['id'][::self.batch]],\
             dtype=np.int32).flatten()
 
         self._cum_num_dendrite = garray.to_gpu(_0_cumsum(_num_dendrite))
@@ -178,23 +199,46 @@ class ExpSynapse(BaseSynapse):
         self._update_I_non_cond = self._get_update_I_non_cond_func()
 
         self.update = self._get_gpu_kernel()
+        self.spike_update = self._get_fanout_kernel()
 
     @property
     def synapse_class(self): return int(0)
 
+    @classmethod
+    def estimate_memory(cls, s_dict, dt, dtype=np.float64):
+        # The inputs from other synapses are only known once the LPU has
+        # processed the connectivity and are not included:
+        num = len(s_dict['id'])
+        return {'model': GPUPackedArrays.block_nbytes(5, num) + 8*num,
+                'connectivity': fanout_nbytes(s_dict['pre'], dt,
+                                              s_dict.get('delay')) + \
+                                16*num + 8}
+
     def update_state(self, buffer, st = None):
+        self.spike_update.prepared_async_call(
+            self.fanout_grid,\
+            self.fanout_block,\
+            st,\
+            self.num_pre,\
+            self.batch,\
+            buffer.spike_buffer.gpudata,\
+            buffer.spike_buffer.ld,\
+            buffer.spike_delay_steps,\
+            buffer.spike_current,\
+            self.fanout_delay.gpudata,\
+            self.fanout_ptr.gpudata,\
+            self.fanout_syn.gpudata,\
+            self.block.ptr('a'),\
+            self.block.ptr('eff'),\
+            self.block.ptr('inc'))
         self.update.prepared_async_call(
             self.gpu_grid,\
             self.gpu_block,\
             st,\
             self.num,\
             self.dt,\
-            buffer.spike_buffer.gpudata,\
-            self.pre.gpudata,\
-            self.tau.gpudata,\
-            self.a.gpudata,\
-            self.gmax.gpudata,\
-            self.eff.gpudata,\
+            self.block.ptr(),\
+            self.block.ld,\
             self.cond)
 
     def update_I(self, synapse_state, st=None):
@@ -215,26 +259,42 @@ class ExpSynapse(BaseSynapse):
         self.gpu_grid = (min( 6*cuda.Context.get_device().MULTIPROCESSOR_COUNT,\
                               (self.num-1)/self.gpu_block[0] + 1), 1)
         # cuda_src = open('./alpha_synapse.cu','r')
-        mod = SourceModule( \
-                cuda_src_synapse_kernel % {"type": dtype_to_ctype(np.float64)},\
-                            options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule( \
+                    cuda_src_synapse_kernel % {"type": dtype_to_ctype(np.float64),
+                                               "tau": self.block.row('tau'),
+                                               "gmax": self.block.row('gmax'),
+                                               "eff": self.block.row('eff'),
+                                               "inc": self.block.row('inc')},\
+                                options=self.compile_options)
         func = mod.get_function("exponential_synapse")
-        func.prepare('idPPPPPPP')
+        func.prepare('idPiP')
 #                     [  np.int32,   # syn_num
 #                        np.float64, # dt
-#                        np.intp,    # spike list
-#                        np.intp,    # pre-synaptic neuron list
-#                        np.intp,    # tau; time constant
-#                        np.intp,    # a; bump size
-#                        np.intp,    # gmax array
-#                        np.intp,    # eff; efficacy
+#                        np.intp,    # block; packed tau, gmax, eff, inc
+#                        np.int32,   # ld; row pitch of block
 #                        np.intp ] ) # cond array
         return func
 
+    def _get_fanout_kernel(self):
+        self.fanout_block = (128,1,1)
+        self.fanout_grid = fanout_grid(self.num_pre*self.batch,
+                                       self.fanout_delay.size,
+                                       self.fanout_block[0])
+        return get_fanout_func(
+            "exponential_synapse_spike",
+            "%(type)s *A, %(type)s *Eff, %(type)s *Inc",
+            "Inc[i] = (1-Eff[i])*A[i];",
+            'PPP',
+            block_size=self.fanout_block[0],
+            compile_options=self.compile_options)
+
     def _get_update_I_non_cond_func(self):
-        mod = SourceModule(\
-                cuda_src_synapse_update_I % {"num": self.num},
-                           options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule(\
+                    cuda_src_synapse_update_I % {"num": self.num,
+                                                 "batch": self.batch},
+                               options=self.compile_options)
         func = mod.get_function("get_input")
         func.prepare('PPPPP')
 #                     [np.intp,  # synapse state
@@ -1,6 +1,24 @@
-import os
-import glob
+"""
+Synapse models.
 
-__all__ = [ os.path.basename(f)[:-3] for f in \
-            glob.glob(os.path.dirname(__file__)+"/*.py") if \
-            not '__init__' in os.path.basename(f)[:-3]]
+The model classes are imported on demand; use `get_model()` to look one up
+by name and `register()` to add models defined elsewhere.
+"""
+
+from neurokernel.LPU.utils.registry import ModelRegistry
+
+registry = ModelRegistry(
+    'neurokernel.LPU.synapses',
+    'neurokernel.LPU.synapses.basesynapse:BaseSynapse',
+    dict((name, 'neurokernel.LPU.synapses.%s:%s' % (name, name)) for name in
+         ['AlphaSynapse', 'AlphaSynapsePre', 'DummySynapse', 'ExpSynapse',
+          'ExpSynapsePre', 'power_gpot_gpot', 'power_gpot_gpot_sig']))
+
+register = registry.register
+
+def get_model(name):
+    """
+    Return the class of synapse model `name`.
+    """
+
+    return registry[name]
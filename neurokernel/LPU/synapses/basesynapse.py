@@ -1,8 +1,17 @@
 from abc import ABCMeta, abstractmethod, abstractproperty
 
+import numpy as np
+
+from neurokernel.LPU.utils.memory import attr_nbytes, object_nbytes
+from neurokernel.LPU.utils.params import get_param, set_param
+
 class BaseSynapse(object):
     __metaclass__ = ABCMeta
 
+    # Attributes holding the index arrays of the synapses, which
+    # memory_usage() reports as connectivity:
+    connectivity_attrs = ['pre', 'delay']
+
     def __init__(self, s_dict, synapse_state_pointer, dt, debug):
         '''
 
@@ -20,5 +29,76 @@ class BaseSynapse(object):
         pass
 
 
+    def set_params(self, values, inds=None):
+        '''
+        Change parameters in place; values maps parameter names to one value
+        per synapse (or per synapse in inds) or a scalar. inds holds the
+        indices of the synapses to change, in the order of the s_dict the
+        model was created with; all synapses are changed if it is None.
+
+        Parameters kept in a packed block (self.block) or in GPUArray
+        attributes named after them are supported; models that derive
+        other data from their parameters should override this method.
+        '''
+        for name, v in values.iteritems():
+            set_param(self, name, v, inds)
+
+
+    def get_params(self, names):
+        '''
+        Return the values of some parameters, as a dict mapping each name
+        in names to a copy of its values in the order used by set_params().
+        '''
+        return dict((name, get_param(self, name)) for name in names)
+
+
+    def get_state(self):
+        '''
+        Internal state of the synapses as a dict of numpy arrays; see
+        BaseNeuron.get_state().
+        '''
+        if hasattr(self, 'block'):
+            return {'block': self.block.get()}
+        return {}
+
+
+    def set_state(self, state):
+        '''
+        Restore the internal state returned by get_state().
+        '''
+        if 'block' in state:
+            self.block.set(state['block'])
+
+
+    @classmethod
+    def estimate_memory(cls, s_dict, dt, dtype=np.float64):
+        '''
+        Estimate the device memory (in bytes) that an instance of this model
+        would use for the synapses described by s_dict, before it is
+        created; s_dict['pre'] holds the positions of the presynaptic neurons
+        in the LPU's state arrays.
+
+        Returns a dict with the keys 'model', for the parameters and states,
+        and 'connectivity', for the index arrays listed in
+        connectivity_attrs.
+
+        The default assumes one array per numeric attribute in s_dict and an
+        integer array of presynaptic neurons and of delays; models that
+        allocate their arrays differently should override it.
+        '''
+        return {'model': attr_nbytes(s_dict, dtype),
+                'connectivity': 8*len(s_dict['pre'])}
+
+
+    def memory_usage(self):
+        '''
+        Return the device memory (in bytes) used by the arrays of this
+        object, split as by estimate_memory().
+        '''
+        connectivity = object_nbytes(self, self.connectivity_attrs)
+        return {'model': object_nbytes(self) - connectivity,
+                'connectivity': connectivity}
+
+
     def post_run(self):
-        pass
\ No newline at end of file
+        pass
@@ -7,6 +7,9 @@ from pycuda.tools import dtype_to_ctype
 import pycuda.driver as cuda
 from pycuda.compiler import SourceModule
 
+from neurokernel.LPU.utils.packed import GPUPackedArrays
+from neurokernel.LPU.utils.profiling import phase
+
 class power_gpot_gpot(BaseSynapse):
 
     def __init__(self, s_dict,synapse_state_pointer, dt, debug=False, cuda_verbose=False):
@@ -18,33 +21,43 @@ class power_gpot_gpot(BaseSynapse):
         self.debug = debug
         self.synapse_state_pointer = synapse_state_pointer
         self.pre = garray.to_gpu(np.asarray(s_dict['pre'], dtype = np.int32))
-        self.threshold = garray.to_gpu(np.asarray(s_dict['threshold'],
-                                                  dtype = np.double))
-        self.slope = garray.to_gpu(np.asarray(s_dict['slope'],
-                                                  dtype = np.double))
-        self.power = garray.to_gpu(np.asarray(s_dict['power'],
-                                                  dtype = np.double))
-        self.saturation = garray.to_gpu(np.asarray(s_dict['saturation'],
-                                                  dtype = np.double))
+        # parameters are the rows of one packed block:
+        self.block = GPUPackedArrays(
+            ['threshold', 'slope', 'power', 'saturation'],
+            len(s_dict['id']), np.float64,
+            dict((k, s_dict[k]) for k in
+                 ['threshold', 'slope', 'power', 'saturation']))
         self.delay = garray.to_gpu(np.round(np.asarray(s_dict['delay']) \
                                             * 1e-3 / dt).astype(np.int32))
         self.num_synapse = len(s_dict['id'])
+        self.batch = s_dict.get('batch', 1)
 
         self.update_func = self.get_update_func()
 
     @property
     def synapse_class(self): return int(3)
 
+    @classmethod
+    def estimate_memory(cls, s_dict, dt, dtype=np.float64):
+        num = len(s_dict['id'])
+        return {'model': GPUPackedArrays.block_nbytes(4, num),
+                'connectivity': 8*len(s_dict['pre'])}
+
 
     def update_state(self, buffer, st = None):
-        self.update_func.prepared_async_call(self.grid, self.block, st, buffer.gpot_buffer.gpudata, buffer.gpot_buffer.ld, buffer.gpot_current, buffer.gpot_delay_steps, self.pre.gpudata, self.synapse_state_pointer, self.threshold.gpudata, self.slope.gpudata, self.power.gpudata, self.saturation.gpudata, self.delay.gpudata)
+        self.update_func.prepared_async_call(self.gpu_grid, self.gpu_block, st, buffer.gpot_buffer.gpudata, buffer.gpot_offset.gpudata, buffer.gpot_length.gpudata, buffer.gpot_current, buffer.gpot_state.gpudata, self.pre.gpudata, self.synapse_state_pointer, self.block.ptr(), self.block.ld, self.delay.gpudata)
 
 
     def get_update_func(self):
         template = """
         #define N_synapse %(n_synapse)d
+        #define BATCH      %(batch)d
+        #define THRES      %(thres)d
+        #define SLOPE      %(slope)d
+        #define POWER      %(power)d
+        #define SATURATION %(saturation)d
 
-        __global__ void update_gpot_terminal_synapse(double* buffer, int buffer_ld, int current, int delay_steps, int* pre_neuron, double* conductance, double* thres, double* slope, double* power, double* saturation, int* delay)
+        __global__ void update_gpot_terminal_synapse(double* buffer, int* buffer_offset, int* buffer_length, long long current, double* V, int* pre_neuron, double* conductance, double* block, int ld, int* delay)
         {
             int tid = threadIdx.x + blockIdx.x * blockDim.x;
             int total_threads = gridDim.x * blockDim.x;
@@ -52,32 +65,49 @@ class power_gpot_gpot(BaseSynapse):
             int pre;
             double mem;
             int dl;
+            int len;
             int col;
+            int b;
 
+            // the states of all trials of a synapse are adjacent and the
+            // connectivity is shared by the trials:
             for(int i = tid; i < N_synapse; i += total_threads)
             {
-                pre = pre_neuron[i];
-                dl = delay[i];
-                col = current - dl;
-                if(col < 0)
+                pre = pre_neuron[i / BATCH];
+                dl = delay[i / BATCH];
+                b = i %% BATCH;
+                if(dl == 0)
                 {
-                    col = delay_steps + col;
+                    mem = V[pre*BATCH + b];
+                } else
+                {
+                    len = buffer_length[pre];
+                    col = (current - dl) %% len;
+                    if(col < 0)
+                    {
+                        col = len + col;
+                    }
+                    mem = buffer[(buffer_offset[pre] + col)*BATCH + b];
                 }
 
-                mem = buffer[col * buffer_ld + pre];
-
-                conductance[i] = fmin(saturation[i], slope[i] * pow(fmax(0.0, mem - thres[i]), power[i]));
+                conductance[i] = fmin(block[SATURATION*ld + i], block[SLOPE*ld + i] * pow(fmax(0.0, mem - block[THRES*ld + i]), block[POWER*ld + i]));
             }
 
         }
         """
         #Used 14 registers, 64 bytes cmem[0], 4 bytes cmem[16]
-        mod = SourceModule(template % {"n_synapse": self.num_synapse},
-                           options=self.compile_options)
+        with phase('kernel compilation'):
+            mod = SourceModule(template % {"n_synapse": self.num_synapse,
+                                          "batch": self.batch,
+                                          "thres": self.block.row('threshold'),
+                                          "slope": self.block.row('slope'),
+                                          "power": self.block.row('power'),
+                                          "saturation": self.block.row('saturation')},
+                               options=self.compile_options)
         func = mod.get_function("update_gpot_terminal_synapse")
-        func.prepare('PiiiPPPPPPP')
-        #[np.intp, np.int32, np.int32, np.int32, np.intp,
-        # np.intp, np.intp, np.intp, np.intp, np.intp, np.intp])
-        self.block = (256,1,1)
-        self.grid = (min(6 * cuda.Context.get_device().MULTIPROCESSOR_COUNT, (self.num_synapse-1) / 256 + 1), 1)
+        func.prepare('PPPqPPPPiP')
+        #[np.intp, np.intp, np.intp, np.int64, np.intp, np.intp,
+        # np.intp, np.intp, np.int32, np.intp])
+        self.gpu_block = (256,1,1)
+        self.gpu_grid = (min(6 * cuda.Context.get_device().MULTIPROCESSOR_COUNT, (self.num_synapse-1) / 256 + 1), 1)
         return func
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+"""
+Streaming analysis of LPU output files.
+
+The output files written by an LPU, i.e. `<name>_spike.h5` and
+`<name>_gpot.h5`, store one row per time step and one column per neuron, in
+the order of the neuron ids. The statistics computed here read such files
+in chunks of time steps, so that the memory used does not depend on the
+length of the simulation; the neurons can also be split into blocks that are
+processed in parallel by a pool of processes.
+
+Examples
+--------
+>>> out = OutputFile('generic_output_spike.h5', 1e-4)
+>>> rates = out.firing_rates()
+>>> edges, rate = out.psth(0.01)
+>>> counts, edges = out.isi_histogram(np.linspace(0, 0.1, 51))
+"""
+
+import multiprocessing
+
+import h5py
+import numpy as np
+
+class OutputFile(object):
+    """
+    Statistics of the data in an LPU output file.
+
+    Parameters
+    ----------
+    filename : str
+        HDF5 file written by an LPU.
+    dt : float
+        Time step of the simulation (s).
+    neurons : list of int
+        Neurons to analyze, given as column indices into the file; defaults
+        to all neurons in the file.
+    start, stop : int
+        Range of time steps to analyze; defaults to all steps.
+    max_memory : int
+        Maximum number of bytes of data read at once by each process.
+    processes : int
+        If greater than 1, the neurons are split into this many blocks that
+        are processed by a pool of processes.
+    dataset : str
+        Name of the dataset holding the data.
+    """
+
+    def __init__(self, filename, dt, neurons=None, start=0, stop=None,
+                 max_memory=2**26, processes=None, dataset='/array'):
+        self.filename = filename
+        self.dt = dt
+        self.max_memory = max_memory
+        self.processes = processes
+        self.dataset = dataset
+        with h5py.File(filename, 'r') as f:
+            num_steps, num_neurons = f[dataset].shape
+        if neurons is None:
+            neurons = np.arange(num_neurons)
+        self.neurons = np.asarray(neurons, dtype=np.int64)
+        self.num_neurons = num_neurons
+        self.start = start
+        self.stop = num_steps if stop is None else min(stop, num_steps)
+        if self.stop <= self.start:
+            raise ValueError('no time steps to analyze')
+
+    @property
+    def duration(self):
+        """
+        Length of the analyzed data (s).
+        """
+
+        return (self.stop-self.start)*self.dt
+
+    def _chunks(self, neurons):
+        """
+        Iterate over the data of `neurons` in chunks of time steps.
+
+        Yields the first step of each chunk and the data of the chunk, with
+        one row per step and one column per neuron.
+        """
+
+        cols, inv = np.unique(neurons, return_inverse=True)
+        rows = max(1, self.max_memory // (8*max(len(cols), 1)))
+
+        # h5py reads a slice of columns much faster than a list:
+        if len(cols) and cols[-1]-cols[0]+1 == len(cols):
+            index = slice(int(cols[0]), int(cols[-1])+1)
+        else:
+            index = cols.tolist()
+        with h5py.File(self.filename, 'r') as f:
+            d = f[self.dataset]
+            for t in xrange(self.start, self.stop, rows):
+                block = d[t:min(t+rows, self.stop), index]
+                yield t, np.asarray(block, dtype=np.float64)[:, inv]
+
+    def _map(self, func, items, *args):
+        """
+        Apply method `func` to blocks of `items`.
+
+        Returns the list of results, one per block; the blocks are processed
+        by a process pool if `processes` is greater than 1.
+        """
+
+        if not self.processes or self.processes == 1 or len(items) < 2:
+            return [getattr(self, func)(items, *args)]
+        blocks = np.array_split(items, min(self.processes, len(items)))
+        pool = multiprocessing.Pool(len(blocks))
+        try:
+            return pool.map(_apply, [(self, func, b, args) for b in blocks])
+        finally:
+            pool.close()
+            pool.join()
+
+    def spike_counts(self):
+        """
+        Number of spikes of each neuron.
+        """
+
+        return np.concatenate(self._map('_spike_counts', self.neurons))
+
+    def _spike_counts(self, neurons):
+        counts = np.zeros(len(neurons))
+        for t, block in self._chunks(neurons):
+            counts += block.sum(0)
+        return counts
+
+    def firing_rates(self):
+        """
+        Mean firing rate of each neuron (Hz).
+        """
+
+        return self.spike_counts()/self.duration
+
+    def psth(self, bin_width, onsets=None, window=None):
+        """
+        Peri-stimulus time histogram of the neurons.
+
+        The spikes of all neurons are counted in bins following each
+        stimulus onset and averaged over onsets and neurons.
+
+        Parameters
+        ----------
+        bin_width : float
+            Width of the bins (s).
+        onsets : list of float
+            Times of the stimulus onsets (s); defaults to the start of the
+            analyzed data.
+        window : float
+            Length of the histogram (s); defaults to the time from the last
+            onset to the end of the analyzed data.
+
+        Returns
+        -------
+        edges : numpy.ndarray
+            Edges of the bins relative to the onsets (s).
+        rate : numpy.ndarray
+            Mean firing rate in each bin (Hz).
+        """
+
+        bin_steps = max(1, int(round(bin_width/self.dt)))
+        if onsets is None:
+            onsets = [self.start]
+        else:
+            onsets = [int(round(o/self.dt)) for o in onsets]
+        if window is None:
+            window_steps = self.stop-max(onsets)
+        else:
+            window_steps = int(round(window/self.dt))
+        num_bins = window_steps // bin_steps
+        if num_bins < 1:
+            raise ValueError('window shorter than one bin')
+        if min(onsets) < self.start or \
+           max(onsets)+num_bins*bin_steps > self.stop:
+            raise ValueError('window after onset exceeds analyzed data')
+
+        counts = sum(self._map('_psth_counts', self.neurons, onsets,
+                               num_bins, bin_steps))
+        edges = np.arange(num_bins+1)*bin_steps*self.dt
+        return edges, counts/(len(onsets)*len(self.neurons)*bin_steps*self.dt)
+
+    def _psth_counts(self, neurons, onsets, num_bins, bin_steps):
+        counts = np.zeros(num_bins)
+        for t, block in self._chunks(neurons):
+            total = block.sum(1)
+            steps = np.arange(t, t+len(total))
+            for onset in onsets:
+                rel = steps-onset
+                mask = (rel >= 0) & (rel < num_bins*bin_steps)
+                if np.any(mask):
+                    counts += np.bincount(rel[mask] // bin_steps,
+                                          weights=total[mask],
+                                          minlength=num_bins)
+        return counts
+
+    def isi_histogram(self, bins):
+        """
+        Histogram of the interspike intervals of all neurons.
+
+        Parameters
+        ----------
+        bins : list of float
+            Edges of the bins (s).
+
+        Returns
+        -------
+        counts : numpy.ndarray
+            Number of intervals in each bin.
+        edges : numpy.ndarray
+            Edges of the bins (s).
+        """
+
+        bins = np.asarray(bins, dtype=np.float64)
+        return sum(self._map('_isi_counts', self.neurons, bins)), bins
+
+    def _isi_counts(self, neurons, bins):
+        counts = np.zeros(len(bins)-1, dtype=np.int64)
+
+        # Step of the last spike of each neuron in the preceding chunks:
+        last = -np.ones(len(neurons), dtype=np.int64)
+        for t, block in self._chunks(neurons):
+            steps, cols = np.nonzero(block)
+            if not len(steps):
+                continue
+            order = np.lexsort((steps, cols))
+            steps = steps[order]+t
+            cols = cols[order]
+            first = np.r_[True, cols[1:] != cols[:-1]]
+            prev = np.r_[-1, steps[:-1]]
+            prev[first] = last[cols[first]]
+            counts += np.histogram((steps-prev)[prev >= 0]*self.dt, bins)[0]
+            final = np.r_[cols[1:] != cols[:-1], True]
+            last[cols[final]] = steps[final]
+        return counts
+
+    def mean_var(self):
+        """
+        Mean and variance of the trace of each neuron.
+
+        Returns
+        -------
+        mean, var : numpy.ndarray
+            Mean and variance of each neuron.
+        """
+
+        results = self._map('_moments', self.neurons)
+        return np.concatenate([r[0] for r in results]), \
+            np.concatenate([r[1] for r in results])
+
+    def _moments(self, neurons):
+        n = 0
+        mean = np.zeros(len(neurons))
+        m2 = np.zeros(len(neurons))
+
+        # Chunk statistics are merged as in Chan et al.'s pairwise algorithm:
+        for t, block in self._chunks(neurons):
+            k = block.shape[0]
+            block_mean = block.mean(0)
+            delta = block_mean-mean
+            mean += delta*k/(n+k)
+            m2 += ((block-block_mean)**2).sum(0)+delta**2*n*k/(n+k)
+            n += k
+        return mean, m2/n
+
+    def cross_correlation(self, pairs, max_lag):
+        """
+        Cross-correlation of the traces of pairs of neurons.
+
+        For each pair `(i, j)`, the correlation at lag `k` is the sum over
+        all steps `t` of `x_i[t]*x_j[t+k]`; for spike trains, this is the
+        number of spikes of `j` that follow a spike of `i` by `k` steps.
+
+        Parameters
+        ----------
+        pairs : list of tuple of int
+            Pairs of neurons, given as column indices into the file.
+        max_lag : float
+            Largest lag (s).
+
+        Returns
+        -------
+        lags : numpy.ndarray
+            Lags (s).
+        corr : numpy.ndarray
+            Correlation of each pair at each lag.
+        """
+
+        pairs = np.asarray(pairs, dtype=np.int64).reshape((-1, 2))
+        L = int(round(max_lag/self.dt))
+        corr = np.concatenate(self._map('_cross_correlation', pairs, L))
+        return np.arange(-L, L+1)*self.dt, corr
+
+    def _cross_correlation(self, pairs, L):
+        cols = np.unique(pairs)
+        pos = np.searchsorted(cols, pairs)
+        corr = np.zeros((len(pairs), 2*L+1))
+
+        # The last L steps of the preceding chunks are kept so that every
+        # pair of steps is counted once, in the chunk of its later step:
+        tail = np.zeros((0, len(cols)))
+        for t, block in self._chunks(cols):
+            ext = np.vstack((tail, block))
+            m, end = len(tail), len(ext)
+            x_i = ext[:, pos[:, 0]]
+            x_j = ext[:, pos[:, 1]]
+            for k in xrange(-L, L+1):
+                lo = max(m, abs(k))
+                if lo >= end:
+                    continue
+                if k >= 0:
+                    corr[:, k+L] += (x_i[lo-k:end-k]*x_j[lo:end]).sum(0)
+                else:
+                    corr[:, k+L] += (x_i[lo:end]*x_j[lo+k:end+k]).sum(0)
+            tail = ext[max(0, end-L):]
+        return corr
+
+def _apply(args):
+    obj, func, items, extra = args
+    return getattr(obj, func)(items, *extra)
@@ -0,0 +1,184 @@
+"""
+Presynaptic fan-out index for spike-triggered synapse models.
+
+Rather than having every synapse poll the state of its presynaptic neuron at
+each step, the spiking neurons are compacted into a list and only the
+synapses they drive are updated. Synapses are grouped by delay; each group
+reads the row of the spike history buffer written that many steps earlier.
+
+The trials of a batched LPU share the index: the spike of trial `b` of
+presynaptic neuron `k` is bit `k*batch + b` of a row and the state of trial
+`b` of synapse `i` is at position `i*batch + b`.
+"""
+
+import numpy as np
+
+from profiling import phase
+
+fanout_src = """
+#define BLOCK %(block)d
+
+__global__ void %(name)s(
+    int num_pre,
+    int batch,
+    unsigned int *spike,
+    int ld,
+    int num_rows,
+    int current,
+    int *fanout_delay,
+    int *fanout_ptr,
+    int *fanout_syn%(args)s)
+{
+    __shared__ int spk_list[BLOCK];
+    __shared__ int spk_count;
+
+    int nid = threadIdx.x + blockIdx.x*blockDim.x;
+    int i, j, k, b, pre, stop;
+
+    // each row of the grid handles the synapses sharing one delay
+    int row = current - fanout_delay[blockIdx.y];
+    if( row < 0 )
+        row += num_rows;
+    spike += row*ld;
+    fanout_ptr += blockIdx.y*(num_pre+1);
+
+    // compact the spiking neurons handled by this block into a list
+    if( threadIdx.x == 0 )
+        spk_count = 0;
+    __syncthreads();
+
+    // spike states are packed 32 neurons per word, the trials of each
+    // neuron being adjacent
+    if( nid < num_pre*batch && (spike[nid >> 5] >> (nid & 31)) & 1 )
+        spk_list[atomicAdd(&spk_count, 1)] = nid;
+    __syncthreads();
+
+    // only visit the synapses driven by the neurons that spiked
+    for( k=0; k<spk_count; ++k ){
+        pre = spk_list[k] / batch;
+        b = spk_list[k] %% batch;
+        stop = fanout_ptr[pre+1];
+        for( j=fanout_ptr[pre]+threadIdx.x; j<stop; j+=blockDim.x ){
+            i = fanout_syn[j]*batch + b;
+            %(inc)s
+        }
+    }
+    return;
+}
+"""
+
+def build_fanout(pre, num_pre=None, delay=None):
+    """
+    Build the presynaptic fan-out index of a set of synapses.
+
+    Parameters
+    ----------
+    pre : array_like of int
+        Index of the presynaptic neuron of each synapse.
+    num_pre : int
+        Number of presynaptic neurons to index. Defaults to `max(pre)+1`.
+    delay : array_like of int
+        Delay (in steps) of each synapse. Defaults to 0.
+
+    Returns
+    -------
+    ptr : numpy.ndarray of int32
+        Array of shape `(len(delays), num_pre+1)`; the synapses with delay
+        `delays[g]` driven by presynaptic neuron `k` are
+        `syn[ptr[g,k]:ptr[g,k+1]]`.
+    syn : numpy.ndarray of int32
+        Synapse indices grouped by delay and presynaptic neuron.
+    delays : numpy.ndarray of int32
+        Distinct synaptic delays.
+    """
+
+    pre = np.asarray(pre, dtype=np.int32)
+    if num_pre is None:
+        num_pre = int(pre.max())+1 if pre.size else 0
+    if delay is None:
+        delay = np.zeros(pre.size, np.int32)
+    delay = np.asarray(delay, dtype=np.int32)
+    delays, group = np.unique(delay, return_inverse=True)
+    if delays.size == 0:
+        delays = np.zeros(1, np.int32)
+    key = group*num_pre + pre
+    syn = np.argsort(key, kind='mergesort').astype(np.int32)
+    ptr = np.zeros((delays.size, num_pre+1), np.int32)
+    ptr[:, 1:] = np.cumsum(np.bincount(
+        key, minlength=delays.size*num_pre)).reshape(delays.size, num_pre)
+    ptr[1:, 0] = ptr[:-1, -1]
+    return ptr, syn, delays.astype(np.int32)
+
+def fanout_nbytes(pre, dt, delay=None):
+    """
+    Size (in bytes) of the fan-out index of a set of synapses.
+
+    Parameters
+    ----------
+    pre : array_like of int
+        Index of the presynaptic neuron of each synapse.
+    dt : float
+        Time step (s).
+    delay : array_like of float
+        Delay (in ms) of each synapse. Defaults to 0.
+    """
+
+    if delay is not None:
+        delay = np.round(np.asarray(delay)*1e-3/dt).astype(np.int32)
+    return sum(a.nbytes for a in build_fanout(pre, delay=delay))
+
+def get_fanout_func(name, args, inc, arg_types, dtype=np.float64,
+                    block_size=128, compile_options=[]):
+    """
+    Compile a kernel that applies a spike-triggered update to the synapses
+    driven by the neurons that spiked.
+
+    Parameters
+    ----------
+    name : str
+        Kernel name.
+    args : str
+        Declaration of the model-specific kernel arguments, e.g.
+        `'%(type)s *a1'`.
+    inc : str
+        Code applied to synapse `i` when its presynaptic neuron spiked.
+    arg_types : str
+        Argument types of the model-specific arguments in the format accepted
+        by `pycuda.driver.Function.prepare`.
+    dtype : numpy.dtype
+        Floating point type substituted for `%(type)s` in `args` and `inc`.
+    block_size : int
+        Number of presynaptic neurons compacted by each thread block.
+
+    Returns
+    -------
+    func : pycuda.driver.Function
+        Prepared kernel taking the number of presynaptic neurons and of
+        trials, the bit-packed spike history buffer, its row pitch (in words), number of
+        rows and current row, the fan-out delays and index arrays and the
+        model arguments.
+    """
+
+    from pycuda.tools import dtype_to_ctype
+    from pycuda.compiler import SourceModule
+
+    ctype = {'type': dtype_to_ctype(dtype)}
+    with phase('kernel compilation'):
+        mod = SourceModule(
+            fanout_src % {'name': name,
+                          'block': block_size,
+                          'args': ''.join(',\n    '+a.strip() % ctype
+                                          for a in args.split(',')),
+                          'inc': inc % ctype},
+            options=compile_options)
+    func = mod.get_function(name)
+    func.prepare('iiPiiiPPP'+arg_types)
+    return func
+
+def fanout_grid(num_pre, num_delays=1, block_size=128):
+    """
+    Grid used to launch a kernel returned by `get_fanout_func`; `num_pre`
+    counts the presynaptic neurons of all trials.
+    """
+
+    return (max(num_pre-1, 0)//block_size + 1, num_delays)
@@ -0,0 +1,83 @@
+"""
+Accounting of the device memory used by LPUs.
+
+The functions here compute the sizes of the device arrays allocated by LPU
+components, either from the arrays themselves or from the dimensions they
+would be allocated with; see `LPU.estimate_memory` and `LPU.memory_usage`.
+"""
+
+import numbers
+
+import numpy as np
+
+from packed import GPUPackedArrays
+
+# Attributes of the neuron and synapse dictionaries that describe the
+# structure of the LPU rather than per-element parameters of a model:
+STRUCTURE_ATTRS = set(['id', 'name', 'selector', 'spiking', 'public',
+                       'extern', 'class', 'pre', 'post', 'conductance',
+                       'reverse', 'delay', 'cond_pre', 'cond_post', 'I_pre',
+                       'I_post', 'num_dendrites_cond', 'num_dendrites_I',
+                       'batch'])
+
+def device_nbytes(value):
+    """
+    Device memory (in bytes) held by `value`.
+
+    GPU arrays, pitched arrays and packed blocks are counted; any other value
+    holds no device memory.
+    """
+
+    if isinstance(value, GPUPackedArrays):
+        value = value.data
+    if hasattr(value, 'gpudata') and hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return 0
+
+def object_nbytes(obj, names=None):
+    """
+    Device memory (in bytes) held by the attributes of `obj`.
+
+    Parameters
+    ----------
+    obj : object
+        Object holding device arrays, e.g. a neuron or synapse model instance.
+    names : list of str
+        Attributes to count; defaults to all attributes of `obj`.
+    """
+
+    if names is None:
+        names = vars(obj).keys()
+    return sum(device_nbytes(getattr(obj, n, None)) for n in names)
+
+def pitched_nbytes(rows, cols, dtype):
+    """
+    Size (in bytes) of a 2D `parray.PitchArray` of shape `(rows, cols)`.
+
+    The pitch chosen by the driver is not known before allocation; like
+    `parray.PitchArray`, rows are assumed to be padded to 512 bytes.
+    """
+
+    itemsize = np.dtype(dtype).itemsize
+    if rows*cols == 0:
+        return 0
+    if rows == 1 or cols == 1:
+        return rows*cols*itemsize
+    return rows*int(np.ceil(cols*itemsize/512.0))*512
+
+def attr_nbytes(d, dtype=np.float64):
+    """
+    Size (in bytes) of one array per numeric per-element attribute of the
+    neuron or synapse dictionary `d`, i.e. of its model parameters and
+    initial states.
+    """
+
+    num = len(d['id'])
+    count = 0
+    for k, v in d.iteritems():
+        if k in STRUCTURE_ATTRS or not len(v):
+            continue
+        first = v[0]
+        if isinstance(first, numbers.Number) and not isinstance(first, bool):
+            count += 1
+    return count*num*np.dtype(dtype).itemsize
@@ -0,0 +1,498 @@
+"""
+Declarative neuron model definitions.
+
+A `ModelSpec` describes a model by its state variables, parameters and
+update equations. Both the CUDA kernel used by the LPU and a vectorized NumPy
+implementation of the model are generated from the same description, so that
+optimizations such as parameter folding apply to every model defined this way.
+
+Equations are written as expressions in the common subset of C and Python:
+arithmetic, comparisons and the functions listed in `functions`. Integer
+literals should be written as floats wherever Python 2 would otherwise
+perform an integer division.
+"""
+
+import re
+
+import numpy as np
+
+from neurokernel.LPU.utils.params import split_params
+from neurokernel.LPU.utils.packed import PackedArrays
+from neurokernel.LPU.utils import philox
+
+# Math functions available in the equations and their NumPy counterparts:
+functions = {'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt, 'cbrt': np.cbrt,
+             'pow': np.power, 'tanh': np.tanh, 'cosh': np.cosh,
+             'sinh': np.sinh, 'fabs': np.fabs, 'fmax': np.fmax,
+             'fmin': np.fmin}
+
+# Names used by the generated kernels:
+reserved = ['nid', 'num_neurons', 'dt', 'nsteps', 'step', 'spk', 'spiked',
+            'I', 'I_pre', 'noise_seed', 'noise_step', 'noise_ids', 'noise_id',
+            'noise_scale']
+
+class ModelSpec(object):
+    """
+    Declarative description of a neuron model.
+
+    Each integration step evaluates `intermediates` in order, advances the
+    states in `ode` with a forward Euler step computed from the values at
+    the start of the step, applies `update` in order and finally, if the
+    `spike` condition holds, applies `reset` in order.
+
+    Parameters
+    ----------
+    name : str
+        Name of the generated kernel.
+    states : list of (str, str)
+        State variables and the key of their initial values in `n_dict`.
+    params : list of str
+        Parameters given per neuron in `n_dict`.
+    constants : dict
+        Constants shared by all neurons of the model.
+    derived : list of (str, str)
+        Constants computed once at initialization from the parameters,
+        constants and integration step `dt`, in order.
+    intermediates : list of (str, str)
+        Quantities computed at the start of each integration step.
+    ode : list of (str, str)
+        Right hand side of the differential equation of each state.
+    update : list of (str, str)
+        Explicit updates of states.
+    spike : str
+        Spike condition; None for graded potential models.
+    reset : list of (str, str)
+        State updates applied to neurons that spiked.
+    output : str
+        State holding the membrane potential.
+    substep : float
+        Longest integration step (in s); the LPU time step is divided into
+        as many integration steps as needed. Defaults to the LPU time step.
+    dt_scale : float
+        Factor converting the integration step from s to the time unit of
+        the equations.
+    noise : bool
+        If True, a white noise current whose intensity is given per neuron
+        by the parameter `noise` is added to the input current; see
+        `with_noise()`.
+
+    Notes
+    -----
+    Within equations, `I` denotes the input current of the neuron and `dt`
+    the integration step in the time unit of the equations.
+    """
+
+    def __init__(self, name, states, params=[], constants={}, derived=[],
+                 intermediates=[], ode=[], update=[], spike=None, reset=[],
+                 output='V', substep=None, dt_scale=1.0, noise=False):
+        self.name = name
+        self.states = list(states)
+        self.params = list(params)
+        self.constants = dict(constants)
+        self.derived = list(derived)
+        self.intermediates = list(intermediates)
+        self.ode = list(ode)
+        self.update = list(update)
+        self.spike = spike
+        self.reset = list(reset)
+        self.output = output
+        self.substep = substep
+        self.dt_scale = dt_scale
+        self.noise = noise
+        if noise and 'noise' not in self.params:
+            self.params.append('noise')
+
+        names = self.state_names + self.params + self.constants.keys() + \
+                [n for n, _ in self.derived + self.intermediates]
+        for n in names:
+            if n in reserved or n in functions:
+                raise ValueError('reserved name in model %s: %s' % (name, n))
+        if len(set(names)) != len(names):
+            raise ValueError('duplicate name in model %s' % name)
+        for n, _ in self.ode + self.update + self.reset:
+            if n not in self.state_names:
+                raise ValueError('%s is not a state of model %s' % (n, name))
+        if self.output not in self.state_names:
+            raise ValueError('%s is not a state of model %s' % (output, name))
+
+        self._code = {}
+        self._noisy = None
+
+    @property
+    def state_names(self):
+        return [n for n, _ in self.states]
+
+    @property
+    def spiking(self):
+        return self.spike is not None
+
+    def promote(self, names, name=None):
+        """
+        Return a copy of the model in which the given constants are instead
+        specified per neuron.
+        """
+
+        constants = dict(self.constants)
+        for n in names:
+            del constants[n]
+        return ModelSpec(name or self.name, self.states,
+                         self.params + list(names), constants, self.derived,
+                         self.intermediates, self.ode, self.update, self.spike,
+                         self.reset, self.output, self.substep, self.dt_scale,
+                         self.noise)
+
+    def with_noise(self):
+        """
+        Return a copy of the model with an additive noise current.
+
+        The noise current of neuron `i` at integration step `k` is
+        `noise/sqrt(dt)*philox.normal(seed, i, k)`, where `i` is the id of
+        the neuron, `k` counts the integration steps from the start of the
+        simulation and `dt` is the integration step in the time unit of the
+        equations. It is computed from these numbers alone, so the model
+        keeps no random number generator state.
+
+        The current is the Euler-Maruyama discretization of white noise of
+        intensity `noise`, in units of current times the square root of the
+        time unit: its integral over a time `T` has the standard deviation
+        `noise*sqrt(T)` whatever the integration step, so the effect of the
+        noise does not change with the LPU time step or `substep`.
+        """
+
+        if self.noise:
+            return self
+        if self._noisy is None:
+            self._noisy = ModelSpec(
+                self.name + '_noise', self.states, self.params,
+                self.constants, self.derived, self.intermediates, self.ode,
+                self.update, self.spike, self.reset, self.output,
+                self.substep, self.dt_scale, True)
+        return self._noisy
+
+    def num_substeps(self, dt):
+        """
+        Number of integration steps per time step `dt`.
+        """
+
+        if self.substep is None:
+            return 1
+        return max(int(round(dt / self.substep)), 1)
+
+    def step_size(self, dt):
+        """
+        Integration step in the time unit of the equations.
+        """
+
+        return dt / self.num_substeps(dt) * self.dt_scale
+
+    def _equations(self):
+        eqs = self.intermediates + self.ode + self.update + self.reset
+        exprs = [e for _, e in eqs]
+        if self.spiking:
+            exprs.append(self.spike)
+        return exprs
+
+    def _used_names(self):
+        used = set(['noise']) if self.noise else set()
+        for e in self._equations():
+            used.update(re.findall(r'[A-Za-z_]\w*', e))
+        return used
+
+    def kernel_params(self):
+        """
+        Parameters and derived constants read by the update equations.
+        """
+
+        used = self._used_names()
+        return [n for n in self.params + [d for d, _ in self.derived]
+                if n in used]
+
+    def derived_constants(self, n_dict, dt):
+        """
+        Evaluate the derived constants.
+
+        Parameters
+        ----------
+        n_dict : dict
+            Neuron parameters.
+        dt : float
+            LPU time step (in s).
+
+        Returns
+        -------
+        consts : dict
+            Maps the name of each derived constant to its value(s).
+        """
+
+        ns = dict(functions)
+        ns.update(self.constants)
+        for n in self.params:
+            ns[n] = np.asarray(n_dict[n], dtype=np.float64)
+        ns['dt'] = self.step_size(dt)
+        consts = {}
+        for n, e in self.derived:
+            ns[n] = consts[n] = eval(self._compile(e), ns)
+        return consts
+
+    def block_names(self, folded=()):
+        """
+        Rows of the packed block of a model instance: the states, except the
+        membrane potential of graded potential models which is kept by the
+        LPU, followed by the parameters and derived constants of
+        `kernel_params()` that are not in `folded`.
+        """
+
+        states = [n for n in self.state_names
+                  if self.spiking or n != self.output]
+        return states + [n for n in self.kernel_params() if n not in folded]
+
+    def cuda_src(self, literals, dtype=np.float64):
+        """
+        Generate the CUDA kernel of the model.
+
+        Parameters
+        ----------
+        literals : dict
+            Maps the parameters and derived constants of `kernel_params()`
+            that are shared by all neurons to the C literal of their value.
+            All the others are read from the packed block laid out as given
+            by `block_names(literals)`.
+        dtype : numpy.dtype
+            Floating point type of the states and parameters.
+
+        Returns
+        -------
+        src : str
+            Source of the kernel named `name`. Its arguments are those
+            described by `arg_types()`.
+        """
+
+        from pycuda.tools import dtype_to_ctype
+
+        t = dtype_to_ctype(dtype)
+        rows = dict((n, i) for i, n in enumerate(self.block_names(literals)))
+        def read(n):
+            if n in rows:
+                return 'block[%d*ld + nid]' % rows[n]
+            return 'g_%s[nid]' % n
+
+        args = ['int num_neurons', '%s dt' % t, 'int nsteps']
+        if self.spiking:
+            args.append('int *spk')
+        else:
+            args.append('%s *g_%s' % (t, self.output))
+        args += ['%s *I_pre' % t, '%s *block' % t, 'int ld']
+        if self.noise:
+            args += ['unsigned long long noise_seed',
+                     'unsigned long long noise_step',
+                     'unsigned int *noise_ids']
+
+        body = []
+        used = self._used_names()
+        for n, v in sorted(self.constants.items()):
+            if n not in used:
+                continue
+            body.append('const %s %s = ((%s)%r);' % (t, n, t, float(v)))
+        for n in self.kernel_params():
+            body.append('const %s %s = %s;' % (t, n, literals.get(n, read(n))))
+        for n in self.state_names:
+            body.append('%s %s = %s;' % (t, n, read(n)))
+        body.append('%s I = I_pre[nid];' % t)
+        if self.spiking:
+            body.append('int spiked = 0;')
+
+        step = []
+        if self.noise:
+            body.append('unsigned int noise_id = noise_ids[nid];')
+            body.append('const %s noise_scale = noise/sqrt(dt);' % t)
+            step.append('I = I_pre[nid] + noise_scale*philox_normal('
+                        'noise_seed, noise_id, noise_step + step);')
+        for n, e in self.intermediates:
+            step.append('%s %s = %s;' % (t, n, e))
+        for n, e in self.ode:
+            step.append('%s d_%s = %s;' % (t, n, e))
+        for n, _ in self.ode:
+            step.append('%s += dt*d_%s;' % (n, n))
+        for n, e in self.update:
+            step.append('%s = %s;' % (n, e))
+        if self.spiking:
+            step.append('if(%s)' % self.spike)
+            step.append('{')
+            step += ['    %s = %s;' % (n, e) for n, e in self.reset]
+            step.append('    spiked = 1;')
+            step.append('}')
+
+        store = ['%s = %s;' % (read(n), n) for n in self.state_names]
+        if self.spiking:
+            store.append('spk[nid] = spiked;')
+
+        return (philox.cuda_src if self.noise else '') + """
+__global__ void %(name)s(
+    %(args)s)
+{
+    int nid = threadIdx.x + blockIdx.x * blockDim.x;
+    if(nid >= num_neurons)
+        return;
+
+    %(body)s
+
+    for(int step = 0; step < nsteps; ++step)
+    {
+        %(step)s
+    }
+
+    %(store)s
+}
+""" % {'name': self.name,
+       'args': ',\n    '.join(args),
+       'body': '\n    '.join(body),
+       'step': '\n        '.join(step),
+       'store': '\n    '.join(store)}
+
+    def arg_types(self, dtype=np.float64):
+        """
+        Argument types of the generated kernel in the format accepted by
+        `pycuda.driver.Function.prepare`: the number of neurons, the
+        integration step, the number of integration steps, the spike states
+        (spiking models) or membrane potentials (graded potential models),
+        the input currents, the packed block and its row pitch. Models with
+        noise also take the seed, the index of the first integration step
+        and the neuron ids.
+        """
+
+        return 'i' + np.dtype(dtype).char + 'iPPPi' + \
+            ('QQP' if self.noise else '')
+
+    def _compile(self, expr):
+        if expr not in self._code:
+            self._code[expr] = compile(expr, '<%s>' % self.name, 'eval')
+        return self._code[expr]
+
+    def numpy_step(self, states, I, params, dt, nsteps=1, noise_seed=0,
+                   noise_step=0, noise_ids=None):
+        """
+        Advance the model with NumPy.
+
+        Parameters
+        ----------
+        states : dict
+            Maps each state to an array of per-neuron values; updated in
+            place.
+        I : numpy.ndarray
+            Input currents.
+        params : dict
+            Maps each name in `kernel_params()` to a scalar or an array of
+            per-neuron values.
+        dt : float
+            Integration step in the time unit of the equations.
+        nsteps : int
+            Number of integration steps.
+        noise_seed : int
+            Seed of the noise current (models with noise only).
+        noise_step : int
+            Index of the first integration step (models with noise only).
+        noise_ids : numpy.ndarray of int
+            Neuron ids (models with noise only).
+
+        Returns
+        -------
+        spk : numpy.ndarray of bool
+            Neurons that spiked during the steps; None for graded potential
+            models.
+        """
+
+        ns = dict(functions)
+        ns.update(self.constants)
+        ns.update(params)
+        ns.update(states)
+        ns['I'] = I
+        ns['dt'] = dt
+        spk = np.zeros(np.shape(I), np.bool) if self.spiking else None
+        if self.noise:
+            noise_scale = ns['noise']/np.sqrt(dt)
+        for k in xrange(nsteps):
+            if self.noise:
+                ns['I'] = I + noise_scale*philox.normal(
+                    noise_seed, noise_ids, noise_step+k)
+            for n, e in self.intermediates:
+                ns[n] = eval(self._compile(e), ns)
+            d = [(n, eval(self._compile(e), ns)) for n, e in self.ode]
+            for n, dx in d:
+                ns[n] = ns[n] + dt*dx
+            for n, e in self.update:
+                ns[n] = eval(self._compile(e), ns)
+            if self.spiking:
+                mask = eval(self._compile(self.spike), ns)
+                for n, e in self.reset:
+                    ns[n] = np.where(mask, eval(self._compile(e), ns), ns[n])
+                spk |= mask
+        for n in self.state_names:
+            states[n][...] = ns[n]
+        return spk
+
+class NumPyModel(object):
+    """
+    Vectorized NumPy implementation of a neuron model.
+
+    Parameters shared by all neurons are kept as scalars; the states and the
+    other parameters are the rows of a NumPy `PackedArrays` block.
+
+    Parameters
+    ----------
+    spec : ModelSpec
+        Model description.
+    n_dict : dict
+        Neuron parameters and initial states.
+    dt : float
+        LPU time step (in s).
+    seed : int
+        Seed of the noise current, which is added if `n_dict` has the
+        attribute `noise`; see `ModelSpec.with_noise()`.
+
+    Attributes
+    ----------
+    block : neurokernel.LPU.utils.packed.PackedArrays
+        States and per-neuron parameters.
+    states : dict
+        Maps each state to a view of its row of `block`.
+    I : numpy.ndarray
+        Input currents; to be set before each call to `eval()`.
+    spk : numpy.ndarray of int32
+        Spike states after the last call to `eval()` (spiking models only).
+    noise_step : int
+        Index of the next integration step, which selects the noise current.
+    """
+
+    def __init__(self, spec, n_dict, dt, seed=0):
+        if 'noise' in n_dict:
+            spec = spec.with_noise()
+        self.spec = spec
+        self.num_neurons = len(n_dict['id'])
+        self.dt = dt
+        self.steps = spec.num_substeps(dt)
+        self.ddt = spec.step_size(dt)
+
+        consts = dict(n_dict)
+        consts.update(spec.derived_constants(n_dict, dt))
+        self.uniform, varying = split_params(consts, spec.kernel_params())
+        values = dict((n, n_dict[key]) for n, key in spec.states)
+        values.update(varying)
+        self.block = PackedArrays(spec.state_names + varying.keys(),
+                                  self.num_neurons, np.float64, values)
+        self.states = dict((n, self.block[n]) for n in spec.state_names)
+        self.params = dict(self.uniform)
+        self.params.update((n, self.block[n]) for n in varying)
+        self.I = np.zeros(self.num_neurons, np.float64)
+        if spec.spiking:
+            self.spk = np.zeros(self.num_neurons, np.int32)
+        self.seed = seed
+        self.ids = np.asarray(n_dict['id'], np.uint32)
+        self.noise_step = 0
+
+    def eval(self):
+        spk = self.spec.numpy_step(self.states, self.I, self.params,
+                                   self.ddt, self.steps, self.seed,
+                                   self.noise_step, self.ids)
+        self.noise_step += self.steps
+        if spk is not None:
+            self.spk[:] = spk
@@ -0,0 +1,144 @@
+"""
+Packed structure-of-arrays storage of per-element model data.
+
+All the per-element parameters and states of a model object are stored as the
+rows of one contiguous 2D block, which is allocated and transferred at once.
+Kernels receive a single pointer to the block and its row pitch `ld`; the
+value of row `r` for element `i` is `block[r*ld + i]`.
+"""
+
+import numpy as np
+
+class PackedArrays(object):
+    """
+    Named per-element arrays stored as the rows of one NumPy 2D block.
+
+    Parameters
+    ----------
+    names : list of str
+        Names of the rows.
+    num : int
+        Number of elements.
+    dtype : numpy.dtype
+        Type of the values.
+    values : dict
+        Initial values of the rows, either scalars or arrays of length `num`;
+        rows not listed are set to zero.
+
+    Attributes
+    ----------
+    ld : int
+        Row pitch (in elements); rows start on 128 byte boundaries.
+    data : numpy.ndarray
+        Block of shape `(len(names), ld)`.
+    """
+
+    align = 128
+
+    def __init__(self, names, num, dtype=np.float64, values={}):
+        self.names = list(names)
+        self.rows = dict((n, i) for i, n in enumerate(self.names))
+        self.num = num
+        self.dtype = np.dtype(dtype)
+        self.ld = self.pitch(num, dtype)
+
+        host = np.zeros((max(len(self.names), 1), self.ld), self.dtype)
+        for n, v in values.iteritems():
+            host[self.rows[n], :num] = v
+        self._alloc(host)
+
+    @classmethod
+    def pitch(cls, num, dtype=np.float64):
+        """
+        Row pitch (in elements) of a block holding `num` elements per row.
+        """
+
+        step = max(cls.align // np.dtype(dtype).itemsize, 1)
+        return max((num-1) // step + 1, 1) * step
+
+    @classmethod
+    def block_nbytes(cls, num_rows, num, dtype=np.float64):
+        """
+        Size (in bytes) of a block of `num_rows` rows of `num` elements.
+        """
+
+        return max(num_rows, 1)*cls.pitch(num, dtype)*np.dtype(dtype).itemsize
+
+    def _alloc(self, host):
+        self.data = host
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def row(self, name):
+        """
+        Index of the row holding `name`.
+        """
+
+        return self.rows[name]
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def __getitem__(self, name):
+        """
+        Values of row `name`; a view for the NumPy variant.
+        """
+
+        return self.data[self.rows[name], :self.num]
+
+    def __setitem__(self, name, values):
+        self.data[self.rows[name], :self.num] = values
+
+    def get(self):
+        """
+        Copy of the whole block.
+        """
+
+        return self.data.copy()
+
+    def set(self, block):
+        """
+        Overwrite the whole block with a copy obtained with `get()`.
+        """
+
+        self.data[...] = block
+
+class GPUPackedArrays(PackedArrays):
+    """
+    Named per-element arrays stored as the rows of one GPU 2D block.
+
+    See `PackedArrays`; the block is a `pycuda.gpuarray.GPUArray`.
+    """
+
+    def _alloc(self, host):
+        import pycuda.gpuarray as garray
+        self.data = garray.to_gpu(host)
+
+    def ptr(self, name=None):
+        """
+        Device address of row `name`, or of the block if `name` is None.
+        """
+
+        if name is None:
+            return int(self.data.gpudata)
+        return int(self.data.gpudata) + \
+            self.rows[name]*self.ld*self.dtype.itemsize
+
+    def __getitem__(self, name):
+        import pycuda.driver as cuda
+        out = np.empty(self.num, self.dtype)
+        cuda.memcpy_dtoh(out, self.ptr(name))
+        return out
+
+    def __setitem__(self, name, values):
+        import pycuda.driver as cuda
+        cuda.memcpy_htod(self.ptr(name),
+                         np.asarray(values, self.dtype)*np.ones(self.num, self.dtype))
+
+    def get(self):
+        return self.data.get()
+
+    def set(self, block):
+        self.data.set(np.asarray(block, self.dtype))
@@ -0,0 +1,122 @@
+"""
+Folding of model parameters shared by every element of a model.
+
+Parameters that take the same value for every neuron (or synapse) handled by
+a model object are not uploaded to the GPU; they are compiled into the model
+kernel as literal constants instead, which saves device memory and one global
+load per parameter per step; see `SpecNeuron`. The parameters of live model
+instances are read and changed with `get_param()` and `set_param()`.
+"""
+
+import numpy as np
+
+from packed import PackedArrays
+
+def is_uniform(values):
+    """
+    Return True if all entries of `values` are the same finite number.
+    """
+
+    values = np.asarray(values)
+    return values.size > 0 and np.all(values == values.flat[0]) and \
+        np.all(np.isfinite(values.flat[0]))
+
+def c_literal(value, dtype=np.float64):
+    """
+    C literal of type `dtype` representing `value`.
+    """
+
+    from pycuda.tools import dtype_to_ctype
+
+    return '((%s)%r)' % (dtype_to_ctype(dtype), float(value))
+
+def split_params(n_dict, names, dtype=np.float64):
+    """
+    Separate parameters shared by all elements from per-element parameters.
+
+    Parameters
+    ----------
+    n_dict : dict
+        Parameters of the model; `n_dict[name]` holds one value per element
+        or a scalar.
+    names : list of str
+        Names of the parameters to consider.
+    dtype : numpy.dtype
+        Type of the parameters.
+
+    Returns
+    -------
+    uniform : dict
+        Maps the name of each parameter shared by all elements to its value.
+    varying : dict
+        Maps the name of each other parameter to its per-element values.
+    """
+
+    uniform = {}
+    varying = {}
+    for name in names:
+        values = np.asarray(n_dict[name], dtype=dtype)
+        if is_uniform(values):
+            uniform[name] = values.flat[0]
+        else:
+            varying[name] = values
+    return uniform, varying
+
+def set_param(obj, name, values, inds=None):
+    """
+    Overwrite a parameter of a neuron or synapse model instance in place.
+
+    The parameter is either a row of the packed block of the instance
+    (`obj.block`) or a GPUArray attribute holding one value per element.
+
+    Parameters
+    ----------
+    obj : object
+        Neuron or synapse model instance.
+    name : str
+        Name of the parameter.
+    values : numpy.ndarray or float
+        New values, either one per element in `inds` or a scalar.
+    inds : numpy.ndarray of int
+        Indices of the elements to change; defaults to all elements.
+    """
+
+    import pycuda.gpuarray as garray
+
+    block = getattr(obj, 'block', None)
+    if isinstance(block, PackedArrays) and name in block:
+        if inds is None:
+            block[name] = values
+        else:
+            row = block[name]
+            row[inds] = values
+            block[name] = row
+        return
+    array = getattr(obj, name, None)
+    if not isinstance(array, garray.GPUArray):
+        raise KeyError('%s is not a parameter of %s' % \
+                       (name, obj.__class__.__name__))
+    host = array.get()
+    if inds is None:
+        host[...] = values
+    else:
+        host[inds] = values
+    array.set(host)
+
+def get_param(obj, name):
+    """
+    Read a parameter of a neuron or synapse model instance.
+
+    See `set_param()`; returns a copy of the values of all elements.
+    """
+
+    import pycuda.gpuarray as garray
+
+    block = getattr(obj, 'block', None)
+    if isinstance(block, PackedArrays) and name in block:
+        return np.array(block[name])
+    array = getattr(obj, name, None)
+    if not isinstance(array, garray.GPUArray):
+        raise KeyError('%s is not a parameter of %s' % \
+                       (name, obj.__class__.__name__))
+    return array.get()
@@ -0,0 +1,161 @@
+"""
+Counter-based random numbers (Philox4x32-10).
+
+A counter-based generator computes each random number from a key and a
+counter alone, so no generator state has to be stored per thread or
+advanced between calls. Here the key is the seed of the simulation and the
+counter holds the id of a neuron and the index of an integration step; the
+numbers drawn for a neuron therefore do not depend on how the neurons are
+grouped into models or on the launch configuration of the kernels. The
+NumPy functions below and the CUDA functions in `cuda_src` produce the same
+numbers.
+
+See Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC 2011.
+
+Examples
+--------
+>>> normal(1234, np.arange(4), 0)
+array([1.22915526, 0.74336707, 1.65918002, 0.52783371])
+>>> normal(1234, [2], 0)
+array([1.65918002])
+"""
+
+import numpy as np
+
+# Round multipliers and key increments of Philox4x32:
+M0 = 0xD2511F53
+M1 = 0xCD9E8D57
+W0 = 0x9E3779B9
+W1 = 0xBB67AE85
+
+ROUNDS = 10
+
+def philox4x32(counter, key, rounds=ROUNDS):
+    """
+    Philox4x32 block function.
+
+    Parameters
+    ----------
+    counter : array_like of int
+        Counters, with shape `(..., 4)`.
+    key : array_like of int
+        Keys, with shape `(..., 2)`; broadcast against `counter`.
+    rounds : int
+        Number of rounds.
+
+    Returns
+    -------
+    x : numpy.ndarray of uint32
+        Random words, with shape `(..., 4)`.
+    """
+
+    c = np.asarray(counter, np.uint64) & 0xFFFFFFFF
+    k = np.asarray(key, np.uint64) & 0xFFFFFFFF
+    c0, c1, c2, c3 = c[..., 0], c[..., 1], c[..., 2], c[..., 3]
+    k0, k1 = k[..., 0], k[..., 1]
+    mask = np.uint64(0xFFFFFFFF)
+    shift = np.uint64(32)
+    for r in xrange(rounds):
+        if r > 0:
+            k0 = (k0 + np.uint64(W0)) & mask
+            k1 = (k1 + np.uint64(W1)) & mask
+        p0 = np.uint64(M0)*c0
+        p1 = np.uint64(M1)*c2
+        c0, c1, c2, c3 = (p1 >> shift) ^ c1 ^ k0, p1 & mask, \
+                         (p0 >> shift) ^ c3 ^ k1, p0 & mask
+    return np.stack(np.broadcast_arrays(c0, c1, c2, c3),
+                    axis=-1).astype(np.uint32)
+
+def _counter(ids, step):
+    ids = np.asarray(ids, np.uint64)
+    step = np.uint64(step)
+    counter = np.zeros(ids.shape + (4,), np.uint64)
+    counter[..., 0] = ids & np.uint64(0xFFFFFFFF)
+    counter[..., 1] = step & np.uint64(0xFFFFFFFF)
+    counter[..., 2] = step >> np.uint64(32)
+    return counter
+
+def _key(seed):
+    seed = np.uint64(seed)
+    return np.array([seed & np.uint64(0xFFFFFFFF), seed >> np.uint64(32)],
+                    np.uint64)
+
+def uniform(seed, ids, step):
+    """
+    Uniform random numbers in (0, 1) for some ids at one step.
+
+    Parameters
+    ----------
+    seed : int
+        Seed (64 bit).
+    ids : array_like of int
+        Ids of the streams, e.g. neuron ids (32 bit).
+    step : int
+        Index of the step (64 bit).
+
+    Returns
+    -------
+    u : numpy.ndarray of float64
+        One number per id.
+    """
+
+    x = philox4x32(_counter(ids, step), _key(seed))
+    return (x[..., 0] + 0.5)*2.0**-32
+
+def normal(seed, ids, step):
+    """
+    Standard normal random numbers for some ids at one step.
+
+    The numbers are obtained with the Box-Muller transform from the first
+    two words of the block; see `uniform()` for the parameters.
+    """
+
+    x = philox4x32(_counter(ids, step), _key(seed))
+    u1 = (x[..., 0] + 0.5)*2.0**-32
+    u2 = (x[..., 1] + 0.5)*2.0**-32
+    return np.sqrt(-2.0*np.log(u1))*np.cos(2*np.pi*u2)
+
+# CUDA implementation of philox4x32() and normal(); the products are
+# written with 64 bit integers rather than __umulhi() so that the same source
+# also compiles as C:
+cuda_src = """
+__device__ void philox4x32_10(unsigned int c[4], unsigned int k0,
+                              unsigned int k1)
+{
+    for(int r = 0; r < 10; ++r)
+    {
+        if(r > 0)
+        {
+            k0 += 0x9E3779B9u;
+            k1 += 0xBB67AE85u;
+        }
+        unsigned long long p0 = 0xD2511F53ull*c[0];
+        unsigned long long p1 = 0xCD9E8D57ull*c[2];
+        unsigned int c1 = c[1];
+        c[0] = (unsigned int)(p1 >> 32) ^ c1 ^ k0;
+        c[1] = (unsigned int)p1;
+        c[2] = (unsigned int)(p0 >> 32) ^ c[3] ^ k1;
+        c[3] = (unsigned int)p0;
+    }
+}
+
+__device__ double philox_uniform(unsigned long long seed, unsigned int id,
+                                 unsigned long long step)
+{
+    unsigned int c[4] = {id, (unsigned int)step, (unsigned int)(step >> 32),
+                         0};
+    philox4x32_10(c, (unsigned int)seed, (unsigned int)(seed >> 32));
+    return (c[0] + 0.5)*2.3283064365386963e-10;
+}
+
+__device__ double philox_normal(unsigned long long seed, unsigned int id,
+                                unsigned long long step)
+{
+    unsigned int c[4] = {id, (unsigned int)step, (unsigned int)(step >> 32),
+                         0};
+    philox4x32_10(c, (unsigned int)seed, (unsigned int)(seed >> 32));
+    double u1 = (c[0] + 0.5)*2.3283064365386963e-10;
+    double u2 = (c[1] + 0.5)*2.3283064365386963e-10;
+    return sqrt(-2.0*log(u1))*cos(6.283185307179586*u2);
+}
+"""
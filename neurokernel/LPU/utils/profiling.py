@@ -0,0 +1,199 @@
+"""
+Time and host memory used by the phases of LPU construction.
+
+A `Profile` records the phases of a computation, e.g. parsing the LPU
+specification, wiring the connectivity or compiling kernels, together with
+the wall time spent in each and the peak host memory of the process. Code
+that does not hold a reference to the profile, such as the neuron and
+synapse models, records its phases with the module-level `phase()`, which
+uses the innermost active profile and does nothing if there is none.
+
+Examples
+--------
+>>> profile = Profile()
+>>> with profile:
+...     n_dict, s_dict = LPU.lpu_parser('generic_lpu.gexf.gz')
+>>> lpu = LPU(dt, n_dict, s_dict, profile=profile)
+>>> lpu.pre_run()
+>>> profile.totals()['kernel compilation']['time']
+"""
+
+import collections
+import contextlib
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Phase(collections.namedtuple('Phase', ['name', 'label', 'time',
+                                             'peak_rss', 'peak_rss_increase'])):
+    """
+    Record of a phase.
+
+    Attributes
+    ----------
+    name : str
+        Name of the phase.
+    label : str
+        Further identification of the phase, e.g. a model name, or None.
+    time : float
+        Wall time spent in the phase (s), excluding nested phases.
+    peak_rss : int
+        Peak resident set size of the process at the end of the phase
+        (bytes).
+    peak_rss_increase : int
+        Increase of the peak resident set size during the phase (bytes).
+    """
+
+    __slots__ = ()
+
+# Profiles that are currently recording, innermost last:
+_active = []
+
+def peak_rss():
+    """
+    Peak resident set size of the process (bytes), or 0 if unknown.
+    """
+
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss*1024
+
+class Profile(object):
+    """
+    Phases of a computation with their wall time and peak host memory.
+
+    Phases are either delimited by `mark()`, which ends the current phase
+    and starts the next one, or nested in them with `phase()`; the time of a
+    nested phase is not counted in the enclosing phase. A profile records
+    the phases of the module-level `phase()` while a phase started with
+    `mark()` is open or while it is used as a context manager.
+
+    Attributes
+    ----------
+    phases : list of Phase
+        Completed phases in the order in which they ended.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self._stack = []
+        self._entered = 0
+
+    def __enter__(self):
+        self._entered += 1
+        if self not in _active:
+            _active.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._entered -= 1
+        self._deactivate()
+
+    def _deactivate(self):
+        if self in _active and not self._entered and not self._stack:
+            _active.remove(self)
+
+    def _start(self, name, label, marked=False):
+        if self not in _active:
+            _active.append(self)
+        self._stack.append([name, label, time.time(), 0.0, peak_rss(),
+                            marked])
+
+    def _stop(self):
+        name, label, start, nested, rss, marked = self._stack.pop()
+        elapsed = time.time()-start
+        if self._stack:
+            self._stack[-1][3] += elapsed
+        end_rss = peak_rss()
+        self.phases.append(Phase(name, label, elapsed-nested, end_rss,
+                                 end_rss-rss))
+        self._deactivate()
+
+    def mark(self, name, label=None):
+        """
+        End the current phase started by `mark()`, if any, and start the
+        phase `name`.
+        """
+
+        self.end()
+        self._start(name, label, True)
+
+    def end(self):
+        """
+        End the current phase started by `mark()`, if any.
+        """
+
+        if self._stack and self._stack[-1][5]:
+            self._stop()
+
+    @contextlib.contextmanager
+    def phase(self, name, label=None):
+        """
+        Context manager recording a nested phase.
+        """
+
+        self._start(name, label)
+        try:
+            yield
+        finally:
+            self._stop()
+
+    def totals(self):
+        """
+        Total time and peak host memory of the phases with each name.
+
+        Returns
+        -------
+        totals : dict of dict
+            Maps the name of each phase to a dict holding the number of
+            phases with that name (`'count'`), their total time (`'time'`),
+            the largest peak resident set size at their end (`'peak_rss'`)
+            and the total increase of the peak resident set size during them
+            (`'peak_rss_increase'`).
+        """
+
+        totals = collections.OrderedDict()
+        for p in self.phases:
+            t = totals.setdefault(p.name, {'count': 0, 'time': 0.0,
+                                           'peak_rss': 0,
+                                           'peak_rss_increase': 0})
+            t['count'] += 1
+            t['time'] += p.time
+            t['peak_rss'] = max(t['peak_rss'], p.peak_rss)
+            t['peak_rss_increase'] += p.peak_rss_increase
+        return totals
+
+    def report(self):
+        """
+        Table of the totals of the phases, slowest first.
+        """
+
+        totals = self.totals()
+        lines = ['%-24s %6s %10s %12s %12s' % ('phase', 'count', 'time (s)',
+                                               'peak (MiB)', 'grew (MiB)')]
+        for name in sorted(totals, key=lambda n: -totals[n]['time']):
+            t = totals[name]
+            lines.append('%-24s %6i %10.3f %12.1f %12.1f' % \
+                         (name, t['count'], t['time'], t['peak_rss']/2.0**20,
+                          t['peak_rss_increase']/2.0**20))
+        return '\n'.join(lines)
+
+@contextlib.contextmanager
+def _no_phase():
+    yield
+
+def phase(name, label=None):
+    """
+    Record a phase in the innermost active profile, if any.
+
+    Returns a context manager; see `Profile.phase`.
+    """
+
+    if _active:
+        return _active[-1].phase(name, label)
+    return _no_phase()
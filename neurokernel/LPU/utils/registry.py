@@ -0,0 +1,123 @@
+"""
+Registry of neuron and synapse models.
+
+Models are registered by name together with the location of the class that
+implements them, i.e. `'package.module:Class'`; the module is only imported
+when the model is first requested. Models provided by other packages can be
+registered with `register()` or advertised through setuptools entry points,
+e.g. in the `setup.py` of a package providing neuron models:
+
+    entry_points = {
+        'neurokernel.LPU.neurons': ['MyNeuron = mypackage.myneuron:MyNeuron']
+    }
+"""
+
+import importlib
+import inspect
+
+class ModelRegistry(object):
+    """
+    Maps model names to model classes, importing each class on demand.
+
+    Parameters
+    ----------
+    group : str
+        Name of the entry point group searched for models that are not
+        registered explicitly.
+    base : str
+        Location of the base class of the models, i.e. `'module:Class'`.
+        Subclasses of it that were defined elsewhere, e.g. in a script, are
+        found by name as well, provided they implement a model; see
+        `is_model()`.
+    models : dict
+        Maps the names of the models to the locations of their classes.
+    """
+
+    def __init__(self, group, base, models={}):
+        self.group = group
+        self.base = base
+        self._locations = dict(models)
+        self._classes = {}
+        self._entry_points = None
+
+    def register(self, name, cls):
+        """
+        Register a model.
+
+        Parameters
+        ----------
+        name : str
+            Name of the model as used in the LPU's model dictionaries.
+        cls : str or type
+            Model class, or its location `'module:Class'`.
+        """
+
+        self._classes.pop(name, None)
+        if isinstance(cls, basestring):
+            self._locations[name] = cls
+        else:
+            self._locations.pop(name, None)
+            self._classes[name] = cls
+
+    def names(self):
+        """
+        Names of the registered models, including those advertised through
+        entry points.
+        """
+
+        return sorted(set(self._locations) | set(self._classes) |
+                      set(self._load_entry_points()))
+
+    def __contains__(self, name):
+        return name in self.names()
+
+    def __getitem__(self, name):
+        """
+        Class of model `name`; raises KeyError if no such model exists.
+        """
+
+        if name in self._classes:
+            return self._classes[name]
+        if name in self._locations:
+            cls = _load(self._locations[name])
+        elif name in self._load_entry_points():
+            cls = self._entry_points[name].load()
+        else:
+            cls = self._find_subclass(name)
+        self._classes[name] = cls
+        return cls
+
+    def _load_entry_points(self):
+        if self._entry_points is None:
+            self._entry_points = {}
+            try:
+                import pkg_resources
+            except ImportError:
+                return self._entry_points
+            for ep in pkg_resources.iter_entry_points(self.group):
+                self._entry_points.setdefault(ep.name, ep)
+        return self._entry_points
+
+    def _find_subclass(self, name):
+        todo = [_load(self.base)]
+        while todo:
+            cls = todo.pop()
+            for sub in cls.__subclasses__():
+                if sub.__name__ == name and is_model(sub):
+                    return sub
+                todo.append(sub)
+        raise KeyError(name)
+
+def is_model(cls):
+    """
+    Whether `cls` implements a model rather than being a base class of
+    models, i.e. whether it has no abstract methods and, for models
+    generated from a `ModelSpec`, whether it sets `spec`.
+    """
+
+    return not inspect.isabstract(cls) and \
+        getattr(cls, 'spec', True) is not None
+
+def _load(location):
+    module, _, cls = location.partition(':')
+    return getattr(importlib.import_module(module), cls)
@@ -122,3 +122,179 @@ def read_array(filename):
     result = h5file['/array'][:]
     h5file.close()
     return result
+
+def write_tree(group, tree):
+    """
+    Write nested dictionaries of arrays and scalars to an HDF5 group.
+
+    Parameters
+    ----------
+    group : h5py.Group
+        Group (or file) to write to.
+    tree : dict
+        Dictionaries are stored as subgroups, arrays as datasets and
+        scalars (numbers, strings, booleans) as attributes of `group`.
+
+    See Also
+    --------
+    read_tree
+    """
+
+    for key, value in tree.iteritems():
+        if isinstance(value, dict):
+            write_tree(group.create_group(key), value)
+        elif isinstance(value, np.ndarray):
+            group.create_dataset(key, data=value)
+        else:
+            group.attrs[key] = value
+
+def read_tree(group):
+    """
+    Read nested dictionaries of arrays and scalars from an HDF5 group.
+
+    Parameters
+    ----------
+    group : h5py.Group
+        Group (or file) to read.
+
+    Returns
+    -------
+    tree : dict
+        Dictionaries, arrays and scalars stored with `write_tree`.
+
+    See Also
+    --------
+    write_tree
+    """
+
+    tree = {}
+    for key, value in group.attrs.iteritems():
+        tree[key] = value.item() if isinstance(value, np.generic) else value
+    for key, value in group.iteritems():
+        if isinstance(value, h5py.Group):
+            tree[key] = read_tree(value)
+        else:
+            tree[key] = value[...]
+    return tree
+
+class LazyArray(object):
+    """
+    Neuron-major view of time-major data stored in an HDF5 file.
+
+    Input and output files store one row per time step. This class exposes
+    such a dataset as a (neurons x steps) array without loading or
+    transposing it: indexing with `[neurons, steps]` reads only the requested
+    steps through h5py slicing. The steps are read in chunks of at least
+    `chunk` rows; the last chunk read is cached. Lists of neurons and steps
+    select their outer product, unlike NumPy's fancy indexing.
+
+    Parameters
+    ----------
+    filename : str
+        HDF5 file to read.
+    win : slice or list of int
+        Steps of the file to expose; defaults to all steps.
+    chunk : int
+        Minimum number of steps read at once.
+    dataset : str
+        Name of the dataset holding the data.
+
+    Attributes
+    ----------
+    shape : tuple of int
+        Number of neurons and number of steps in `win`.
+    """
+
+    def __init__(self, filename, win=None, chunk=1, dataset='/array'):
+        self.filename = filename
+        self._dataset_name = dataset
+        self.file = h5py.File(filename, 'r')
+        self.dataset = self.file[dataset]
+        num_steps, num_neurons = self.dataset.shape
+        if win is None:
+            win = slice(None)
+        if isinstance(win, slice):
+            self._win_slice = win.indices(num_steps)
+            self._win = None
+            length = len(xrange(*self._win_slice))
+        else:
+            self._win_slice = None
+            self._win = np.asarray(win, dtype=np.int64)
+            length = len(self._win)
+        self.shape = (num_neurons, length)
+        self.dtype = self.dataset.dtype
+        self.chunk = chunk
+        self._cache = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _file_steps(self, steps):
+        if self._win is not None:
+            return self._win[steps]
+        start, _, step = self._win_slice
+        return start + steps*step
+
+    def _read(self, lo, hi):
+        """
+        Return rows `lo` to `hi` of the dataset and the first row returned.
+        """
+
+        if self._cache is None or lo < self._cache[0] or hi > self._cache[1]:
+            stop = min(max(hi, lo + self.chunk), self.dataset.shape[0])
+            self._cache = (lo, stop, self.dataset[lo:stop])
+        return self._cache[2], self._cache[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        neurons, steps = key
+
+        scalar = isinstance(steps, (numbers.Integral, np.integer))
+        if scalar:
+            if steps < 0:
+                steps += self.shape[1]
+            if not 0 <= steps < self.shape[1]:
+                raise IndexError('step %i out of range' % steps)
+            steps = np.asarray([steps])
+        elif isinstance(steps, slice):
+            steps = np.arange(*steps.indices(self.shape[1]))
+        else:
+            steps = np.asarray(steps)
+            steps = np.where(steps < 0, steps + self.shape[1], steps)
+        if len(steps) == 0:
+            return np.empty((self.shape[0], 0), self.dtype)[neurons]
+
+        rows = self._file_steps(steps)
+        block, first = self._read(int(rows.min()), int(rows.max())+1)
+        data = block[rows-first]
+        if scalar:
+            return data[0][neurons]
+        return np.transpose(data[:, neurons])
+
+    def min_max(self, neurons, start=0):
+        """
+        Minimum and maximum of the given neurons from step `start` onwards,
+        computed one chunk at a time.
+        """
+
+        lo, hi = np.inf, -np.inf
+        chunk = max(self.chunk, 1024)
+        for t in xrange(start, self.shape[1], chunk):
+            d = self[neurons, t:min(t+chunk, self.shape[1])]
+            if d.size:
+                lo = min(lo, np.min(d))
+                hi = max(hi, np.max(d))
+        return lo, hi
+
+    def reopen(self):
+        """
+        Open the file again, e.g. in a process forked after opening it.
+        """
+
+        self.file = h5py.File(self.filename, 'r')
+        self.dataset = self.file[self._dataset_name]
+        self._cache = None
+
+    def close(self):
+        self.file.close()
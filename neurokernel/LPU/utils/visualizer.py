@@ -7,7 +7,10 @@ LPU output visualization.
 import collections
 from collections import OrderedDict
 import itertools
+import multiprocessing
 import os
+import subprocess
+from StringIO import StringIO
 
 import matplotlib
 from matplotlib import cm
@@ -16,9 +19,10 @@ import matplotlib.pyplot as plt
 plt.ioff() # interactive mode can interfere with frame updates
 from matplotlib.animation import FFMpegFileWriter, AVConvFileWriter
 from matplotlib.colors import hsv_to_rgb
+from mpl_toolkits.mplot3d import Axes3D # registers the 3d projection
 import networkx as nx
 import numpy as np
-from scipy.interpolate import griddata
+from scipy.spatial import cKDTree
 from shutilwhich import which
 
 import simpleio as sio
@@ -66,6 +70,10 @@ class visualizer(object):
         self._maxt = None
         self._title = None
         self._FFMpeg = None
+        self._processes = 1
+        self._history = 1
+        self._shown = False
+        self._animated = None
 
     def add_LPU(self, data_file, gexf_file=None, LPU=None, win=None,
                 is_input=False):
@@ -98,6 +106,12 @@ class visualizer(object):
                 V.add_plot({''type':'image',imlim':[-0.5,0.5]},LPU='input_vision)
         win: slice/list
             Can be used to limit the visualization to a specific time window.
+
+        Notes
+        -----
+        The data is not loaded into memory; the steps needed by each frame
+        are read from the file when the frame is drawn (see
+        `simpleio.LazyArray`).
         '''
 
         if gexf_file and not is_input:
@@ -116,9 +130,7 @@ class visualizer(object):
                 self._graph[LPU] = nx.read_gexf(gexf_file)
         if not LPU:
             LPU = len(self._data)
-        self._data[LPU] = np.transpose(sio.read_array(data_file))
-        if win is not None:
-            self._data[LPU] = self._data[LPU][:,win]
+        self._data[LPU] = sio.LazyArray(data_file, win)
         if self._maxt:
             self._maxt = min(self._maxt, self._data[LPU].shape[1])
         else:
@@ -147,11 +159,24 @@ class visualizer(object):
         If update_interval is set to 0 or None, it will be replaced by the
         index of the final time step. As a result, the visualizer will only
         generate the final frame.
+
+        If the property processes is greater than 1 and out_filename is set,
+        the frames are rendered by a pool of processes and piped in order
+        to a single ffmpeg or avconv process.
         '''
         self.final_frame_name = final_frame_name
+        if self._processes > 1 and self.out_filename and self._update_interval:
+            for data in self._data.itervalues():
+                data.chunk = self._update_interval
+            self._run_parallel(final_frame_name, dpi)
+            return
         self._initialize()
         if not self._update_interval:
             self._update_interval = self._maxt - 1
+
+        # Each frame reads the steps since the previous frame:
+        for data in self._data.itervalues():
+            data.chunk = self._update_interval
         self._t = self._update_interval + 1
         for _ in range(self._update_interval, 
                        self._maxt, self._update_interval):
@@ -161,6 +186,69 @@ class visualizer(object):
         if self.out_filename:
             self._close()
 
+    def _run_parallel(self, final_frame_name, dpi):
+        """
+        Render the frames in a process pool and encode them in order.
+
+        The frames are split into contiguous ranges, one per task. Each worker
+        process sets up its own figure once and renders the frames of its
+        tasks, which are handed out in order, so the plots that accumulate the
+        history of the data (single-neuron waveforms and rasters) only ever
+        need to be advanced.
+        """
+
+        num_frames = len(range(self._update_interval, self._maxt,
+                               self._update_interval)) + 1
+        num_tasks = min(num_frames, 4*self._processes)
+        tasks = [(list(frames), frames[-1] == num_frames-1 and final_frame_name,
+                  dpi) for frames in np.array_split(np.arange(num_frames),
+                                                    num_tasks)]
+
+        cmd = [self._writer_class().bin_path(), '-y',
+               '-f', 'image2pipe', '-vcodec', 'png', '-r', str(self.fps),
+               '-i', '-', '-vcodec', self.codec, self.out_filename]
+
+        # HDF5 files must not be open when the workers are forked; each
+        # worker opens them again:
+        for data in self._data.itervalues():
+            data.close()
+        pool = multiprocessing.Pool(self._processes, _init_render_worker,
+                                    (self,))
+        encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            for frames in pool.imap(_render_frames, tasks):
+                for frame in frames:
+                    encoder.stdin.write(frame)
+        finally:
+            pool.close()
+            pool.join()
+            encoder.stdin.close()
+            encoder.wait()
+            for data in self._data.itervalues():
+                data.reopen()
+        if encoder.returncode:
+            raise RuntimeError('%s exited with status %i' % \
+                               (cmd[0], encoder.returncode))
+
+    def _writer_class(self):
+        if self.FFMpeg is None:
+            if which(matplotlib.rcParams['animation.ffmpeg_path']):
+                return FFMpegFileWriter
+            elif which(matplotlib.rcParams['animation.avconv_path']):
+                return AVConvFileWriter
+            else:
+                raise RuntimeError('cannot find ffmpeg or avconv')
+        elif self.FFMpeg:
+            if which(matplotlib.rcParams['animation.ffmpeg_path']):
+                return FFMpegFileWriter
+            else:
+                raise RuntimeError('cannot find ffmpeg')
+        else:
+            if which(matplotlib.rcParams['animation.avconv_path']):
+                return AVConvFileWriter
+            else:
+                raise RuntimeError('cannot find avconv')
+
     def _set_wrapper(self, obj, name, value):
         name = name.lower()
         func = getattr(obj, 'set_'+name, None)
@@ -173,7 +261,7 @@ class visualizer(object):
                 except:
                     pass
 
-    def _initialize(self):
+    def _initialize(self, output=True):
 
         # Count number of plots to create:
         num_plots = 0
@@ -193,7 +281,9 @@ class visualizer(object):
         cnt = 0
         self.handles = []
         self.types = []
-        keywds = ['handle', 'ydata', 'fmt', 'type', 'ids', 'shape', 'norm']
+        keywds = ['handle', 'ydata', 'fmt', 'type', 'ids', 'shape', 'norm',
+                  'idx', 'rows', 'segments', 'num_segments', 'spikes',
+                  'nearest', 'surface', 'xdata']
         # TODO: Irregular grid in U will make the plot better
         U, V = np.mgrid[0:np.pi/2:complex(0, 60),
                         0:2*np.pi:complex(0, 60)]
@@ -290,20 +380,37 @@ class visualizer(object):
                     if len(config['ids'][0])==1:
                         config['handle'] = self.axarr[ind].plot([0], \
                                             [self._data[LPU][config['ids'][0][0],0]], fmt)[0]
-                        config['ydata'] = [self._data[LPU][config['ids'][0][0],0]]
+
+                        # The trace is filled in place as the frames advance:
+                        config['xdata'] = self._dt*np.arange(self._maxt)
+                        config['ydata'] = np.empty(self._maxt)
+                        config['ydata'][0] = self._data[LPU][config['ids'][0][0],0]
                     else:
                         config['handle'] = self.axarr[ind].plot(self._data[LPU][config['ids'][0],0])[0]
 
                 elif config['type'] == 4:
                     config['handle'] = self.axarr[ind]
-                    config['handle'].vlines(0, 0, 0.01)
+
+                    # Data indices of the neurons that produced output and
+                    # their rows in the plot:
+                    id_to_idx = self._id_to_data_idx.get(LPU, {})
+                    rows = [j+1 for j, id in enumerate(config['ids'][0])
+                            if id in id_to_idx]
+                    config['idx'] = [id_to_idx[id] for id in config['ids'][0]
+                                     if id in id_to_idx]
+                    config['rows'] = np.asarray(rows, np.double)
+
+                    # All spikes are drawn by a single line whose segments
+                    # are separated by NaNs; the first num_segments columns
+                    # of segments are used:
+                    config['segments'] = np.empty((2, 3*1024))
+                    config['num_segments'] = 0
+                    config['spikes'] = config['handle'].plot([], [], 'k-')[0]
                     config['handle'].set_ylim([.5, len(config['ids'][0]) + .5])
                     config['handle'].set_ylabel('Neurons',
                                                 fontsize=self._fontsize-1, weight='bold')
                     config['handle'].set_xlabel('Time (s)',fontsize=self._fontsize-1, weight='bold')
-                    min_id = min(self._id_to_data_idx[LPU].keys())
-                    min_idx = self._id_to_data_idx[LPU][min_id]
-                    config['handle'].set_xlim([0,len(self._data[LPU][min_idx,:])*self._dt])
+                    config['handle'].set_xlim([0,self._data[LPU].shape[1]*self._dt])
                     config['handle'].axes.set_yticks([])
                     config['handle'].axes.set_xticks([])
                 elif config['type'] == 6:
@@ -322,14 +429,10 @@ class visualizer(object):
                     if 'norm' not in config.keys():
                         config['norm'] = Normalize(vmin=-70, vmax=0, clip=True)
                     elif config['norm'] == 'auto':
-                        if self._data[LPU].shape[1] > 100:
-                            config['norm'] = Normalize(vmin = np.min(self._data[LPU][config['ids'][0],100:]),
-                                                       vmax = np.max(self._data[LPU][config['ids'][0],100:]),
-                                                       clip = True)
-                        else:
-                            config['norm'] = Normalize(vmin = np.min(self._data[LPU][config['ids'][0],:]),
-                                                       vmax = np.max(self._data[LPU][config['ids'][0],:]),
-                                                       clip = True)
+                        start = 100 if self._data[LPU].shape[1] > 100 else 0
+                        vmin, vmax = self._data[LPU].min_max(config['ids'][0], start)
+                        config['norm'] = Normalize(vmin=vmin, vmax=vmax,
+                                                   clip=True)
                             
                     node_dict = self._graph[LPU].node
                     if str(LPU).startswith('input'):
@@ -348,17 +451,15 @@ class visualizer(object):
                     yy = np.sin(longpositions) * np.sin(latpositions)
                     zz = np.cos(latpositions)
                     config['positions'] = (xx, yy, zz)
-                    colors = griddata(config['positions'], self._data[LPU][config['ids'][0],0],
-                                      self._dome_pos_flat, 'nearest').reshape(self._dome_arr_shape)
-                    colors = config['norm'](colors).data
-                    colors = np.tile(np.reshape(colors,
-                                                [self._dome_arr_shape[0],self._dome_arr_shape[1],1])
-                                     ,[1,1,4])
-                    colors[:,:,3] = 1.0
-                    config['handle'].plot_surface(self._dome_pos[0], self._dome_pos[1],
-                                                  self._dome_pos[2], rstride=1, cstride=1,
-                                                  facecolors=colors, antialiased=False,
-                                                  shade=False)
+
+                    # Index of the neuron nearest to each point of the dome:
+                    config['nearest'] = cKDTree(np.transpose(config['positions'])).query(
+                        np.transpose(self._dome_pos_flat))[1]
+                    colors = self._dome_colors(config, self._data[LPU][config['ids'][0],0])
+                    config['surface'] = config['handle'].plot_surface(
+                        self._dome_pos[0], self._dome_pos[1], self._dome_pos[2],
+                        rstride=1, cstride=1, facecolors=colors,
+                        antialiased=False, shade=False)
                     
                 for key in config.iterkeys():
                     if key not in keywds:
@@ -380,24 +481,10 @@ class visualizer(object):
 
         plt.tight_layout()
 
+        if not output:
+            return
         if self.out_filename and self.update_interval:
-            if self.FFMpeg is None:
-                if which(matplotlib.rcParams['animation.ffmpeg_path']):
-                    self.writer = FFMpegFileWriter(fps=self.fps, codec=self.codec)
-                elif which(matplotlib.rcParams['animation.avconv_path']):
-                    self.writer = AVConvFileWriter(fps=self.fps, codec=self.codec)
-                else:
-                    raise RuntimeError('cannot find ffmpeg or avconv')
-            elif self.FFMpeg:
-                if which(matplotlib.rcParams['animation.ffmpeg_path']):
-                    self.writer = FFMpegFileWriter(fps=self.fps, codec=self.codec)
-                else:
-                    raise RuntimeError('cannot find ffmpeg')
-            else:
-                if which(matplotlib.rcParams['animation.avconv_path']):
-                    self.writer = AVConvFileWriter(fps=self.fps, codec=self.codec)
-                else:
-                    raise RuntimeError('cannot find avconv')
+            self.writer = self._writer_class()(fps=self.fps, codec=self.codec)
 
             # Use the output file to determine the name of the temporary frame
             # files so that two concurrently run visualizations don't clobber
@@ -408,36 +495,100 @@ class visualizer(object):
             self.writer.grab_frame()
         elif not self.final_frame_name:
             self.f.show()
+            self._shown = True
+            self._setup_blit()
+
+    def _setup_blit(self):
+        """
+        Draw the parts of the figure that do not change between frames once.
+
+        Only the artists updated by each frame are then redrawn on top of
+        the saved background. This requires that all plots are waveform,
+        image or raster plots.
+        """
+
+        artists = []
+        for configs in self._config.itervalues():
+            for config in configs:
+                if config['type'] in (1, 2, 3):
+                    artists.append(config['handle'])
+                elif config['type'] == 4:
+                    artists.append(config['spikes'])
+                else:
+                    return
+        if not getattr(self.f.canvas, 'supports_blit', False):
+            return
+        for a in artists:
+            a.set_animated(True)
+        self.f.canvas.draw()
+        self._background = self.f.canvas.copy_from_bbox(self.f.bbox)
+        self._animated = artists
+
+    def _dome_colors(self, config, d):
+        """
+        Colors of the points of the dome of a dome plot showing data `d`.
+        """
+
+        colors = config['norm'](d[config['nearest']]).data
+        colors = np.tile(np.reshape(colors,
+                                    [self._dome_arr_shape[0],self._dome_arr_shape[1],1])
+                         ,[1,1,4])
+        colors[:,:,3] = 1.0
+        return colors
+
+    def _update_history(self, start, stop):
+        """
+        Add steps `start` to `stop` to the plots that show the whole history
+        of the data, i.e. single-neuron waveforms and rasters.
+        """
+
+        dt = self._dt
+        for key, configs in self._config.iteritems():
+            data = self._data[key]
+            for config in configs:
+                if config['type'] == 3 and len(config['ids'][0])==1:
+                    config['ydata'][start:stop] = data[config['ids'][0], start:stop]
+                elif config['type'] == 4 and config['idx']:
+                    rows, steps = np.nonzero(data[config['idx'], start:stop])
+                    n = config['num_segments']
+                    m = n + 3*len(steps)
+                    if m > config['segments'].shape[1]:
+                        segments = np.empty((2, 2*m))
+                        segments[:, :n] = config['segments'][:, :n]
+                        config['segments'] = segments
+                    segments = config['segments'][:, n:m].reshape((2, -1, 3))
+                    segments[0] = ((start+steps)*dt)[:, None]
+                    segments[1, :, 0] = config['rows'][rows]-0.25
+                    segments[1, :, 1] = config['rows'][rows]+0.25
+                    segments[:, :, 2] = np.nan
+                    config['num_segments'] = m
+                    config['spikes'].set_data(config['segments'][:, :m])
+        self._history = stop
+
+    def _seek(self, t):
+        """
+        Advance the history plots to the frame preceding the one at step `t`.
+        """
+
+        stop = t-self._update_interval
+        for start in xrange(self._history, stop, self._update_interval):
+            self._update_history(start, min(start+self._update_interval, stop))
 
     def _update(self):
         dt = self._dt
         t = self._t
+        self._update_history(max(0,t-self._update_interval), t)
         for key, configs in self._config.iteritems():
             data = self._data[key]
             for config in configs:
                 if config['type'] == 3:
                     if len(config['ids'][0])==1:
-                        config['ydata'].extend(np.reshape(np.double(\
-                                                                    data[config['ids'][0], \
-                                                                         max(0,t-self._update_interval):t]),(-1,)))
-                        config['handle'].set_xdata(dt*np.arange(0, t))
-                        config['handle'].set_ydata(np.asarray(config['ydata']))
+                        config['handle'].set_data(config['xdata'][:t],
+                                                  config['ydata'][:t])
                     else:
                         config['handle'].set_ydata(\
                                                    data[config['ids'][0], t])
 
-                elif config['type']==4:
-
-                    for j, id in enumerate(config['ids'][0]):
-
-                        # Convert neuron id to index into array of generated outputs:
-                        try:
-                            idx = self._id_to_data_idx[key][id]
-                        except:
-                            continue
-                        else:
-                            for time in np.where(data[idx, max(0,t-self._update_interval):t])[0]:
-                                config['handle'].vlines(float(t-time)*self._dt,j+0.75, j+1.25)
                 elif config['type'] == 0:
                     shape = config['shape']
                     ids = config['ids']
@@ -465,25 +616,20 @@ class visualizer(object):
                             np.reshape(data[ids[0], t], config['shape']))
                 elif config['type'] == 6:
                     ids = config['ids']
-                    d = data[ids[0], t]
-                    colors = griddata(config['positions'], d,
-                                      self._dome_pos_flat, 'nearest').reshape(self._dome_arr_shape)
-                    colors = config['norm'](colors).data
-                    colors = np.tile(np.reshape(colors,
-                                                [self._dome_arr_shape[0],self._dome_arr_shape[1],1])
-                                     ,[1,1,4])
-                    colors[:,:,3] = 1.0
-
-                    config['handle'].clear()
-                    config['handle'].xaxis.set_ticks([])
-                    config['handle'].yaxis.set_ticks([])
-                    config['handle'].zaxis.set_ticks([])
-                    
-                    config['handle'].plot_surface(self._dome_pos[0], self._dome_pos[1],
-                                                  self._dome_pos[2], rstride=1, cstride=1,
-                                                  facecolors=colors, antialiased=False,
-                                                  shade=False)
-                keywds = ['handle', 'ydata', 'fmt', 'type', 'ids', 'shape', 'norm']
+                    colors = self._dome_colors(config, data[ids[0], t])
+
+                    # The surface has one face per grid cell, colored by its
+                    # first corner; plot_surface colors the edges likewise:
+                    colors = colors[:-1, :-1].reshape((-1, 4))
+                    config['surface'].set_facecolor(colors)
+                    config['surface'].set_edgecolor(colors)
+
+                    # Axes3D.set_title lowers the title each time it is
+                    # called, as it is below:
+                    config['handle'].title.set_y(1.0)
+                keywds = ['handle', 'ydata', 'fmt', 'type', 'ids', 'shape', 'norm',
+                          'idx', 'rows', 'segments', 'num_segments', 'spikes',
+                          'nearest', 'surface', 'xdata']
                 for key in config.iterkeys():
                     if key not in keywds:
                         try:
@@ -495,7 +641,16 @@ class visualizer(object):
                             self._set_wrapper(config['handle'],key, config[key])
                         except:
                             pass
-        self.f.canvas.draw()
+        # Frames written to files are drawn when they are saved:
+        if self._animated is not None:
+            canvas = self.f.canvas
+            canvas.restore_region(self._background)
+            for a in self._animated:
+                a.axes.draw_artist(a)
+            canvas.blit(self.f.bbox)
+            canvas.flush_events()
+        elif self._shown:
+            self.f.canvas.draw()
         if self.out_filename:
             self.writer.grab_frame()
 
@@ -728,3 +883,45 @@ class visualizer(object):
     @update_interval.setter
     def update_interval(self, value):
         self._update_interval = value
+
+    @property
+    def processes(self):
+        """
+        Gets or sets the number of processes rendering the frames of a video.
+        """
+        return self._processes
+
+    @processes.setter
+    def processes(self, value):
+        assert(isinstance(value, int) and value > 0)
+        self._processes = value
+
+# Visualizer of each rendering process:
+_visualizer = None
+
+def _init_render_worker(visualizer):
+    global _visualizer
+
+    # Each worker draws into its own offscreen figure:
+    plt.switch_backend('agg')
+    visualizer._out_file = None
+    for data in visualizer._data.itervalues():
+        data.reopen()
+    visualizer._initialize(output=False)
+    _visualizer = visualizer
+
+def _render_frames(args):
+    frames, final_frame_name, dpi = args
+    v = _visualizer
+    result = []
+    for frame in frames:
+        if frame > 0:
+            v._t = frame*v._update_interval + 1
+            v._seek(v._t)
+            v._update()
+        buf = StringIO()
+        v.f.savefig(buf, format='png', dpi=80)
+        result.append(buf.getvalue())
+    if final_frame_name:
+        v.f.savefig(final_frame_name, dpi=dpi)
+    return result
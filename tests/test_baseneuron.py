@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+from collections import Counter
+from unittest import main, skipIf, TestCase
+
+import numpy as np
+
+try:
+    import pycuda.autoinit
+    import pycuda.gpuarray as garray
+except Exception:
+    garray = None
+
+if garray is not None:
+    from neurokernel.LPU.neurons.baseneuron import BaseNeuron
+
+    class InputNeuron(BaseNeuron):
+        def eval(self):
+            pass
+
+@skipIf(garray is None, 'requires a CUDA device')
+class test_update_I(TestCase):
+    def make_neuron(self, I_post, I_pre, cond_post=[], cond_pre=[],
+                    reverse=[], num_neurons=40):
+        n_dict = {'id': range(num_neurons),
+                  'I_pre': I_pre,
+                  'num_dendrites_I': Counter(I_post),
+                  'cond_pre': cond_pre,
+                  'num_dendrites_cond': Counter(cond_post),
+                  'reverse': reverse}
+        self.V = garray.to_gpu(np.linspace(-0.07, -0.05, num_neurons))
+        return InputNeuron(n_dict, int(self.V.gpudata), 1e-4, debug=False)
+
+    def test_non_cond_input_gathers_presynaptic_synapses(self):
+        # The synapses of each neuron are not stored contiguously in the
+        # synapse state array, so they must be read through I_pre:
+        np.random.seed(0)
+        num_synapses = 200
+        synapse = np.random.rand(num_synapses)
+        I_post = np.sort(np.random.randint(0, 40, 120))
+        I_pre = np.random.permutation(num_synapses)[:120].astype(np.int32)
+        neuron = self.make_neuron(I_post, I_pre)
+
+        synapse_state = garray.to_gpu(synapse)
+        neuron.update_I(synapse_state.gpudata)
+        expected = np.zeros(40)
+        np.add.at(expected, I_post, synapse[I_pre])
+        np.testing.assert_allclose(neuron.I.get(), expected)
+
+    def test_cond_input_gathers_presynaptic_synapses(self):
+        np.random.seed(1)
+        num_synapses = 200
+        synapse = np.random.rand(num_synapses)
+        cond_post = np.sort(np.random.randint(0, 40, 120))
+        cond_pre = np.random.permutation(num_synapses)[:120].astype(np.int32)
+        reverse = np.random.rand(120)*0.1-0.08
+        neuron = self.make_neuron([], [], cond_post, cond_pre, reverse)
+
+        synapse_state = garray.to_gpu(synapse)
+        neuron.update_I(synapse_state.gpudata)
+        V = self.V.get()
+        expected = np.zeros(40)
+        np.add.at(expected, cond_post,
+                  -synapse[cond_pre]*(V[cond_post]-reverse))
+        np.testing.assert_allclose(neuron.I.get(), expected)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+from unittest import main, skipIf, TestCase
+
+try:
+    import pycuda.autoinit
+    from neurokernel.LPU.LPU import LPU
+except Exception:
+    LPU = None
+
+class EmptyLPU(object):
+    neurons = []
+    synapses = []
+    dt = 1e-4
+
+@skipIf(LPU is None, 'requires a CUDA device')
+class test_set_state(TestCase):
+    def test_rejects_other_time_step(self):
+        state = {'dt': 2e-4, 'neurons': {}, 'synapses': {}}
+        self.assertRaises(ValueError, LPU._set_state.im_func, EmptyLPU(), state)
+
+if __name__ == '__main__':
+    main()
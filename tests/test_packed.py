@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from unittest import main, TestCase
+
+import numpy as np
+
+from neurokernel.LPU.utils.packed import PackedArrays
+
+class test_packed_arrays(TestCase):
+    def test_pitch_is_aligned(self):
+        for dtype in [np.float64, np.float32, np.int32]:
+            itemsize = np.dtype(dtype).itemsize
+            for num in [0, 1, 15, 16, 17, 31, 32, 33, 1000]:
+                ld = PackedArrays.pitch(num, dtype)
+                self.assertGreaterEqual(ld, max(num, 1))
+                self.assertEqual(ld*itemsize % PackedArrays.align, 0)
+                self.assertLess(ld - max(num, 1), PackedArrays.align//itemsize)
+
+    def test_block_nbytes_matches_allocation(self):
+        for num in [1, 16, 17, 100]:
+            p = PackedArrays(['a', 'b', 'c'], num)
+            self.assertEqual(p.data.shape, (3, p.ld))
+            self.assertEqual(p.nbytes, PackedArrays.block_nbytes(3, num))
+        self.assertEqual(PackedArrays([], 5).nbytes,
+                         PackedArrays.block_nbytes(0, 5))
+
+    def test_initial_values(self):
+        a = np.arange(20.0)
+        p = PackedArrays(['a', 'b', 'c'], 20, np.float64, {'a': a, 'b': 2.5})
+        np.testing.assert_array_equal(p['a'], a)
+        np.testing.assert_array_equal(p['b'], np.full(20, 2.5))
+        np.testing.assert_array_equal(p['c'], np.zeros(20))
+        self.assertEqual(p.row('c'), 2)
+        self.assertIn('b', p)
+        self.assertNotIn('d', p)
+
+    def test_rows_start_at_pitch(self):
+        p = PackedArrays(['a', 'b'], 20, np.float64,
+                         {'a': np.ones(20), 'b': np.arange(20.0)})
+        flat = p.data.ravel()
+        np.testing.assert_array_equal(flat[p.row('b')*p.ld:][:20],
+                                      np.arange(20.0))
+        # the padding of the rows is left untouched:
+        np.testing.assert_array_equal(p.data[:, 20:], 0)
+
+    def test_setitem_changes_one_row(self):
+        p = PackedArrays(['a', 'b'], 10, np.float64, {'a': 1.0, 'b': 2.0})
+        p['a'] = np.arange(10.0)
+        np.testing.assert_array_equal(p['a'], np.arange(10.0))
+        np.testing.assert_array_equal(p['b'], np.full(10, 2.0))
+
+    def test_get_set_round_trip(self):
+        np.random.seed(0)
+        p = PackedArrays(['a', 'b'], 10, np.float64,
+                         {'a': np.random.rand(10), 'b': np.random.rand(10)})
+        saved = p.get()
+        p['a'] = 0.0
+        p['b'] = np.arange(10.0)
+        p.set(saved)
+        np.testing.assert_array_equal(p.get(), saved)
+
+        # get() returns a copy:
+        saved[0, 0] = -1.0
+        self.assertNotEqual(p['a'][0], -1.0)
+
+if __name__ == '__main__':
+    main()
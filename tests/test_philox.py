@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+from unittest import main, TestCase
+
+import numpy as np
+
+from neurokernel.LPU.utils import philox
+from neurokernel.LPU.utils.modelspec import ModelSpec, NumPyModel
+
+class test_philox4x32(TestCase):
+    def test_known_answers(self):
+        # Known-answer vectors of Philox4x32-10 from Random123:
+        kat = [([0, 0, 0, 0], [0, 0],
+                [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8]),
+               ([0xffffffff]*4, [0xffffffff]*2,
+                [0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd]),
+               ([0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344],
+                [0xa4093822, 0x299f31d0],
+                [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1])]
+        for counter, key, expected in kat:
+            np.testing.assert_array_equal(philox.philox4x32(counter, key),
+                                          np.array(expected, np.uint32))
+
+    def test_broadcasts_key(self):
+        counters = np.array([[0, 0, 0, 0], [0xffffffff]*4])
+        x = philox.philox4x32(counters, [0, 0])
+        np.testing.assert_array_equal(x[0],
+                                      philox.philox4x32(counters[0], [0, 0]))
+        np.testing.assert_array_equal(x[1],
+                                      philox.philox4x32(counters[1], [0, 0]))
+
+    def test_uniform_range(self):
+        u = philox.uniform(5, np.arange(10000), 3)
+        self.assertTrue(np.all((u > 0) & (u < 1)))
+        self.assertAlmostEqual(u.mean(), 0.5, places=2)
+
+    def test_draws_depend_on_seed_id_and_step_only(self):
+        ids = np.array([0, 1, 7, 123456, 4294967295])
+        x = philox.normal(1234, ids, 5)
+        for i, nid in enumerate(ids):
+            self.assertEqual(philox.normal(1234, [nid], 5)[0], x[i])
+        np.testing.assert_array_equal(philox.normal(1234, ids[::-1], 5),
+                                      x[::-1])
+        self.assertFalse(np.any(philox.normal(1234, ids, 6) == x))
+        self.assertFalse(np.any(philox.normal(1235, ids, 5) == x))
+
+class test_noise(TestCase):
+    spec = ModelSpec('integrator', [('V', 'V')], ode=[('V', 'I')])
+
+    def make_model(self, ids, dt=1e-4, noise=1.0, seed=3):
+        n_dict = {'id': list(ids), 'V': [0.0]*len(ids),
+                  'noise': [noise]*len(ids)}
+        return NumPyModel(self.spec, n_dict, dt, seed)
+
+    def test_noise_does_not_depend_on_grouping(self):
+        # The noise of a neuron is the same whether it is simulated with all
+        # the others or in a model of its own:
+        ids = [4, 0, 17, 9, 2]
+        together = self.make_model(ids)
+        alone = [self.make_model([i]) for i in ids]
+        for _ in xrange(20):
+            together.eval()
+            for m in alone:
+                m.eval()
+        np.testing.assert_array_equal(together.states['V'],
+                                      [m.states['V'][0] for m in alone])
+
+    def test_noise_intensity_does_not_depend_on_dt(self):
+        T = 0.01
+        ids = np.arange(4000)
+        for dt in [1e-4, 2.5e-5]:
+            m = self.make_model(ids, dt)
+            for _ in xrange(int(round(T/dt))):
+                m.eval()
+            np.testing.assert_allclose(m.states['V'].std(), np.sqrt(T),
+                                       rtol=0.05)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+from abc import ABCMeta, abstractmethod
+from unittest import main, TestCase
+
+from neurokernel.LPU.utils.registry import ModelRegistry
+
+class Base(object):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def eval(self):
+        pass
+
+class Intermediate(Base):
+    def eval(self):
+        pass
+
+class SpecBase(Base):
+    spec = None
+
+    def eval(self):
+        pass
+
+class Leaf(Intermediate):
+    pass
+
+class SpecLeaf(SpecBase):
+    spec = 'spec'
+
+class test_model_registry(TestCase):
+    def setUp(self):
+        self.registry = ModelRegistry('neurokernel.test_models',
+                                      __name__ + ':Base')
+
+    def test_finds_leaf_models_by_name(self):
+        self.assertIs(self.registry['Leaf'], Leaf)
+        self.assertIs(self.registry['SpecLeaf'], SpecLeaf)
+
+    def test_skips_base_classes(self):
+        for name in ['Base', 'SpecBase']:
+            self.assertRaises(KeyError, self.registry.__getitem__, name)
+
+    def test_registered_models_take_precedence(self):
+        self.registry.register('Leaf', SpecLeaf)
+        self.assertIs(self.registry['Leaf'], SpecLeaf)
+        self.registry.register('Other', __name__ + ':Leaf')
+        self.assertIs(self.registry['Other'], Leaf)
+
+if __name__ == '__main__':
+    main()
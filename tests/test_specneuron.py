@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+from unittest import main, skipIf, TestCase
+
+import numpy as np
+
+try:
+    import pycuda.autoinit
+    import pycuda.gpuarray as garray
+except Exception:
+    garray = None
+
+if garray is not None:
+    from neurokernel.LPU.neurons.LeakyIAF import LeakyIAF
+
+@skipIf(garray is None, 'requires a CUDA device')
+class test_state(TestCase):
+    num = 6
+
+    def make_neuron(self, **params):
+        n_dict = {'id': range(self.num), 'V': [-0.06]*self.num,
+                  'Vr': [-0.07]*self.num, 'Vt': [-0.05]*self.num,
+                  'R': [1.0]*self.num, 'C': [0.1]*self.num,
+                  'I_pre': [], 'num_dendrites_I': {},
+                  'cond_pre': [], 'num_dendrites_cond': {}, 'reverse': []}
+        n_dict.update(params)
+        self.spk = garray.zeros(self.num, np.int32)
+        return LeakyIAF(n_dict, int(self.spk.gpudata), 1e-4)
+
+    def test_set_params_after_restore(self):
+        # Parameters changed after a state was saved must not leak into
+        # set_params() calls made after restoring it:
+        neuron = self.make_neuron()
+        state = neuron.get_state()
+        neuron.set_params({'R': np.arange(1.0, self.num+1)})
+        neuron.set_state(state)
+        neuron.set_params({'C': 0.2})
+
+        expected = self.make_neuron(C=[0.2]*self.num)
+        self.assertEqual(neuron.uniform, expected.uniform)
+        self.assertEqual(neuron.block.names, expected.block.names)
+        np.testing.assert_allclose(neuron.block.get(), expected.block.get())
+
+    def test_restore_moves_constants_back_into_block(self):
+        neuron = self.make_neuron(R=np.arange(1.0, self.num+1))
+        state = neuron.get_state()
+        neuron.set_params({'R': 1.0})
+        neuron.set_state(state)
+        self.assertEqual(neuron.uniform, state['uniform'])
+        np.testing.assert_array_equal(neuron.block.get(), state['block'])
+        np.testing.assert_array_equal(neuron.params['R'],
+                                      np.arange(1.0, self.num+1))
+
+if __name__ == '__main__':
+    main()
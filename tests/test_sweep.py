@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from unittest import main, TestCase
+
+import numpy as np
+
+from neurokernel.LPU import sweep
+
+class HostArray(np.ndarray):
+    def get(self):
+        return np.array(self)
+
+class ParamsLPU(object):
+    """
+    Stand-in for an LPU with graded potential neurons whose parameters, like
+    those of models that keep them in separate arrays, are not part of the
+    state saved by _get_state().
+    """
+
+    spike_state = None
+    reductions = []
+
+    def __init__(self, num=3, batch=1):
+        # Neuron i of trial b has id b*num+i and is at position b*num+i:
+        self.batch = batch
+        num *= batch
+        self.V = np.zeros(num).view(HostArray)
+        self.gpot_order_l = np.arange(num)
+        self.params = {'g': np.ones(num), 'h': np.zeros(num)}
+
+    def run_step(self):
+        self.V += self.params['g']*self.V + self.params['h'] + 1
+
+    def _get_state(self):
+        return {'V': self.V.get()}
+
+    def _set_state(self, state):
+        self.V[:] = state['V']
+
+    def get_params(self, model, attr):
+        return self.params[attr].copy()
+
+    def set_params(self, model, attr, values, ids=None):
+        if ids is None:
+            self.params[attr][:] = values
+        else:
+            self.params[attr][ids] = values
+
+class test_sweep(TestCase):
+    def setUp(self):
+        sweep._lpu = ParamsLPU()
+        sweep._initial_state = sweep._lpu._get_state()
+        sweep._ids = {'Model': [0, 1, 2]}
+        sweep._defaults = {}
+
+    def tearDown(self):
+        sweep._lpu = sweep._initial_state = None
+        sweep._ids = sweep._defaults = None
+
+    def run_configs(self, configs):
+        return [sweep._run_config((config, 5, None))['V_mean']
+                for config in configs]
+
+    def test_results_do_not_depend_on_order(self):
+        a = {'Model': {'g': 0.5}}
+        b = {'Model': {'h': [0.1, 0.2, 0.3]}}
+        ab = self.run_configs([a, b])
+        self.setUp()
+        ba = self.run_configs([b, a])
+        np.testing.assert_array_equal(ab[0], ba[1])
+        np.testing.assert_array_equal(ab[1], ba[0])
+
+    def test_parameters_are_reset(self):
+        self.run_configs([{'Model': {'g': 0.5, 'h': 0.1}}])
+        self.run_configs([{}])
+        np.testing.assert_array_equal(sweep._lpu.params['g'], np.ones(3))
+        np.testing.assert_array_equal(sweep._lpu.params['h'], np.zeros(3))
+
+    def test_batch_values_reach_all_trials(self):
+        configs = [{'Model': {'h': [0.1, 0.2, 0.3]}},
+                   {'Model': {'g': [0.5, 1.0, 2.0], 'h': 0.1}}]
+        single = self.run_configs(configs)
+        sweep._lpu = ParamsLPU(batch=2)
+        sweep._initial_state = sweep._lpu._get_state()
+        sweep._ids = {'Model': sweep._batch_ids([0, 1, 2], 2, 3)}
+        sweep._defaults = {}
+        for r, s in zip(self.run_configs(configs), single):
+            np.testing.assert_array_equal(r.reshape(2, -1), [s, s])
+
+if __name__ == '__main__':
+    main()